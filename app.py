@@ -1,5 +1,8 @@
 import streamlit as st
 import modulo as dm  
+import perf_metrics as perf
+import mem_report as mem
+import sql_backend
 
 # ---------------------------------------------------------
 # CONFIG STREAMLIT
@@ -9,21 +12,51 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="collapsed"
 )
+perf.nueva_ejecucion()
 
 # ---------------------------------------------------------
 # CACHING (aceleración extrema)
 # ---------------------------------------------------------
-@st.cache_data
-def get_static_fig(fig_function):
-    return fig_function()
-
-@st.cache_resource
-def get_intradia():
-    return dm.grafico_intradia()
-
+# Las curvas intradía / premarket se construyen en la primera visita que las pide y se
+# cachean por versión del snapshot: un refresco de datos las invalida
+# (_snap no se hashea; max_entries=2 deja la versión anterior mientras alguien la use)
+@st.cache_resource(max_entries=2)
+def get_intradia(version, _snap):
+    perf.marcar_miss()
+    fig = dm.grafico_intradia(_snap)
+    mem.registrar("app.get_intradia", fig, tipo="cache")
+    return fig
+
+@st.cache_resource(max_entries=2)
+def get_premarket(version, _snap):
+    perf.marcar_miss()
+    fig = dm.grafico_premarket(_snap)
+    mem.registrar("app.get_premarket", fig, tipo="cache")
+    return fig
+
+# Un hilo por proceso comprueba las fuentes y publica snapshots nuevos sin bloquear reruns
 @st.cache_resource
-def get_premarket():
-    return dm.grafico_premarket()
+def iniciar_refresco():
+    return dm.iniciar_refresco()
+
+def cacheado(nombre, fn, *args):
+    """Llama a una función st.cache_* registrando hit/miss en perf_metrics."""
+    with perf.medir(nombre, tipo="cache", cacheado=True):
+        return fn(*args)
+
+def plotly_chart(fig, **kwargs):
+    """st.plotly_chart midiendo la serialización y envío de la figura."""
+    nombre = kwargs.get("key") or fig.layout.title.text or "figura"
+    with perf.medir(f"render {nombre}", tipo="render"):
+        st.plotly_chart(fig, **kwargs)
+
+iniciar_refresco()
+# Con arranque asíncrono (SMALLCAPS_ARRANQUE_ASINCRONO=1) la primera visita espera a la carga
+if not dm.listo.is_set():
+    with st.spinner("Cargando datos…"):
+        dm.listo.wait()
+# Todo el rerun usa el mismo snapshot (aunque se publique otro a mitad)
+snap = dm.snapshot()
 
 # ---------------------------------------------------------
 # TÍTULO
@@ -37,10 +70,19 @@ st.markdown("---")
 col1, col2 = st.columns([1.4, 1])
 
 with col1:
-    st.plotly_chart(dm.fig_3, use_container_width=True)
+    # Filtro sobre las dimensiones del cubo: medianas desde sketches fusionados (cuantiles.py)
+    with st.expander("Filtrar tabla"):
+        f1, f2, f3 = st.columns(3)
+        filtro_tabla = {
+            "year": f1.multiselect("Año", sorted(snap.cubo.celdas["year"].unique().tolist())),
+            "precio": f2.multiselect("Precio", dm.Cubo.etiquetas("precio")),
+            "gap": f3.multiselect("Gap", dm.Cubo.etiquetas("gap")),
+        }
+    filtro_tabla = {k: v for k, v in filtro_tabla.items() if v}
+    plotly_chart(dm.grafico_tabla_resumen(snap, filtro_tabla), use_container_width=True)
 
 with col2:
-    st.plotly_chart(dm.fig_2, use_container_width=True)
+    plotly_chart(snap.fig_2, use_container_width=True)
 
 st.markdown("---")
 
@@ -48,10 +90,13 @@ st.markdown("---")
 # GAPS / MES + RETURN — Selector funcional
 # ---------------------------------------------------------
 
+# Bigotes del IC bootstrap 95 % (precalculados en el snapshot: bootstrap.py)
+ic = st.checkbox("Intervalos de confianza 95 % (mensual)", key="ic_mensual")
+
 col_left, col_right = st.columns([1.2, 2])
 
 with col_left:
-    st.plotly_chart(dm.fig_4, use_container_width=True)
+    plotly_chart(dm.grafico_return_mes(snap, ic=ic), use_container_width=True)
 
 with col_right:
 
@@ -76,28 +121,32 @@ with col_right:
         )
         metric = opciones[metric_label]
 
+        # Granularidad: cada nivel sale ya agregado del snapshot (serie_temporal.py)
+        granularidades = {"Mes": "M", "Semana": "W", "Día": "D", "Trimestre": "Q"}
+        gran = granularidades[st.selectbox("", list(granularidades.keys()), key="selector_granularidad")]
+
     with s_right:
 
         if metric == "stocks":
-            fig_mes = dm.grafico_gappers()
+            fig_mes = dm.grafico_gappers(snap, granularidad=gran)
         elif metric == "volume":
-            fig_mes = dm.grafico_volumen()
+            fig_mes = dm.grafico_volumen(snap, granularidad=gran)
         elif metric == "gap":
-            fig_mes = dm.grafico_gap()
+            fig_mes = dm.grafico_gap(snap, granularidad=gran, ic=ic)
         elif metric == "highspike":
-            fig_mes = dm.grafico_highspike()
+            fig_mes = dm.grafico_highspike(snap, granularidad=gran, ic=ic)
         elif metric == "lowspike":
-            fig_mes = dm.grafico_lowspike()
+            fig_mes = dm.grafico_lowspike(snap, granularidad=gran, ic=ic)
         elif metric == "range":
-            fig_mes = dm.grafico_range()
+            fig_mes = dm.grafico_range(snap, granularidad=gran, ic=ic)
         elif metric == "closered":
-            fig_mes = dm.grafico_closered()
+            fig_mes = dm.grafico_closered(snap, granularidad=gran, ic=ic)
         elif metric == "rth_fade_close":
-            fig_mes = dm.grafico_rth_fade_to_close_mes()
+            fig_mes = dm.grafico_rth_fade_to_close_mes(snap, granularidad=gran, ic=ic)
         else:
-            fig_mes = dm.grafico_gappers()
+            fig_mes = dm.grafico_gappers(snap, granularidad=gran)
 
-        st.plotly_chart(fig_mes, use_container_width=True)
+        plotly_chart(fig_mes, use_container_width=True)
 
 st.markdown("---")
 
@@ -109,30 +158,30 @@ c1, c2, c3 = st.columns(3)
 
 with c1:
     tipo = st.selectbox("Distribución Spike:", ["High Spike", "Low Spike"])
-    fig = dm.grafico_highspike_distribution() if tipo == "High Spike" else dm.grafico_lowspike_distribution()
-    st.plotly_chart(fig, use_container_width=True)
+    fig = dm.grafico_highspike_distribution(snap) if tipo == "High Spike" else dm.grafico_lowspike_distribution(snap)
+    plotly_chart(fig, use_container_width=True)
 
 with c2:
     tipo = st.selectbox("Distribución Horaria:", ["LOD Time", "HOD Time"])
-    fig = dm.grafico_lod_distribution() if tipo == "LOD Time" else dm.grafico_hod_distribution()
-    st.plotly_chart(fig, use_container_width=True)
+    fig = dm.grafico_lod_distribution(snap) if tipo == "LOD Time" else dm.grafico_hod_distribution(snap)
+    plotly_chart(fig, use_container_width=True)
 
 with c3:
     tipo = st.selectbox("Return/Gap/Fade Distribución:", ["Return", "Gap Size", "Fade"])
     if tipo == "Return":
-        fig = dm.grafico_return_distribution()
+        fig = dm.grafico_return_distribution(snap)
     elif tipo == "Gap Size":
-        fig = dm.grafico_gap_size_distribution()
+        fig = dm.grafico_gap_size_distribution(snap)
     else:
-        fig = dm.grafico_fade_distribution()
-    st.plotly_chart(fig, use_container_width=True)
+        fig = dm.grafico_fade_distribution(snap)
+    plotly_chart(fig, use_container_width=True)
 
 st.markdown("---")
 
 # ---------------------------------------------------------
 # INTRADÍA
 # ---------------------------------------------------------
-st.plotly_chart(get_intradia(), use_container_width=True)
+plotly_chart(cacheado("get_intradia", get_intradia, snap.version, snap), use_container_width=True)
 
 st.markdown("---")
 
@@ -144,23 +193,51 @@ c1, c2, c3 = st.columns(3)
 
 with c1:
     opt = st.selectbox("Multi-Timeframe:", ["Returns", "High Spike", "Low Spike"])
+    # Media / mediana / percentiles: misma reducción cacheada para todos los paneles (multiframe.py)
+    est = st.selectbox("Estadístico:", ["media", "mediana", "p10", "p25", "p75", "p90"], key="multiframe_est")
     if opt == "Returns":
-        fig = dm.grafico_multiframe_returns()
+        fig = dm.grafico_multiframe_returns(snap, est)
     elif opt == "High Spike":
-        fig = dm.grafico_multiframe_highspike()
+        fig = dm.grafico_multiframe_highspike(snap, est)
     else:
-        fig = dm.grafico_multiframe_lowspike()
-    st.plotly_chart(fig, use_container_width=True)
+        fig = dm.grafico_multiframe_lowspike(snap, est)
+    plotly_chart(fig, use_container_width=True)
 
 with c2:
     opt = st.selectbox("Price range/Gaps by year:", ["Price Range", "Gaps by Year"])
-    fig = dm.grafico_price_range_distribution() if opt == "Price Range" else dm.grafico_gaps_por_ano()
-    st.plotly_chart(fig, use_container_width=True)
+    fig = dm.grafico_price_range_distribution(snap) if opt == "Price Range" else dm.grafico_gaps_por_ano(snap)
+    plotly_chart(fig, use_container_width=True)
 
 with c3:
     opt = st.selectbox("Return from TF to close/VWAP Distance:", ["Return from TF to close", "VWAP Distance"])
-    fig = dm.grafico_multiframe_return_to_close() if opt == "Return from TF to close" else dm.grafico_multiframe_vwap_distance()
-    st.plotly_chart(fig, use_container_width=True)
+    fig = dm.grafico_multiframe_return_to_close(snap, est) if opt == "Return from TF to close" else dm.grafico_multiframe_vwap_distance(snap, est)
+    plotly_chart(fig, use_container_width=True)
+
+st.markdown("---")
+
+# ---------------------------------------------------------
+# CORRELACIONES (momentos por celda del cubo: cualquier filtro sin recorrer filas)
+# ---------------------------------------------------------
+f1, f2, f3 = st.columns(3)
+filtro_corr = {
+    "year": f1.multiselect("Año", sorted(snap.cubo.celdas["year"].unique().tolist()), key="corr_year"),
+    "precio": f2.multiselect("Precio", dm.Cubo.etiquetas("precio"), key="corr_precio"),
+    "gap": f3.multiselect("Gap", dm.Cubo.etiquetas("gap"), key="corr_gap"),
+}
+filtro_corr = {k: v for k, v in filtro_corr.items() if v}
+
+c1, c2 = st.columns([1, 1.2])
+
+with c1:
+    plotly_chart(dm.grafico_correlacion(snap, filtro_corr), use_container_width=True, key="correlacion_chart")
+
+with c2:
+    s_left, s_right = st.columns(2)
+    metricas = {etiqueta: nombre for nombre, (_, _, etiqueta) in dm.METRICAS_MOMENTOS.items()}
+    metrica = metricas[s_left.selectbox("Métrica:", list(metricas), index=len(metricas) - 1, key="cond_metrica")]
+    por = {"Gap": "gap", "Precio": "precio", "PM High Time": "pmh", "Año": "year", "Mes": "month"}[
+        s_right.selectbox("Por:", ["Gap", "Precio", "PM High Time", "Año", "Mes"], key="cond_por")]
+    plotly_chart(dm.grafico_condicional(snap, metrica, por, filtro_corr), use_container_width=True, key="condicional_chart")
 
 st.markdown("---")
 
@@ -175,24 +252,113 @@ c1, c2 = st.columns([1, 2])
 with c1:
     tipo = st.selectbox("Distribución Pre-Market:", ["PM High Time", "PMH Gap", "PMH Fade"])
     if tipo == "PM High Time":
-        fig = dm.grafico_pm_high_distribution(dm.stocks_filtrados)
+        fig = dm.grafico_pm_high_distribution(snap.stocks_filtrados, s=snap)
     elif tipo == "PMH Gap":
-        fig = dm.grafico_pmh_gap_distribution()
+        fig = dm.grafico_pmh_gap_distribution(snap)
     else:
-        fig = dm.grafico_pmh_fade_distribution()
-    st.plotly_chart(fig, use_container_width=True)
+        fig = dm.grafico_pmh_fade_distribution(snap)
+    plotly_chart(fig, use_container_width=True)
 
 with c2:
     tipo = st.selectbox("Métricas Pre-Market:", ["PMH Gap Value", "Fade %", "Volume", "Fade PM >15%"])
     if tipo == "PMH Gap Value":
-        fig = dm.grafico_pmh_gap_value()
+        fig = dm.grafico_pmh_gap_value(snap)
     elif tipo == "Fade %":
-        fig = dm.grafico_pmh_fade_value()
+        fig = dm.grafico_pmh_fade_value(snap)
     elif tipo == "Volume":
-        fig = dm.grafico_pmh_volume_mes()
+        fig = dm.grafico_pmh_volume_mes(snap)
     else:
-        fig = dm.crear_grafico_retornos_stack()
-    st.plotly_chart(fig, use_container_width=True)
+        fig = dm.crear_grafico_retornos_stack(snap)
+    plotly_chart(fig, use_container_width=True)
+
 
+plotly_chart(cacheado("get_premarket", get_premarket, snap.version, snap), use_container_width=True, key="premarket_chart")
 
-st.plotly_chart(get_premarket(), use_container_width=True, key="premarket_chart")
\ No newline at end of file
+st.markdown("---")
+
+# ---------------------------------------------------------
+# BACKTEST GAP FADE (corto; barridos de parámetros: python backtest.py)
+# ---------------------------------------------------------
+with st.expander("Backtest gap fade"):
+    horas = [dm.backtest.hora(i) for i in range(dm.backtest.slot("09:30"), dm.backtest.SLOTS)]
+    c1, c2, c3, c4, c5 = st.columns(5)
+    entrada = c1.selectbox("Entrada", horas[:-1], index=1, key="bt_entrada")
+    vwap = {"Bajo VWAP": "debajo", "Sobre VWAP": "encima", "Sin condición": None}[
+        c2.selectbox("Condición", ["Bajo VWAP", "Sobre VWAP", "Sin condición"], key="bt_vwap")]
+    stops = {"PMH": "pmh", "3 %": 3, "5 %": 5, "10 %": 10, "20 %": 20, "Sin stop": None}
+    stop = stops[c3.selectbox("Stop", list(stops), key="bt_stop")]
+    objetivo = c4.number_input("Objetivo % (0 = sin)", min_value=0.0, max_value=100.0, value=0.0, step=5.0, key="bt_objetivo")
+    salidas = [h for h in horas if h > entrada]
+    salida = c5.selectbox("Salida", salidas, index=len(salidas) - 1, key="bt_salida")
+    regla = {"entrada": entrada, "vwap": vwap, "stop": stop,
+             "objetivo": objetivo or None, "salida": salida}
+    plotly_chart(dm.grafico_backtest_mensual(snap, regla), use_container_width=True, key="backtest_chart")
+
+# ---------------------------------------------------------
+# SESIONES PARECIDAS (forma premarket + primeros minutos)
+# ---------------------------------------------------------
+with st.expander("Sesiones parecidas"):
+    c1, c2, c3, c4 = st.columns(4)
+    ticker = c1.selectbox("Ticker", list(snap.indice_tickers.tickers), key="sim_ticker")
+    fechas = list(dm.historial_ticker(snap, ticker)["Date"].dt.date)
+    fecha = c2.selectbox("Fecha", fechas, key="sim_fecha")
+    hasta = c3.selectbox("Forma hasta", ["09:45", "10:00", "10:30", "11:00"], index=1, key="sim_hasta")
+    k = c4.slider("Vecinos", 5, 50, 20, key="sim_k")
+    try:
+        plotly_chart(dm.grafico_similares(snap, ticker, fecha, k=k, hasta=hasta), use_container_width=True, key="similares_chart")
+    except KeyError:
+        st.caption(f"{ticker} {fecha}: sin velas de 15 min suficientes para comparar")
+
+# ---------------------------------------------------------
+# TICKER (historial completo de un nombre desde el índice por ticker)
+# ---------------------------------------------------------
+with st.expander("Ticker"):
+    ticker = st.selectbox("Ticker", list(snap.indice_tickers.tickers), key="drill_ticker")
+    r = dm.resumen_ticker(snap, ticker)
+    st.caption(f"{r['gaps']} gaps ({r['desde']:%Y-%m-%d} → {r['hasta']:%Y-%m-%d}) · gap medio {r['gap']:.1f} % · "
+               f"PMH gap {r['pmh_gap']:.1f} % · high spike {r['high_spike']:.1f} % · low spike {r['low_spike']:.1f} % · "
+               f"return {r['return']:.1f} % · close red {r['close_red']:.0f} %")
+    st.dataframe(dm.historial_ticker(snap, ticker), use_container_width=True)
+    plotly_chart(dm.grafico_ticker_intradia(snap, ticker), use_container_width=True, key="ticker_chart")
+
+# ---------------------------------------------------------
+# CONSULTAS SQL (oculto: añadir ?sql=1 a la URL)
+# ---------------------------------------------------------
+if st.query_params.get("sql") == "1":
+    db = sql_backend.para_snapshot(snap)
+    with st.expander(f"Consultas ({db.motor})", expanded=True):
+        c1, c2, c3 = st.columns([2, 1, 1])
+        nombre = c1.selectbox("Consulta", list(sql_backend.CONSULTAS))
+        desde = c2.date_input("Desde", value=snap.stocks_filtrados["Date"].min())
+        hasta = c3.date_input("Hasta", value=snap.stocks_filtrados["Date"].max())
+        st.dataframe(db.consultar(nombre, desde=str(desde), hasta=str(hasta)), use_container_width=True)
+
+        st.caption("Agrupación libre sobre gaps")
+        columnas = db.columnas("gaps")
+        c1, c2, c3 = st.columns([2, 2, 1])
+        por = c1.multiselect("Agrupar por", columnas, default=["Period"])
+        metrica = c2.selectbox("Métrica", ["*"] + columnas, index=0)
+        # Sobre "*" (filas) solo tiene sentido contar
+        fn = c3.selectbox("Función", ["count"] if metrica == "*" else list(sql_backend.AGREGADOS), index=0)
+        st.dataframe(db.agrupar("gaps", por, {metrica: fn}), use_container_width=True)
+
+# ---------------------------------------------------------
+# RENDIMIENTO (oculto: añadir ?perf=1 a la URL)
+# ---------------------------------------------------------
+if st.query_params.get("perf") == "1":
+    run = perf.ejecucion_actual()
+    with st.expander("Rendimiento", expanded=True):
+        eventos = perf.eventos(run)
+        st.caption(f"Ejecución {run} (datos versión {snap.version}): {eventos['s'].sum():.2f}s en {len(eventos)} operaciones medidas")
+        st.dataframe(eventos.sort_values("s", ascending=False), use_container_width=True)
+        st.caption("Percentiles móviles (incluye la carga inicial del módulo, ejecución 0)")
+        st.dataframe(perf.resumen(), use_container_width=True)
+        a = snap.arranque
+        st.caption(f"Construcción del snapshot: {a['pared_s']}s (suma de nodos {a['suma_nodos_s']}s), "
+                   f"ruta crítica {a['ruta_critica_s']}s: {' → '.join(a['ruta_critica'])}")
+
+        memoria = mem.informe()
+        tot = mem.totales(memoria)
+        st.caption(f"Memoria: RSS {tot['rss_mb']} MB, registrado {tot['registrado_mb']} MB, "
+                   f"sin contabilizar {tot['sin_contabilizar_mb']} MB")
+        st.dataframe(memoria, use_container_width=True)
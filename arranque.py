@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# arranque.py
+# Planificador del arranque: grafo de dependencias datasets -> agregados ->
+# figuras que ejecuta cada nodo en cuanto terminan los suyos, con los
+# independientes en paralelo en un pool de hilos. El arranque tiende así a la
+# ruta crítica del grafo en vez de a la suma de todos los nodos:
+#
+#   g = Grafo("snapshot")
+#   g.nodo("stocks", normalizar, "crudo")
+#   g.nodo("monthly_counts", calcular_monthly_counts, "stocks")
+#   r = g.ejecutar(crudo=df)          # {"crudo": df, "stocks": ..., "monthly_counts": ...}
+#   g.ruta_critica()                  # (["crudo", "stocks", ...], segundos)
+#
+# Hilos y no procesos: los nodos comparten DataFrames grandes (pasarlos a otro
+# proceso costaría serializarlos). Solo se gana con la E/S de las descargas y con
+# varios núcleos; el código pandas por filas no suelta el GIL, así que el pool
+# no pasa de os.cpu_count() hilos y con 1 CPU se ejecuta en serie.
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import perf_metrics as perf
+
+# Hilos del pool (uno por núcleo: más hilos que núcleos solo añaden contención del GIL)
+WORKERS = int(os.environ.get("SMALLCAPS_ARRANQUE_WORKERS", os.cpu_count() or 1))
+
+
+class Grafo:
+    """Nodos nombre -> fn(*resultados de sus dependencias). Un Grafo se ejecuta una vez."""
+
+    def __init__(self, nombre: str = "arranque"):
+        self.nombre = nombre
+        self._nodos = {}     # nombre -> (fn, deps)
+        self.tiempos = {}    # nombre -> (inicio, fin) en perf_counter
+        self.listo = threading.Event()
+
+    def nodo(self, nombre: str, fn, *deps):
+        if nombre in self._nodos:
+            raise ValueError(f"nodo repetido: {nombre}")
+        self._nodos[nombre] = (fn, deps)
+        return self
+
+    def _validar(self, entradas):
+        conocidos = set(self._nodos) | set(entradas)
+        for nombre, (_, deps) in self._nodos.items():
+            faltan = [d for d in deps if d not in conocidos]
+            if faltan:
+                raise KeyError(f"{nombre}: dependencias desconocidas {faltan}")
+        # Ciclos: Kahn sobre los nodos (las entradas ya están resueltas)
+        pendientes = {n: sum(d in self._nodos for d in deps) for n, (_, deps) in self._nodos.items()}
+        cola = [n for n, k in pendientes.items() if k == 0]
+        vistos = 0
+        while cola:
+            hecho = cola.pop()
+            vistos += 1
+            for n, (_, deps) in self._nodos.items():
+                if hecho in deps:
+                    pendientes[n] -= deps.count(hecho)
+                    if pendientes[n] == 0:
+                        cola.append(n)
+        if vistos != len(self._nodos):
+            raise ValueError(f"{self.nombre}: el grafo tiene ciclos")
+
+    def _correr(self, nombre, fn, args):
+        t0 = time.perf_counter()
+        with perf.medir(f"{self.nombre}:{nombre}", tipo="arranque") as m:
+            out = fn(*args)
+            m["filas"] = perf.filas(out)
+        self.tiempos[nombre] = (t0, time.perf_counter())
+        return out
+
+    def ejecutar(self, workers: int = None, **entradas) -> dict:
+        """Ejecuta todos los nodos y devuelve entradas + resultados por nombre.
+
+        Si un nodo falla no se lanza nada nuevo, se espera a los que están en
+        marcha y se relanza su excepción (con una nota del nodo que falló).
+        """
+        self._validar(entradas)
+        resultados = dict(entradas)
+        faltan = {n: set(d for d in deps if d in self._nodos) for n, (_, deps) in self._nodos.items()}
+        en_marcha = {}
+        t0 = time.perf_counter()
+        for nombre in entradas:
+            self.tiempos[nombre] = (t0, t0)
+
+        with ThreadPoolExecutor(max_workers=workers or WORKERS, thread_name_prefix=f"{self.nombre}") as pool:
+            def lanzar():
+                for nombre in [n for n, d in faltan.items() if not d]:
+                    fn, deps = self._nodos[nombre]
+                    del faltan[nombre]
+                    futuro = pool.submit(self._correr, nombre, fn, [resultados[d] for d in deps])
+                    en_marcha[futuro] = nombre
+
+            lanzar()
+            error = None
+            while en_marcha:
+                hechos, _ = wait(en_marcha, return_when=FIRST_COMPLETED)
+                for futuro in hechos:
+                    nombre = en_marcha.pop(futuro)
+                    if futuro.exception() is not None:
+                        if error is None:
+                            error = futuro.exception()
+                            error.add_note(f"{self.nombre}: falló el nodo {nombre!r}")
+                        continue
+                    resultados[nombre] = futuro.result()
+                    for deps in faltan.values():
+                        deps.discard(nombre)
+                if error is None:
+                    lanzar()
+            if error is not None:
+                raise error
+
+        self.listo.set()
+        return resultados
+
+    def ruta_critica(self) -> tuple:
+        """(nodos de la cadena de dependencias más lenta, segundos que suma)."""
+        mejor = {}  # nombre -> (segundos acumulados, camino)
+
+        def costo(nombre):
+            if nombre not in mejor:
+                ini, fin = self.tiempos.get(nombre, (0.0, 0.0))
+                deps = self._nodos.get(nombre, (None, ()))[1]
+                previo = max((costo(d) for d in deps), default=(0.0, []), key=lambda x: x[0])
+                mejor[nombre] = (previo[0] + fin - ini, previo[1] + [nombre])
+            return mejor[nombre]
+
+        if not self.tiempos:
+            return [], 0.0
+        s, camino = max((costo(n) for n in self._nodos), default=(0.0, []), key=lambda x: x[0])
+        return camino, s
+
+    def resumen(self) -> dict:
+        """Duración total (pared), suma de nodos y ruta crítica de la última ejecución."""
+        if not self.tiempos:
+            return {}
+        ini = min(t[0] for t in self.tiempos.values())
+        fin = max(t[1] for t in self.tiempos.values())
+        camino, critica = self.ruta_critica()
+        return {"pared_s": round(fin - ini, 3),
+                "suma_nodos_s": round(sum(f - i for i, f in self.tiempos.values()), 3),
+                "ruta_critica_s": round(critica, 3), "ruta_critica": camino}
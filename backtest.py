@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+# backtest.py
+# Backtest vectorizado de reglas de gap fade sobre las velas de 15 min que hay
+# detrás de grafico_intradia. Las velas se pasan una vez a arrays sesión × slot
+# (04:00…16:00, 49 slots) y cada regla se evalúa para todas las sesiones a la vez:
+# entrada al open de un slot (opcionalmente solo por debajo / encima del VWAP),
+# stop en el PM high o a un % de la entrada, objetivo opcional y salida al cierre
+# de un slot. El primer toque de stop / objetivo sale de un argmax sobre la máscara
+# de velas; si ambos caen en la misma vela gana el stop (conservador).
+#
+#   b = Barras.construir(s.intraday_df, s.stocks_filtrados)
+#   pnl = b.evaluar({"entrada": "09:45", "vwap": "debajo", "stop": "pmh", "salida": "16:00"})
+#   b.por_mes(pnl)                                  # distribución del PnL % por mes
+#   b.barrido({"entrada": ["09:30", "09:45"], "stop": ["pmh", 5, 10]}, procesos=4)
+#
+#   python backtest.py --entrada 09:30 09:45 10:00 --stop pmh 5 10 20 --vwap debajo - \
+#       --salida 12:00 16:00 --objetivo - 10 20 --procesos 4
+#
+# PnL de un corto en %: (entrada - salida) / entrada * 100 - coste.
+import os
+import sys
+import argparse
+import itertools
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import cubo
+import session_keys as sk
+
+INICIO_MIN = 4 * 60   # 04:00, primer slot
+PASO_MIN = 15
+SLOTS = 49            # 04:00 … 16:00
+APERTURA = "09:30"    # el PM high es el máximo de las velas anteriores
+
+# Regla por defecto: corto a las 09:45 bajo VWAP, stop en PMH, cierre a las 16:00
+REGLA = {"entrada": "09:45", "vwap": "debajo", "stop": "pmh", "objetivo": None, "salida": "16:00", "coste": 0.0}
+VWAP = (None, "debajo", "encima")
+LOTE = 64             # combinaciones por tarea en el barrido paralelo
+
+
+def slot(hhmm: str) -> int:
+    """Índice de slot de una hora "HH:MM" (o "HH:MM:SS")."""
+    h, m = int(hhmm[:2]), int(hhmm[3:5])
+    i = (h * 60 + m - INICIO_MIN) // PASO_MIN
+    if not 0 <= i < SLOTS:
+        raise ValueError(f"hora fuera de 04:00-16:00: {hhmm}")
+    return i
+
+
+def hora(i: int) -> str:
+    m = INICIO_MIN + i * PASO_MIN
+    return f"{m // 60:02d}:{m % 60:02d}"
+
+
+def _numero(df: pd.DataFrame, col: str) -> np.ndarray:
+    if col not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64)
+
+
+class Barras:
+    """Arrays sesión × slot (open, high, low, close, VWAP acumulado) más PMH, mes y dims del cubo por sesión."""
+
+    def __init__(self, claves, open_, high, low, close, vwap, pmh, mes, dims):
+        self.claves = claves
+        self.open, self.high, self.low, self.close = open_, high, low, close
+        self.vwap = vwap
+        self.pmh = pmh
+        self.mes = mes
+        self.dims = dims
+        # Cierre arrastrado: la salida usa el último cierre disponible si falta la vela
+        self._cierre = pd.DataFrame(close).ffill(axis=1).to_numpy()
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # El cierre arrastrado y la caché se recalculan al deserializar (procesos del barrido)
+        return {k: getattr(self, k) for k in ("claves", "open", "high", "low", "close", "vwap", "pmh", "mes", "dims")}
+
+    def __setstate__(self, estado):
+        estado["open_"] = estado.pop("open")
+        self.__init__(**estado)
+
+    def __len__(self) -> int:
+        return len(self.claves)
+
+    @classmethod
+    def construir(cls, intraday_df: pd.DataFrame, stocks: pd.DataFrame = None) -> "Barras":
+        """Velas 15 min (ticker, date, bar_time_local, open…vwap) -> arrays; con stocks,
+        solo sus sesiones (como grafico_intradia) y sus dims del cubo para filtrar."""
+        vacio = intraday_df is None or intraday_df.empty
+        df = pd.DataFrame(columns=["ticker", "date", "bar_time_local"]) if vacio else intraday_df
+        t = df["bar_time_local"].astype(str)
+        minutos = pd.to_numeric(t.str[:2], errors="coerce") * 60 + pd.to_numeric(t.str[3:5], errors="coerce")
+        s_idx = ((minutos - INICIO_MIN) // PASO_MIN).to_numpy(dtype=np.float64)
+        # Sesiones que no caben en la clave (ticker raro, fecha inválida) se descartan
+        ok = (s_idx >= 0) & (s_idx < SLOTS) & sk.codificables(df["ticker"], df["date"])
+        df, s_idx = df[ok], s_idx[ok].astype(np.int64)
+        claves = sk.encode_sessions(df["ticker"], df["date"]) if len(df) else np.empty(0, dtype=np.int64)
+
+        dims = None
+        if stocks is not None:
+            sf = stocks[sk.codificables(stocks["Ticker"], stocks["Date"])]
+            sf = sf.reset_index(drop=True)
+            k_sf = sk.encode_sessions(sf["Ticker"], sf["Date"]) if len(sf) else np.empty(0, dtype=np.int64)
+            k_sf, primera = np.unique(k_sf, return_index=True)
+            dentro = sk.isin_sorted(claves, k_sf)
+            df, s_idx, claves = df[dentro], s_idx[dentro], claves[dentro]
+
+        ses, fila = np.unique(claves, return_inverse=True)
+        if stocks is not None:
+            dims = cubo.codigos_dims(sf.iloc[primera[np.searchsorted(k_sf, ses)]]).reset_index(drop=True)
+
+        def matriz(col):
+            m = np.full((len(ses), SLOTS), np.nan)
+            m[fila, s_idx] = _numero(df, col)
+            return m
+
+        o, h, l, c = matriz("open"), matriz("high"), matriz("low"), matriz("close")
+        vol = np.nan_to_num(matriz("volume"))
+        # VWAP acumulado de la sesión desde las 04:00 (vwap de la vela; si falta, precio típico)
+        pv = np.where(np.isnan(matriz("vwap")), (h + l + c) / 3, matriz("vwap")) * vol
+        with np.errstate(invalid="ignore", divide="ignore"):
+            vwap = np.nancumsum(pv, axis=1) / np.cumsum(vol, axis=1)
+            vwap[~np.isfinite(vwap)] = np.nan
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # sesiones sin premarket -> NaN
+            pmh = np.nanmax(h[:, :slot(APERTURA)], axis=1) if len(ses) else np.empty(0)
+        fechas = sk.decode_keys(ses)["date"]
+        mes = pd.to_datetime(fechas).dt.strftime("%Y-%m").to_numpy() if len(ses) else np.empty(0, dtype=object)
+        return cls(ses, o, h, l, c, vwap, pmh, mes, dims)
+
+    # ---------------------------------------------------------
+    # Una regla: PnL % por sesión (NaN = sin operación)
+    # ---------------------------------------------------------
+    def evaluar(self, regla: dict = None, filtro: dict = None) -> np.ndarray:
+        r = _regla(regla)
+        e, x = slot(r["entrada"]), slot(r["salida"])
+        if x <= e:
+            raise ValueError(f"salida ({r['salida']}) no posterior a la entrada ({r['entrada']})")
+        if r["vwap"] not in VWAP:
+            raise ValueError(f"vwap debe ser uno de {VWAP}: {r['vwap']!r}")
+        entrada = self.open[:, e]
+        opera = np.isfinite(entrada) & (entrada > 0)
+        if filtro:
+            if self.dims is None:
+                raise ValueError("filtro requiere Barras construidas con stocks")
+            opera &= cubo.mascara(self.dims, filtro)
+        if r["vwap"] is not None:
+            v = self.vwap[:, e - 1] if e else np.full(len(self), np.nan)
+            opera &= (entrada < v) if r["vwap"] == "debajo" else (entrada > v)
+
+        with np.errstate(invalid="ignore"):
+            if r["stop"] is None:
+                stop = np.full(len(self), np.inf)
+            elif r["stop"] == "pmh":
+                stop = self.pmh
+                opera &= entrada < stop  # ya por encima del PMH: no hay corto
+            else:
+                stop = entrada * (1 + float(r["stop"]) / 100)
+            objetivo = entrada * (1 - float(r["objetivo"]) / 100) if r["objetivo"] is not None else np.full(len(self), -np.inf)
+
+            # Primer toque en las velas [entrada, salida): argmax de la máscara
+            toca_s = self.high[:, e:x] >= stop[:, None]
+            toca_o = self.low[:, e:x] <= objetivo[:, None]
+        n = x - e
+        i_s = np.where(toca_s.any(axis=1), toca_s.argmax(axis=1), n)
+        i_o = np.where(toca_o.any(axis=1), toca_o.argmax(axis=1), n)
+        filas = np.arange(len(self))
+        open_s = self.open[filas, e + np.minimum(i_s, n - 1)]
+        open_o = self.open[filas, e + np.minimum(i_o, n - 1)]
+
+        # Huecos a través del stop / objetivo se llenan al open de la vela
+        salida = self._cierre[:, x - 1].copy()
+        sale_o = i_o < np.minimum(i_s, n)
+        sale_s = (i_s < n) & ~sale_o
+        salida[sale_o] = np.fmin(objetivo, open_o)[sale_o]
+        salida[sale_s] = np.fmax(stop, open_s)[sale_s]
+        pnl = (entrada - salida) / entrada * 100 - float(r["coste"] or 0)
+        return np.where(opera & np.isfinite(salida), pnl, np.nan)
+
+    # ---------------------------------------------------------
+    # Informes
+    # ---------------------------------------------------------
+    @staticmethod
+    def resumen(pnl: np.ndarray, mes: np.ndarray = None) -> dict:
+        """n, acierto (% > 0), media, mediana, p10, p90, total y % de meses con media positiva."""
+        x = pnl[~np.isnan(pnl)]
+        if not len(x):
+            return {"n": 0, "acierto": np.nan, "media": np.nan, "mediana": np.nan,
+                    "p10": np.nan, "p90": np.nan, "total": 0.0, "meses_pos": np.nan}
+        p10, p50, p90 = np.percentile(x, [10, 50, 90])
+        out = {"n": len(x), "acierto": float((x > 0).mean() * 100), "media": float(x.mean()), "mediana": float(p50),
+               "p10": float(p10), "p90": float(p90), "total": float(x.sum())}
+        if mes is not None:
+            m = pd.Series(pnl).groupby(mes).mean()
+            out["meses_pos"] = float((m.dropna() > 0).mean() * 100)
+        return out
+
+    def por_mes(self, pnl: np.ndarray) -> pd.DataFrame:
+        """Distribución del PnL % por mes: n, acierto, media, percentiles y total (índice Periodo)."""
+        d = pd.DataFrame({"Periodo": self.mes, "pnl": pnl}).dropna()
+        g = d.groupby("Periodo")["pnl"]
+        out = g.describe(percentiles=[0.1, 0.25, 0.5, 0.75, 0.9])
+        out = out.rename(columns={"count": "n", "mean": "media", "std": "desv", "10%": "p10", "25%": "p25",
+                                  "50%": "mediana", "75%": "p75", "90%": "p90"})
+        out["n"] = out["n"].astype(np.int64)
+        out.insert(1, "acierto", g.apply(lambda x: (x > 0).mean() * 100))
+        out["total"] = g.sum()
+        return out
+
+    def evaluar_cache(self, regla: dict = None, filtro: dict = None) -> np.ndarray:
+        """evaluar() recordando las últimas reglas (las gráficas de la app repiten reglas entre reruns)."""
+        clave = (tuple(sorted(_regla(regla).items())), _clave_filtro(filtro))
+        with self._lock:
+            if clave in self._cache:
+                return self._cache[clave]
+        pnl = self.evaluar(regla, filtro)
+        with self._lock:
+            self._cache[clave] = pnl
+            while len(self._cache) > 32:
+                self._cache.pop(next(iter(self._cache)))
+        return pnl
+
+    # ---------------------------------------------------------
+    # Barrido de parámetros (en paralelo por procesos)
+    # ---------------------------------------------------------
+    def barrido(self, rejilla: dict, filtro: dict = None, procesos: int = None) -> pd.DataFrame:
+        """Todas las combinaciones de rejilla = {parámetro: [valores]} (resto de REGLA por defecto).
+
+        Una fila por combinación con sus parámetros y resumen(); ordenado por media.
+        Las combinaciones con salida no posterior a la entrada se descartan.
+        """
+        nombres = list(rejilla)
+        combos = [dict(zip(nombres, v)) for v in itertools.product(*(rejilla[n] for n in nombres))]
+        combos = [c for c in combos if slot(c.get("salida", REGLA["salida"])) > slot(c.get("entrada", REGLA["entrada"]))]
+        lotes = [combos[i:i + LOTE] for i in range(0, len(combos), LOTE)]
+        procesos = max(1, min(procesos or os.cpu_count() or 1, len(lotes) or 1))
+        if procesos == 1:
+            filas = [f for lote in lotes for f in _evaluar_lote(lote, filtro, self)]
+        else:
+            # Cada proceso recibe los arrays una sola vez (inicializador), no por tarea
+            with ProcessPoolExecutor(procesos, initializer=_iniciar_proceso, initargs=(self,)) as ex:
+                filas = [f for parte in ex.map(_evaluar_lote, lotes, itertools.repeat(filtro)) for f in parte]
+        out = pd.DataFrame(filas, columns=nombres + ["n", "acierto", "media", "mediana", "p10", "p90", "total", "meses_pos"])
+        return out.sort_values("media", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def _regla(regla: dict) -> dict:
+    # REGLA completada; NaN (filas de barrido() vueltas a dict) equivale a None
+    r = {**REGLA, **(regla or {})}
+    return {k: None if isinstance(v, float) and np.isnan(v) else v for k, v in r.items()}
+
+
+def _clave_filtro(filtro: dict) -> tuple:
+    return tuple(sorted((d, tuple(v) if not np.isscalar(v) else (v,)) for d, v in (filtro or {}).items()))
+
+
+_barras_proceso = None
+
+
+def _iniciar_proceso(barras):
+    global _barras_proceso
+    _barras_proceso = barras
+
+
+def _evaluar_lote(combos, filtro=None, barras=None):
+    b = barras if barras is not None else _barras_proceso
+    return [{**c, **Barras.resumen(b.evaluar(c, filtro), b.mes)} for c in combos]
+
+
+# -------------------------------------------------------------
+# Barras del snapshot (una por versión; se conservan la actual y la anterior)
+# -------------------------------------------------------------
+_cache_lock = threading.Lock()
+_por_version = {}
+
+
+def para_snapshot(s) -> Barras:
+    with _cache_lock:
+        b = _por_version.get(s.version)
+        if b is None:
+            b = _por_version[s.version] = Barras.construir(s.intraday_df, s.stocks_filtrados)
+            for v in sorted(_por_version)[:-2]:
+                _por_version.pop(v)
+        return b
+
+
+def _valor(v: str):
+    # "-" = sin condición / sin stop / sin objetivo; números como float
+    if v in ("-", "none", "None"):
+        return None
+    try:
+        return float(v)
+    except ValueError:
+        return v
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="Barrido de reglas de gap fade (corto) sobre las velas de 15 min")
+    p.add_argument("--entrada", nargs="+", default=[REGLA["entrada"]], help="horas de entrada HH:MM")
+    p.add_argument("--vwap", nargs="+", default=[REGLA["vwap"]], help="debajo / encima / - (sin condición)")
+    p.add_argument("--stop", nargs="+", default=[REGLA["stop"]], help="pmh, %% sobre la entrada o -")
+    p.add_argument("--objetivo", nargs="+", default=["-"], help="%% bajo la entrada o -")
+    p.add_argument("--salida", nargs="+", default=[REGLA["salida"]], help="horas de salida HH:MM (16:00 = cierre)")
+    p.add_argument("--coste", type=float, default=0.0, help="coste ida y vuelta en %%")
+    p.add_argument("--procesos", type=int, default=None)
+    p.add_argument("--top", type=int, default=20)
+    p.add_argument("--mensual", action="store_true", help="distribución mensual de la mejor combinación")
+    args = p.parse_args(argv)
+
+    import modulo  # universo del dashboard (SMALLCAPS_DATA_URL / SMALLCAPS_INTRADAY_URL)
+    b = para_snapshot(modulo.snapshot())
+    rejilla = {
+        "entrada": args.entrada, "vwap": [_valor(v) for v in args.vwap], "stop": [_valor(v) for v in args.stop],
+        "objetivo": [_valor(v) for v in args.objetivo], "salida": args.salida, "coste": [args.coste],
+    }
+    out = b.barrido(rejilla, procesos=args.procesos)
+    pd.set_option("display.width", 160)
+    print(f"{len(b)} sesiones, {len(out)} combinaciones", file=sys.stderr)
+    print(out.head(args.top).to_string(index=False, float_format="%.2f"))
+    if args.mensual and len(out):
+        mejor = out.iloc[0][list(rejilla)].to_dict()
+        print(f"\nPor mes: {mejor}")
+        print(b.por_mes(b.evaluar(mejor)).to_string(float_format="%.2f"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# bar_store.py
+# Almacén local de velas descargadas, con un índice de sesiones para pedir a Polygon
+# solo los (ticker, date, timeframe) que todavía no tenemos.
+#
+# Estructura en disco (<v> = variante: zona horaria de bar_time_local y filtro de
+# sesión, p. ej. America_New_York-rth; las velas formateadas dependen de ambos):
+#   <root>/<timeframe>/<v>/part-<timestamp>.csv   velas (mismo formato que format_output)
+#   <root>/<timeframe>/<v>/_index.npy             claves int64 ordenadas de sesiones con velas
+#   <root>/<timeframe>/<v>/_empty.npy             sesiones que Polygon devolvió vacías
+import os
+import glob
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+import session_keys as sk
+
+# "NA" es un ticker real: al releer las partes solo las celdas vacías son NA
+LECTURA = {"keep_default_na": False, "na_values": [""]}
+
+
+def variante(tz: str, session_only: bool) -> str:
+    """Nombre del subdirectorio de una combinación zona horaria / filtro de sesión."""
+    return f"{tz.replace('/', '_')}-{'rth' if session_only else 'all'}"
+
+
+def partes(directorio: str) -> list:
+    """part-*.csv de un directorio de almacén (<root>/<timeframe>/<variante>)."""
+    return sorted(glob.glob(os.path.join(directorio, "part-*.csv")))
+
+
+class BarStore:
+    def __init__(self, root: str, timeframe: str, tz: str = "America/New_York", session_only: bool = True):
+        self.dir = os.path.join(root, timeframe, variante(tz, session_only))
+        self.timeframe = timeframe
+        self.tz, self.session_only = tz, session_only
+        os.makedirs(self.dir, exist_ok=True)
+        self._index = None
+        self._empty = None
+
+    # --------------------------
+    # Índice
+    # --------------------------
+    def _path(self, name: str) -> str:
+        return os.path.join(self.dir, name)
+
+    def _load(self, name: str) -> np.ndarray:
+        path = self._path(name)
+        if os.path.exists(path):
+            return np.load(path)
+        return np.zeros(0, dtype=np.int64)
+
+    def _save(self, name: str, keys: np.ndarray) -> None:
+        # Escritura atómica: un lector nunca ve un índice a medias
+        tmp = self._path(name + ".tmp.npy")
+        np.save(tmp, keys)
+        os.replace(tmp, self._path(name))
+
+    def index(self) -> np.ndarray:
+        if self._index is None:
+            if not os.path.exists(self._path("_index.npy")) and self.parts():
+                self.rebuild_index()
+            else:
+                self._index = self._load("_index.npy")
+        return self._index
+
+    def empty_sessions(self) -> np.ndarray:
+        if self._empty is None:
+            self._empty = self._load("_empty.npy")
+        return self._empty
+
+    def parts(self) -> list:
+        return partes(self.dir)
+
+    def rebuild_index(self) -> np.ndarray:
+        """Reconstruye _index.npy leyendo solo ticker/date de cada parte."""
+        keys = [np.zeros(0, dtype=np.int64)]
+        for part in self.parts():
+            df = pd.read_csv(part, usecols=["ticker", "date"], **LECTURA).drop_duplicates()
+            keys.append(sk.encode_sessions(df["ticker"], df["date"]))
+        self._index = np.unique(np.concatenate(keys))
+        self._save("_index.npy", self._index)
+        return self._index
+
+    def __len__(self) -> int:
+        return len(self.index())
+
+    # --------------------------
+    # Diff
+    # --------------------------
+    def missing(self, df_in: pd.DataFrame, retry_empty: bool = False) -> pd.DataFrame:
+        """Filas de df_in (ticker, date) que no están en el almacén."""
+        if df_in.empty:
+            return df_in
+        keys = sk.encode_sessions(df_in["ticker"], df_in["date"])
+        presentes = sk.isin_sorted(keys, self.index())
+        if not retry_empty:
+            presentes |= sk.isin_sorted(keys, self.empty_sessions())
+        return df_in.loc[~presentes].reset_index(drop=True)
+
+    # --------------------------
+    # Escritura
+    # --------------------------
+    def append(self, bars_fmt: pd.DataFrame, empty: list = ()) -> str:
+        """Añade velas ya formateadas (format_output) y registra las sesiones vacías."""
+        path = None
+        if not bars_fmt.empty:
+            stamp = dt.datetime.now().strftime("%Y%m%dT%H%M%S%f")
+            path = self._path(f"part-{stamp}.csv")
+            bars_fmt.to_csv(path + ".tmp", index=False)
+            os.replace(path + ".tmp", path)
+            sesiones = bars_fmt[["ticker", "date"]].drop_duplicates()
+            nuevas = sk.encode_sessions(sesiones["ticker"], sesiones["date"])
+            self._index = np.union1d(self.index(), nuevas)
+            self._save("_index.npy", self._index)
+        if empty:
+            e = pd.DataFrame(list(empty), columns=["ticker", "date"])
+            self._empty = np.union1d(self.empty_sessions(), sk.encode_sessions(e["ticker"], e["date"]))
+            self._save("_empty.npy", self._empty)
+        return path
+
+    def load(self) -> pd.DataFrame:
+        partes = [pd.read_csv(p, **LECTURA) for p in self.parts()]
+        return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
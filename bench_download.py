@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# bench_download.py
+# Benchmark del descargador (polygon_batch.run_batch) contra mock_polygon.py, sin red.
+# Mide sesiones/segundo, latencia p50/p99 por sesión y memoria pico (en una
+# segunda pasada sin cronometrar) para lotes estilo script_1m.py / script_15m.py:
+#
+#   python bench_download.py --sessions 500 --timeframe 1m --workers 1 4 16 --latency-ms 30
+#   python bench_download.py --sessions 200 --min-rate 50     # sale con código 1 si no llega
+#
+import sys
+import json
+import time
+import argparse
+import resource
+import threading
+import tracemalloc
+import multiprocessing as mp
+
+import numpy as np
+import pandas as pd
+
+import polygon_batch as pb
+import mock_polygon
+
+
+def _servir(cola, latency_ms, p429, page_size, seed):
+    server, base_url = mock_polygon.start_server(latency_ms=latency_ms, p429=p429, page_size=page_size, seed=seed)
+    cola.put(base_url)
+    # start_server ya sirve en un hilo daemon: el proceso solo tiene que seguir vivo
+    threading.Event().wait()
+
+
+def sesiones_sinteticas(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dias = pd.bdate_range("2022-01-03", "2025-11-28")
+    tickers = [f"T{i:04d}" for i in range(max(1, n // 3))]
+    df = pd.DataFrame({
+        "ticker": rng.choice(tickers, n),
+        "date": rng.choice(dias.date, n),
+    })
+    return df.drop_duplicates().reset_index(drop=True)
+
+
+def medir(df_in: pd.DataFrame, timeframe: str, workers: int) -> dict:
+    latencias = []
+    fetch_original = pb.fetch_polygon_minutes
+
+    def fetch_medido(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fetch_original(*args, **kwargs)
+        finally:
+            latencias.append(time.perf_counter() - t0)
+
+    pb.fetch_polygon_minutes = fetch_medido
+    try:
+        t0 = time.perf_counter()
+        out, vacias, errores = pb.run_batch(df_in, timeframe=timeframe, workers=workers)
+        if not out.empty:
+            pb.format_output(out)
+        elapsed = time.perf_counter() - t0
+    finally:
+        pb.fetch_polygon_minutes = fetch_original
+
+    # Memoria pico en otra pasada: tracemalloc engancha cada asignación y frenaría la cronometrada
+    tracemalloc.start()
+    try:
+        out_m, _, _ = pb.run_batch(df_in, timeframe=timeframe, workers=workers)
+        if not out_m.empty:
+            pb.format_output(out_m)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del out_m
+
+    lat = np.array(latencias) * 1000
+    return {
+        "timeframe": timeframe,
+        "workers": workers,
+        "sessions": len(df_in),
+        "bars": int(len(out)),
+        "errors": len(errores),
+        "empty": len(vacias),
+        "seconds": round(elapsed, 3),
+        "sessions_per_s": round(len(df_in) / elapsed, 2) if elapsed > 0 else None,
+        "p50_ms": round(float(np.percentile(lat, 50)), 2) if lat.size else None,
+        "p99_ms": round(float(np.percentile(lat, 99)), 2) if lat.size else None,
+        "peak_traced_mb": round(pico / 2**20, 1),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="Benchmark del descargador contra el mock local de Polygon")
+    p.add_argument("--sessions", type=int, default=200)
+    p.add_argument("--timeframe", choices=sorted(pb.TIMEFRAMES), default="1m")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    p.add_argument("--latency-ms", type=float, default=20.0)
+    p.add_argument("--p429", type=float, default=0.0)
+    p.add_argument("--page-size", type=int, default=0)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--json", default=None, help="guardar resultados en este fichero")
+    p.add_argument("--min-rate", type=float, default=None, help="sesiones/s mínimas (falla si no se alcanzan)")
+    args = p.parse_args(argv)
+
+    # El mock corre en otro proceso para no competir por el GIL con el cliente
+    cola = mp.Queue()
+    proc = mp.Process(target=_servir, args=(cola, args.latency_ms, args.p429, args.page_size, args.seed), daemon=True)
+    proc.start()
+    pb.POLYGON_BASE_URL = cola.get(timeout=30)
+    pb.POLYGON_API_KEY = "mock"
+
+    try:
+        df_in = sesiones_sinteticas(args.sessions, args.seed)
+        resultados = []
+        for w in args.workers:
+            r = medir(df_in, args.timeframe, w)
+            resultados.append(r)
+            print(
+                f"{r['timeframe']:>4} workers={r['workers']:<3} {r['sessions_per_s']:>8} ses/s  "
+                f"p50={r['p50_ms']}ms p99={r['p99_ms']}ms  pico={r['peak_traced_mb']}MB  "
+                f"rss={r['max_rss_mb']}MB  errores={r['errors']}",
+                flush=True,
+            )
+    finally:
+        proc.terminate()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": resultados}, f, indent=2, default=str)
+
+    if args.min_rate is not None:
+        mejor = max(r["sessions_per_s"] or 0 for r in resultados)
+        if mejor < args.min_rate or any(r["errors"] for r in resultados):
+            print(f"FALLO: {mejor} ses/s < {args.min_rate} o hubo errores", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
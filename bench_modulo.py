@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+# bench_modulo.py
+# Benchmark de modulo.py a distintas escalas con datos sintéticos (synth_data, sin red):
+# import, filtrar_smallcaps, cada agregado mensual, cada grafico_* y la
+# serialización de las figuras. Reporta tiempo y RSS pico y guarda/compara un
+# baseline JSON para detectar regresiones antes de desplegar:
+#
+#   python bench_modulo.py --scales 1 10 100 --save bench_baseline.json
+#   python bench_modulo.py --scales 1 10 --compare bench_baseline.json --tolerance 1.5
+#
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+import synth_data
+
+# Tamaño "1x": del orden del data_completa.csv / data_15min.csv actuales
+FILAS_DIARIAS_1X = 20_000
+SESIONES_INTRADIA_1X = 3_000
+
+
+# -------------------------------------------------------------
+# MEDICIÓN (proceso hijo: import limpio y RSS propio)
+# -------------------------------------------------------------
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _medir(resultados: dict, nombre: str, fn):
+    t0 = time.perf_counter()
+    out = fn()
+    resultados[nombre] = {"s": round(time.perf_counter() - t0, 4), "rss_mb": round(_rss_mb(), 1)}
+    return out
+
+
+def _sesion_similares(dm) -> tuple:
+    idx = dm.similares.para_snapshot(dm.snapshot())
+    if not len(idx):
+        return None
+    s = dm.sk.decode_keys(idx.claves[:1]).iloc[0]
+    return (None, s["ticker"], s["date"])
+
+
+def _ticker_intradia(dm) -> tuple:
+    conteos = dm.snapshot().indice_tickers_intradia.conteos()
+    return (None, conteos.index[0]) if len(conteos) else None
+
+
+# grafico_* que necesitan argumentos: función dm -> args (None = sin datos, se salta)
+ARGUMENTOS = {
+    "grafico_similares": _sesion_similares,
+    "grafico_ticker_intradia": _ticker_intradia,
+}
+
+
+def worker() -> dict:
+    r = {}
+    dm = _medir(r, "import modulo", lambda: __import__("modulo"))
+    _medir(r, "filtrar_smallcaps", lambda: dm.filtrar_smallcaps(dm.stocks_v1))
+    for nombre in sorted(n for n in dir(dm) if n.startswith("calcular_monthly_")):
+        _medir(r, nombre, lambda f=getattr(dm, nombre): f(dm.stocks_filtrados))
+    figuras = {"fig_2": dm.fig_2, "fig_3": dm.fig_3, "fig_4": dm.fig_4}
+    for nombre in sorted(n for n in dir(dm) if n.startswith("grafico_") or n == "crear_grafico_retornos_stack"):
+        fn = getattr(dm, nombre)
+        if nombre in ARGUMENTOS:
+            args = ARGUMENTOS[nombre](dm)
+            if args is None:
+                continue
+            fn = lambda f=fn, a=args: f(*a)
+        figuras[nombre] = _medir(r, nombre, fn)
+    for nombre, fig in figuras.items():
+        json_fig = _medir(r, f"to_json:{nombre}", fig.to_json)
+        r[f"to_json:{nombre}"]["bytes"] = len(json_fig)
+    return {
+        "rows": int(len(dm.stocks)),
+        "rows_filtered": int(len(dm.stocks_filtrados)),
+        "intraday_rows": int(len(dm.intraday_df)),
+        "peak_rss_mb": round(_rss_mb(), 1),
+        "ops": r,
+    }
+
+
+def correr_escala(escala: int, seed: int, tmpdir: str) -> dict:
+    p_diario, p_intradia, _ = synth_data.escribir(
+        tmpdir, FILAS_DIARIAS_1X * escala, SESIONES_INTRADIA_1X * escala, "15m", seed,
+        nombre_diario=f"data_completa_{escala}x.csv", nombre_intradia=f"data_15min_{escala}x.csv",
+    )
+
+    # Sin serializar figuras dentro de perf_metrics: to_json ya se mide aparte
+    env = dict(os.environ, SMALLCAPS_DATA_URL=p_diario, SMALLCAPS_INTRADAY_URL=p_intradia, SMALLCAPS_PERF_FIGURAS="0")
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker"],
+        env=env, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"worker {escala}x falló:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def comparar(actual: dict, baseline: dict, tolerancia: float) -> list:
+    """Operaciones cuyo tiempo supera tolerancia x baseline (ignora las de < 5 ms)."""
+    regresiones = []
+    for escala, res in actual["scales"].items():
+        base = baseline.get("scales", {}).get(escala)
+        if not base:
+            continue
+        for op, m in res["ops"].items():
+            b = base["ops"].get(op)
+            if b and max(m["s"], b["s"]) >= 0.005 and m["s"] > b["s"] * tolerancia:
+                regresiones.append(f"{escala}x {op}: {b['s']}s -> {m['s']}s")
+        if res["peak_rss_mb"] > base["peak_rss_mb"] * tolerancia:
+            regresiones.append(f"{escala}x peak_rss_mb: {base['peak_rss_mb']} -> {res['peak_rss_mb']}")
+    return regresiones
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="Benchmark de modulo.py con datos sintéticos")
+    p.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--save", default=None, help="guardar resultados como baseline JSON")
+    p.add_argument("--compare", default=None, help="baseline JSON con el que comparar")
+    p.add_argument("--tolerance", type=float, default=1.5, help="factor máximo permitido frente al baseline")
+    p.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(worker()))
+        return 0
+
+    resultados = {"scales": {}}
+    with tempfile.TemporaryDirectory(prefix="bench_modulo_") as tmpdir:
+        for escala in args.scales:
+            res = correr_escala(escala, args.seed, tmpdir)
+            resultados["scales"][str(escala)] = res
+            lentas = sorted(res["ops"].items(), key=lambda kv: -kv[1]["s"])[:5]
+            print(f"{escala:>4}x  filas={res['rows']:<9} filtradas={res['rows_filtered']:<8} "
+                  f"rss_pico={res['peak_rss_mb']}MB  import={res['ops']['import modulo']['s']}s", flush=True)
+            for op, m in lentas:
+                print(f"        {op:<45} {m['s']:>8.3f}s", flush=True)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regresiones = comparar(resultados, json.load(f), args.tolerance)
+        for reg in regresiones:
+            print(f"REGRESIÓN {reg}", file=sys.stderr)
+        return 1 if regresiones else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# bootstrap.py
+# Intervalos de confianza bootstrap (percentil) de la media por periodo, para
+# todas las métricas y todos los periodos a la vez: las filas se ordenan por
+# periodo, una matriz de índices (remuestreos × filas) remuestrea cada fila
+# dentro de su periodo y np.add.reduceat suma cada periodo de cada remuestreo
+# en una sola operación. Los nulos no cuentan (suma y conteo por separado).
+# Semilla fija: mismos datos -> mismos intervalos.
+#
+#   ic = intervalos(df[["a", "b"]] * 100, df["YearMonth"])
+#   ic.loc["2024-03", ["a_lo", "a_hi"]]
+#
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+REMUESTREOS = int(os.environ.get("SMALLCAPS_BOOTSTRAP_B", 1000))
+NIVEL = 0.95
+SEMILLA = 20220101
+MAX_ELEMENTOS = 4_000_000  # métricas × remuestreos × filas por bloque (~32 MB por temporal)
+
+
+def intervalos(valores: pd.DataFrame, grupos, remuestreos: int = REMUESTREOS,
+               nivel: float = NIVEL, semilla: int = SEMILLA) -> pd.DataFrame:
+    """Por grupo (índice ordenado): <col>_n, <col>_lo y <col>_hi de cada columna de valores."""
+    claves, g = np.unique(np.asarray(grupos), return_inverse=True)
+    orden = np.argsort(g, kind="stable")
+    g = g[orden]
+    x = valores.to_numpy(dtype=np.float64)[orden].T            # métricas × filas
+    valido = ~np.isnan(x)
+    x0 = np.where(valido, x, 0.0)
+    validof = valido.astype(np.float64)
+    n_g = np.bincount(g, minlength=len(claves))
+    inicio = np.concatenate([[0], np.cumsum(n_g)[:-1]])
+    k, n = x.shape
+    con_nulos = ~valido.all(axis=1)
+
+    # Todas las medias remuestreadas: métricas × remuestreos × grupos
+    medias = np.empty((k, remuestreos, len(claves)))
+    rng = np.random.default_rng(semilla)
+    base, tam = inicio[g], n_g[g]
+    bloque = max(1, MAX_ELEMENTOS // max(1, k * n))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for b0 in range(0, remuestreos, bloque):
+            b = min(bloque, remuestreos - b0)
+            # fila j del remuestreo -> una fila al azar de su mismo grupo
+            idx = base + (rng.random((b, n)) * tam).astype(np.int64)
+            sumas = np.add.reduceat(x0[:, idx], inicio, axis=2) if n else np.zeros((k, b, 0))
+            medias[:, b0:b0 + b] = sumas / n_g
+            if con_nulos.any():  # solo las métricas con nulos necesitan remuestrear el conteo
+                cuentas = np.add.reduceat(validof[con_nulos][:, idx], inicio, axis=2)
+                medias[con_nulos, b0:b0 + b] = sumas[con_nulos] / cuentas
+
+    cola = (1 - nivel) / 2 * 100
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # grupo sin datos en una métrica -> NaN
+        lo, hi = np.nanpercentile(medias, [cola, 100 - cola], axis=1)
+    out = {}
+    for i, col in enumerate(valores.columns):
+        out[f"{col}_n"] = np.bincount(g, weights=validof[i], minlength=len(claves)).astype(np.int64)
+        out[f"{col}_lo"] = lo[i]
+        out[f"{col}_hi"] = hi[i]
+    return pd.DataFrame(out, index=pd.Index(claves, name="Periodo"))
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# cuantiles.py
+# Sketches de cuantiles sumables (estilo DDSketch) para medianas y percentiles de
+# cualquier unión de celdas del cubo sin ordenar filas. Cada valor cae en un
+# tramo logarítmico k = ceil(log_γ |x|) con γ = (1 + α) / (1 - α); el sketch de
+# un conjunto es el conteo por (signo, k), así que unir conjuntos es sumar
+# conteos (exacto, sin pérdida adicional por fusionar).
+#
+# Garantía: para n valores y q en [0, 1], cuantil() devuelve una estimación x̂
+# del estadístico de orden x_(r), r = floor(q * (n - 1)), con
+#     |x̂ - x_(r)| <= α * |x_(r)|        (|x_(r)| >= MINIMO; si no, x̂ = 0)
+# Con n par la mediana de pandas es la media de x_(r) y x_(r+1): la diferencia
+# con x̂ es como mucho α|x_(r)| más la mitad del hueco entre ambos.
+#
+#   t = tabla(celda, {"return": retornos, "hod": minutos})   # formato largo
+#   cuantil(t[t["metrica"] == 0], [0.5, 0.9])
+#
+#   python cuantiles.py      # comprueba la cota contra cuantiles exactos
+#   (test_cuantiles.py lo comprueba también para uniones filtradas de Cubo.cuantil)
+#
+import sys
+
+import numpy as np
+import pandas as pd
+
+ALPHA = 0.005  # error relativo garantizado (0,5 %)
+GAMMA = (1 + ALPHA) / (1 - ALPHA)
+_LOG_GAMMA = np.log(GAMMA)
+MINIMO = 1e-9  # |x| por debajo cae en el tramo del cero (se estima 0)
+
+
+def claves(x: np.ndarray) -> tuple:
+    """(signo, k) de cada valor no nulo de x: signo -1 / 0 / 1 y k = ceil(log_γ |x|)."""
+    x = np.asarray(x, dtype=np.float64)
+    a = np.abs(x)
+    signo = np.where(a < MINIMO, 0, np.sign(x)).astype(np.int8)
+    with np.errstate(divide="ignore"):
+        k = np.where(signo == 0, 0, np.ceil(np.log(np.maximum(a, MINIMO)) / _LOG_GAMMA))
+    return signo, k.astype(np.int32)
+
+
+def representante(signo: np.ndarray, k: np.ndarray) -> np.ndarray:
+    """Valor que estima todo el tramo (γ^(k-1), γ^k]: error relativo <= α para cualquiera de ellos."""
+    return signo * (2 * GAMMA ** k.astype(np.float64) / (GAMMA + 1))
+
+
+def tabla(celda: np.ndarray, valores: dict) -> pd.DataFrame:
+    """Sketches en formato largo: una fila por (metrica, celda, signo, k) no vacío con su conteo n.
+
+    celda: celda de cada fila (enteros); valores: {nombre: array por fila}; los
+    nulos no cuentan. La columna metrica es la posición del nombre en valores.
+    """
+    partes = []
+    for m, x in enumerate(valores.values()):
+        x = np.asarray(x, dtype=np.float64)
+        ok = ~np.isnan(x)
+        signo, k = claves(x[ok])
+        t = pd.DataFrame({"metrica": np.int8(m), "celda": np.asarray(celda)[ok].astype(np.int32),
+                          "signo": signo, "k": k})
+        partes.append(t.groupby(["metrica", "celda", "signo", "k"], sort=True).size().rename("n").reset_index())
+    t = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=["metrica", "celda", "signo", "k", "n"])
+    return t.astype({"metrica": np.int8, "celda": np.int32, "signo": np.int8, "k": np.int32, "n": np.int64})
+
+
+def cuantil(t: pd.DataFrame, q):
+    """Cuantil(es) q de la unión de las filas de t (columnas signo, k, n). NaN si está vacía."""
+    escalar = np.isscalar(q)
+    qs = np.atleast_1d(np.asarray(q, dtype=np.float64))
+    if len(t) == 0:
+        return np.nan if escalar else np.full(len(qs), np.nan)
+    g = t.groupby(["signo", "k"], sort=False)["n"].sum()
+    signo = g.index.get_level_values(0).to_numpy()
+    k = g.index.get_level_values(1).to_numpy()
+    v = representante(signo, k)
+    orden = np.argsort(v, kind="stable")
+    v, acumulado = v[orden], np.cumsum(g.to_numpy()[orden])
+    rangos = np.floor(qs * (acumulado[-1] - 1))
+    out = v[np.searchsorted(acumulado, rangos, side="right")]
+    return float(out[0]) if escalar else out
+
+
+# -------------------------------------------------------------
+# AUTOCOMPROBACIÓN: cota de error contra cuantiles exactos
+# -------------------------------------------------------------
+def _comprobar(semilla: int = 0) -> int:
+    rng = np.random.default_rng(semilla)
+    casos = {
+        "retornos": rng.normal(-0.1, 0.3, 20_000) * 100,
+        "lognormal": rng.lognormal(0, 2, 20_000),
+        "minutos": rng.integers(0, 390, 20_000).astype(float),
+        "con_ceros": np.r_[np.zeros(500), rng.exponential(5, 5_000), -rng.exponential(5, 5_000)],
+        "pocos": rng.normal(0, 1, 7),
+    }
+    qs = np.array([0.0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1.0])
+    fallos = 0
+    for nombre, x in casos.items():
+        # Partido en 50 celdas y fusionado: debe cumplir la misma cota que un solo sketch
+        celda = rng.integers(0, 50, len(x))
+        t = tabla(celda, {nombre: x})
+        est = cuantil(t[t["celda"] < 25], qs)
+        sub = np.sort(x[celda < 25])
+        exacto = sub[np.floor(qs * (len(sub) - 1)).astype(int)]
+        err = np.abs(est - exacto)
+        cota = ALPHA * np.abs(exacto) * (1 + 1e-12) + np.where(np.abs(exacto) < MINIMO, MINIMO, 0)
+        ok = bool((err <= cota).all())
+        fallos += not ok
+        rel = np.max(err / np.maximum(np.abs(exacto), MINIMO))
+        print(f"{nombre:10s} n={len(sub):6d} tramos={len(t):6d} error relativo máx={rel:.5f} "
+              f"(α={ALPHA}) {'OK' if ok else 'FALLO'}")
+    return 1 if fallos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(_comprobar())
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+# cubo.py
+# Cubo OLAP precalculado sobre los gaps filtrados: dimensiones año × mes ×
+# tramo de precio × tramo de gap × tramo de hora del PM high (los mismos bins que
+# las gráficas de distribución) y, por celda, conteos, sumas de las métricas y
+# el histograma de cada distribución (estado de sketch sumable). Cualquier
+# gráfica o combinación de filtros sobre esas dimensiones se responde sumando
+# celdas (unas miles como mucho) en vez de recorrer filas, así la latencia no
+# crece con el histórico:
+#
+#   c = Cubo.construir(stocks_filtrados)
+#   c.distribucion("return", filtro={"precio": ["0 - 1 $ "], "year": [2024]})
+#   c.rollup(["year", "month"])          # n, sumas y medias por mes
+#   c.cuantil("return", 0.5, filtro={"gap": ["0% - 40%"]})   # mediana (sketch)
+#
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+import cuantiles
+
+
+@dataclass(frozen=True)
+class Bins:
+    """Tramos de pd.cut(valor(df), bins, labels, include_lowest=True, right=right)."""
+    valor: object  # df -> Series numérica
+    bins: tuple
+    labels: tuple
+    right: bool = True
+
+    def codigos(self, df: pd.DataFrame) -> np.ndarray:
+        """Código de tramo por fila (-1 = fuera de tramos o nulo), idéntico a pd.cut."""
+        cat = pd.cut(self.valor(df), bins=list(self.bins), labels=list(self.labels), include_lowest=True, right=self.right)
+        return np.asarray(cat.cat.codes, dtype=np.int16)
+
+
+def _minutos(col: str, desde_min: int):
+    def f(df):
+        t = pd.to_datetime(df[col], format="%H:%M", errors="coerce")
+        return (t.dt.hour * 60 + t.dt.minute) - desde_min
+    return f
+
+
+_GAP_BINS = (0, 40, 60, 80, 100, 150, 200, 250, 300, 400, 99999)
+_GAP_LABELS = ("0% - 40%", "40% - 60%", "60% - 80%", "80% - 100%", "100% - 150%", "150% - 200%",
+               "200% - 250%", "250% - 300%", "300% - 400%", ">400%")
+_SPIKE_BINS = (0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 9999)
+_RTH_BINS = tuple(range(0, 390 + 30, 30))
+_RTH_LABELS = ("09:30-10:00 ", "10:00-10:30 ", "10:30-11:00 ", "11:00-11:30 ", "11:30-12:00 ", "12:00-12:30 ",
+               "12:30-13:00 ", "13:00-13:30 ", "13:30-14:00 ", "14:00-14:30 ", "14:30-15:00 ", "15:00-15:30 ",
+               "15:30-16:00 ")
+
+# Dimensiones en tramos (además de year / month)
+DIMENSIONES = {
+    "precio": Bins(lambda df: df["Open Price"], (0, 1, 3, 5, 10, 9999),
+                   ("0 - 1 $ ", "1 - 3 $ ", "3 - 5 $ ", "5 - 10 $ ", "> 10 $ ")),
+    "gap": Bins(lambda df: df["Open Gap %"] * 100, _GAP_BINS, _GAP_LABELS),
+    "pmh": Bins(_minutos("PM High Time", 4 * 60), tuple(range(0, 330 + 30, 30)),
+                ("04:00-04:30 ", "04:30-05:00 ", "05:00-05:30 ", "05:30-06:00 ", "06:00-06:30 ", "06:30-07:00 ",
+                 "07:00-07:30 ", "07:30-08:00 ", "08:00-08:30 ", "08:30-09:00 ", "09:00-09:30 "), right=False),
+}
+DIMS = ("year", "month") + tuple(DIMENSIONES)
+
+# Histogramas por celda (mismos bins y etiquetas que cada grafico_*_distribution)
+HISTOGRAMAS = {
+    "return": Bins(lambda df: df["Day Return %"] * 100, (-100, -80, -60, -40, -20, 0, 20, 40, 60, 80, 100, 9999),
+                   ("-100% a -80%", "-80% a -60%", "-60% a -40%", "-40% a -20%", "-20% a 0%", "0% a 20%",
+                    "20% a 40%", "40% a 60%", "60% a 80%", "80% a 100%", ">100%")),
+    "highspike": Bins(lambda df: df["High Spike %"] * 100, _SPIKE_BINS,
+                      ("0% - 10% ", "10% - 20% ", "20% - 30% ", "30% - 40% ", "40% - 50% ", "50% - 60% ",
+                       "60% - 70% ", "70% - 80% ", "80% - 90% ", "90% - 100% ", ">100% ")),
+    "lowspike": Bins(lambda df: (df["Low Spike %"] * -100).abs(), _SPIKE_BINS,
+                     ("0% - 10% ", "10% - 20% ", "20% - 30% ", "30% - 40% ", "40% - 50% ", "50% - 60% ",
+                      "60% - 70% ", "70% - 80% ", "80% - 90% ", "90% - 100% ", "=100% ")),
+    "fade": Bins(lambda df: df["RTH Fade to Close %"] * 100, (-100, -90, -80, -70, -60, -50, -40, -30, -20, -10, 0),
+                 ("-100% a -90%", "-90% a -80%", "-80% a -70%", "-70% a -60%", "-60% a -50%", "-50% a -40%",
+                  "-40% a -30%", "-30% a -20%", "-20% a -10%", "-10% a 0%")),
+    "pmh_gap": Bins(lambda df: df["PMH Gap %"] * 100, _GAP_BINS, _GAP_LABELS),
+    "pmh_fade": Bins(lambda df: df["PMH Fade to Open %"] * 100, (-100, -60, -50, -40, -30, -25, -20, -15, -10, -5, 0),
+                     ("-100% a -60% ", "-60% a -50% ", "-50% a -40% ", "-40% a -30% ", "-30% a -25% ",
+                      "-25% a -20% ", "-20% a -15% ", "-15% a -10% ", "-10% a -5% ", "-5% a 0% "), right=False),
+    "hod": Bins(_minutos("HOD Time", 9 * 60 + 30), _RTH_BINS, _RTH_LABELS),
+    "lod": Bins(_minutos("LOD Time", 9 * 60 + 30), _RTH_BINS, _RTH_LABELS),
+}
+
+# Métricas con conteo de no nulos (n_) y suma (s_) por celda: media = s_ / n_
+# (columna del frame o función df -> Series; hod / lod en minutos desde las 09:30)
+MEDIDAS = {
+    "return": "Day Return %", "highspike": "High Spike %", "lowspike": "Low Spike %", "range": "RTH Range %",
+    "gap": "Open Gap %", "pmh_gap": "PMH Gap %", "pmh_fade": "PMH Fade to Open %",
+    "rth_fade": "RTH Fade to Close %", "volumen": "EOD Volume", "pm_volumen": "Premarket Volume",
+    "hod": _minutos("HOD Time", 9 * 60 + 30), "lod": _minutos("LOD Time", 9 * 60 + 30),
+}
+
+# Sketches de cuantiles por celda (cuantiles.py): medianas / percentiles de
+# cualquier filtro con error relativo <= cuantiles.ALPHA. Mismas escalas que fig_3.
+CUANTILES = {
+    "return": lambda df: df["Day Return %"] * 100, "highspike": lambda df: df["High Spike %"] * 100,
+    "lowspike": lambda df: df["Low Spike %"] * 100, "range": lambda df: df["RTH Range %"] * 100,
+    "gap": lambda df: df["Open Gap %"] * 100,
+    "hod": _minutos("HOD Time", 9 * 60 + 30), "lod": _minutos("LOD Time", 9 * 60 + 30),
+}
+
+
+def _numerico(df: pd.DataFrame, valor) -> np.ndarray:
+    x = valor(df) if callable(valor) else df[valor]
+    return pd.to_numeric(x, errors="coerce").to_numpy(dtype=np.float64)
+
+
+def codigos_dims(df: pd.DataFrame) -> pd.DataFrame:
+    """Códigos de DIMS por fila de df (year, month y tramos; -1 = sin tramo)."""
+    fechas = pd.to_datetime(df["Date"])
+    out = {"year": fechas.dt.year.to_numpy(dtype=np.int64), "month": fechas.dt.month.to_numpy(dtype=np.int64)}
+    for nombre, b in DIMENSIONES.items():
+        out[nombre] = b.codigos(df).astype(np.int64)
+    return pd.DataFrame(out)
+
+
+def _codigo(dim: str, valor) -> int:
+    if dim in DIMENSIONES and isinstance(valor, str):
+        return DIMENSIONES[dim].labels.index(valor)
+    return int(valor)
+
+
+def mascara(tabla: pd.DataFrame, filtro: dict) -> np.ndarray:
+    """Filas de tabla (columnas DIMS) que cumplen filtro = {dimensión: valores (códigos o etiquetas)}."""
+    out = np.ones(len(tabla), dtype=bool)
+    for dim, valores in (filtro or {}).items():
+        if dim not in DIMS:
+            raise KeyError(f"dimensión desconocida: {dim} (hay: {', '.join(DIMS)})")
+        valores = [valores] if np.isscalar(valores) else valores
+        out &= tabla[dim].isin([_codigo(dim, v) for v in valores]).to_numpy()
+    return out
+
+
+def asignar_celdas(codigos: pd.DataFrame) -> tuple:
+    """(DIMS de cada celda no vacía, celda de cada fila) a partir de codigos_dims()."""
+    codigos = {d: v.to_numpy() for d, v in codigos.items()}
+    n = len(codigos["year"])
+    # Celda de cada fila: clave combinada de las dimensiones (+1: el código -1 también es celda)
+    forma = [int(codigos["year"].max() - codigos["year"].min() + 1) if n else 1, 13] + \
+            [len(b.labels) + 1 for b in DIMENSIONES.values()]
+    base = codigos["year"].min() if n else 0
+    clave = np.ravel_multi_index(
+        [codigos["year"] - base, codigos["month"]] + [codigos[d] + 1 for d in DIMENSIONES], forma
+    )
+    unicas, celda = np.unique(clave, return_inverse=True)
+    primera = np.zeros(len(unicas), dtype=np.int64)
+    primera[celda[::-1]] = np.arange(len(celda))[::-1]  # una fila representante por celda
+    dims = pd.DataFrame({d: codigos[d][primera].astype(np.int16 if d != "year" else np.int32) for d in DIMS})
+    return dims, celda
+
+
+def _columnas_hist(nombre: str) -> list:
+    return [f"h_{nombre}_{i}" for i in range(len(HISTOGRAMAS[nombre].labels))]
+
+
+class Cubo:
+    """Celdas no vacías del cubo: columnas DIMS (códigos; -1 = sin tramo) + medidas sumables.
+
+    sketches: tramos de cuantiles en formato largo (metrica, celda, signo, k, n),
+    donde celda es la posición en celdas y metrica la de CUANTILES.
+    """
+
+    def __init__(self, celdas: pd.DataFrame, sketches: pd.DataFrame = None):
+        self.celdas = celdas
+        self.sketches = sketches
+
+    @classmethod
+    def construir(cls, df: pd.DataFrame) -> "Cubo":
+        dims, celda = asignar_celdas(codigos_dims(df))
+        n_celdas = len(dims)
+
+        out = dims.to_dict("series")
+        out["n"] = np.bincount(celda, minlength=n_celdas)
+        rojo = (df["Day Return %"] < 0).to_numpy()
+        out["n_rojo"] = np.bincount(celda, weights=rojo, minlength=n_celdas).astype(np.int64)
+        for nombre, col in MEDIDAS.items():
+            x = _numerico(df, col)
+            ok = ~np.isnan(x)
+            out[f"n_{nombre}"] = np.bincount(celda[ok], minlength=n_celdas)
+            out[f"s_{nombre}"] = np.bincount(celda[ok], weights=x[ok], minlength=n_celdas)
+        for nombre, b in HISTOGRAMAS.items():
+            cod = b.codigos(df)
+            ok = cod >= 0
+            k = len(b.labels)
+            h = np.bincount(celda[ok] * k + cod[ok], minlength=n_celdas * k).reshape(n_celdas, k)
+            for i, col in enumerate(_columnas_hist(nombre)):
+                out[col] = h[:, i]
+        sketches = cuantiles.tabla(celda, {n: _numerico(df, v) for n, v in CUANTILES.items()})
+        return cls(pd.DataFrame(out), sketches)
+
+    # --------------------------
+    # Consulta
+    # --------------------------
+    @staticmethod
+    def etiquetas(dim: str) -> list:
+        if dim in DIMENSIONES:
+            return list(DIMENSIONES[dim].labels)
+        if dim in HISTOGRAMAS:
+            return list(HISTOGRAMAS[dim].labels)
+        raise KeyError(dim)
+
+    def _mascara(self, filtro: dict) -> np.ndarray:
+        return mascara(self.celdas, filtro)
+
+    def filtrar(self, filtro: dict = None) -> pd.DataFrame:
+        """Celdas que cumplen filtro = {dimensión: valores (códigos o etiquetas)}."""
+        return self.celdas[self._mascara(filtro)] if filtro else self.celdas
+
+    def rollup(self, por: list, filtro: dict = None) -> pd.DataFrame:
+        """Suma de medidas por las dimensiones de por (+ medias m_<medida> y pct_rojo)."""
+        c = self.filtrar(filtro)
+        medidas = [col for col in c.columns if col not in DIMS]
+        out = c.groupby(list(por), sort=True)[medidas].sum().reset_index() if por else c[medidas].sum().to_frame().T
+        for nombre in MEDIDAS:
+            out[f"m_{nombre}"] = out[f"s_{nombre}"] / out[f"n_{nombre}"].where(out[f"n_{nombre}"] > 0)
+        out["pct_rojo"] = out["n_rojo"] / out["n"].where(out["n"] > 0) * 100
+        return out
+
+    def distribucion(self, nombre: str, filtro: dict = None) -> pd.Series:
+        """Conteos por tramo (índice = etiquetas) de un histograma o de una dimensión en tramos."""
+        c = self.filtrar(filtro)
+        etiquetas = self.etiquetas(nombre)
+        if nombre in HISTOGRAMAS:
+            valores = c[_columnas_hist(nombre)].sum().to_numpy()
+        else:
+            codigos = c[nombre].to_numpy()
+            ok = codigos >= 0
+            valores = np.bincount(codigos[ok], weights=c["n"].to_numpy()[ok], minlength=len(etiquetas)).astype(np.int64)
+        return pd.Series(valores, index=pd.CategoricalIndex(etiquetas, categories=etiquetas), name="count")
+
+    def cuantil(self, nombre: str, q=0.5, filtro: dict = None):
+        """Cuantil(es) q de una métrica de CUANTILES sobre las celdas del filtro (fusionando sketches)."""
+        t = self.sketches
+        t = t[t["metrica"].to_numpy() == list(CUANTILES).index(nombre)]
+        if filtro:
+            t = t[self._mascara(filtro)[t["celda"].to_numpy()]]
+        return cuantiles.cuantil(t, q)
@@ -9,24 +9,13 @@ import plotly.graph_objects as go
 import dash_bootstrap_components as dbc
 import numpy as np
 import pandas as pd
+import os
+import sys
+import flask
 
-
-# -------------------------------------------------------------
-# CARGA DE DATOS
-# -------------------------------------------------------------
-
-stocks = pd.read_csv("https://raw.githubusercontent.com/AlexSanGar/dash/refs/heads/main/data_completa.csv")
-stocks = stocks[~((stocks["Date"] == "2022-02-18") & (stocks["Ticker"] == "QNGY"))]
-stocks['Date'] = pd.to_datetime(stocks['Date'], errors='coerce')
-stocks_v1 = stocks.copy()
-
-stocks_v1['Period'] = stocks_v1['Date'].dt.year
-stocks_v1['Month'] = stocks_v1['Date'].dt.month
-stocks_v1['Week'] = stocks_v1['Date'].dt.isocalendar().week
-
-
-
-
+import mem_report as mem
+import perf_metrics as perf
+import shared_frames as shared
 
 
 # -------------------------------------------------------------
@@ -62,206 +51,255 @@ def filtrar_smallcaps(df):
     return df[filtros].copy()
 
 
-stocks_filtrados = filtrar_smallcaps(stocks_v1)
+def format_value(v):
+    if isinstance(v, str) and ":" in v:
+        return v
+    return f"<span style='color:#00cc96'>{v}%</span>" if v >= 0 else f"<span style='color:#ef553b'>{v}%</span>"
+
 
 
+# -------------------------------------------------------------
+# CARGA DE DATOS
+# -------------------------------------------------------------
 
+# Con varios workers (gunicorn -w N dashboard:server) un proceso cargador publica
+# una vez datasets y agregados (python dashboard.py --publish DIR) y cada worker
+# arranca con SMALLCAPS_SHARED_DIR=DIR: se adjunta a ellos por mmap, sin
+# descargar, agregar ni copiar nada.
+SHARED_DIR = os.environ.get("SMALLCAPS_SHARED_DIR")
 
 
+def calcular_datos():
+    """Descarga y agrega todo lo que usan los gráficos; devuelve {nombre: valor}."""
+
+    with perf.medir("carga stocks", tipo="carga") as _m:
+        stocks = pd.read_csv("https://raw.githubusercontent.com/AlexSanGar/dash/refs/heads/main/data_completa.csv")
+        _m["filas"] = len(stocks)
+    stocks = stocks[~((stocks["Date"] == "2022-02-18") & (stocks["Ticker"] == "QNGY"))]
+    stocks['Date'] = pd.to_datetime(stocks['Date'], errors='coerce')
+    stocks_v1 = stocks.copy()
+
+    stocks_v1['Period'] = stocks_v1['Date'].dt.year
+    stocks_v1['Month'] = stocks_v1['Date'].dt.month
+    stocks_v1['Week'] = stocks_v1['Date'].dt.isocalendar().week
+
+    with perf.medir("carga intradía", tipo="carga") as _m:
+        intraday_df = pd.read_csv("https://raw.githubusercontent.com/AlexSanGar/dash/refs/heads/main/data_15min.csv")
+        _m["filas"] = len(intraday_df)
+
+    stocks_filtrados = filtrar_smallcaps(stocks_v1)
+
+
+    # -------------------------------------------------------------
+    # MÉTRICAS BASE
+    # -------------------------------------------------------------
+
+    # Para fig_1 (acciones por mes)
+    monthly_counts = (stocks_filtrados.groupby(['Period', 'Month']).size().reset_index(name='Stocks'))
+    monthly_counts['YearMonth'] = (monthly_counts['Period'].astype(str) + "-" + monthly_counts['Month'].astype(str).str.zfill(2))
+    monthly_counts = monthly_counts.sort_values(['Period', 'Month'])
+    monthly_counts = monthly_counts.sort_values("YearMonth")
+    monthly_counts["SMA_6"] = monthly_counts["Stocks"].rolling(window=6).mean()
+
+
+    #Para fig_1 (total volumen)
+    monthly_volume = (stocks_filtrados.groupby(["Period","Month"])["EOD Volume"].sum().reset_index())
+    monthly_volume["YearMonth"] = (monthly_volume["Period"].astype(str)+ "-" +monthly_volume["Month"].astype(str).str.zfill(2))
+    monthly_volume = monthly_volume.sort_values("YearMonth")
+    monthly_volume["SMA_6"] = monthly_volume["EOD Volume"].rolling(6).mean()
+
+    #Para fig_1 (gap value)
+
+    monthly_gap = (stocks_filtrados.groupby(["Period", "Month"])["Open Gap %"].mean().reset_index())
+    monthly_gap["YearMonth"] = (monthly_gap["Period"].astype(str) + "-" + monthly_gap["Month"].astype(str).str.zfill(2))
+    monthly_gap["Gap (%)"] = (monthly_gap["Open Gap %"] * 100).round(2)
+    monthly_gap = monthly_gap.sort_values("YearMonth")
+    monthly_gap["SMA_6"] = monthly_gap["Gap (%)"].rolling(6).mean()
+
+    #Para fig_1 (high spike)
+    monthly_highspike = (stocks_filtrados.groupby(['Period', 'Month'])['High Spike %'].mean().reset_index())
+    monthly_highspike['YearMonth'] = (monthly_highspike['Period'].astype(str) + "-" + monthly_highspike['Month'].astype(str).str.zfill(2))
+    monthly_highspike['High Spike (%)'] = (monthly_highspike['High Spike %'] * 100).round(2)
+    monthly_highspike = monthly_highspike.sort_values("YearMonth")
+    monthly_highspike['SMA_6'] = monthly_highspike['High Spike (%)'].rolling(6).mean()
+
+    #Para fig_1 (low spike)
+    monthly_lowspike = (stocks_filtrados.groupby(['Period', 'Month'])['Low Spike %'].mean().reset_index())
+    monthly_lowspike['YearMonth'] = (monthly_lowspike['Period'].astype(str) + "-" + monthly_lowspike['Month'].astype(str).str.zfill(2))
+    monthly_lowspike['Low Spike (%)'] = (monthly_lowspike['Low Spike %'] * 100).round(2)
+    monthly_lowspike = monthly_lowspike.sort_values("YearMonth")
+    monthly_lowspike['SMA_6'] = monthly_lowspike['Low Spike (%)'].rolling(6).mean()
+
+    #Para fig_1 (range)
+    monthly_range = (stocks_filtrados.groupby(['Period', 'Month'])['RTH Range %'].mean().reset_index())
+    monthly_range['YearMonth'] = (monthly_range['Period'].astype(str) + "-" + monthly_range['Month'].astype(str).str.zfill(2))
+    monthly_range['Range (%)'] = (monthly_range['RTH Range %'] * 100).round(2)
+    monthly_range = monthly_range.sort_values("YearMonth")
+    monthly_range['SMA_6'] = monthly_range['Range (%)'].rolling(6).mean()
+
+    #Para fig_1 (close red)
+    monthly_closered = (stocks_filtrados.assign(close_red = stocks_filtrados["Day Return %"] < 0).groupby(['Period','Month'])['close_red'].mean().reset_index())
+    monthly_closered['YearMonth'] = (monthly_closered['Period'].astype(str) + "-" + monthly_closered['Month'].astype(str).str.zfill(2))
+    monthly_closered['Close Red (%)'] = (monthly_closered['close_red'] * 100).round(2)
+    monthly_closered = monthly_closered.sort_values("YearMonth")
+    monthly_closered['SMA_6'] = monthly_closered['Close Red (%)'].rolling(6).mean()
+
+
+    # PARA fig_2 (negativos vs positivos)
+    total = len(stocks_filtrados)
+    neg_count = (stocks_filtrados['Day Return %'] < 0).sum()
+    pos_count = total - neg_count
+
+    neg_pct = round(neg_count / total * 100, 2)
+    pos_pct = round(100 - neg_pct, 2)
+
+    #Para fig (negativos vs positivos Fade de Pre-market)
+    total_1 = len(stocks_filtrados)
+    neg_count_1 = (stocks_filtrados['PMH Fade to Open %'] < -0.15).sum()
+    pos_count_1 = total_1 - neg_count_1
+
+    neg_pct_1 = round(neg_count_1 / total_1 * 100, 2)
+    pos_pct_1 = round(100 - neg_pct_1, 2)
+
+
+    # Para fig_3 (tabla avg/median)
+    stocks_filtrados_1 = filtrar_smallcaps(stocks)
+
+    avg_return = round(stocks_filtrados_1['Day Return %'].mean()*100,2)
+    avg_open_gap = round(stocks_filtrados_1['Open Gap %'].mean()*100,2)
+    avg_high_spike = round(stocks_filtrados_1['High Spike %'].mean()*100,2)
+    avg_low_spike = round(stocks_filtrados_1['Low Spike %'].mean()*100,2)
+    avg_range = round(stocks_filtrados_1['RTH Range %'].mean()*100,2)
+
+    stocks_filtrados_1['HOD Time'] = pd.to_datetime(stocks_filtrados_1['HOD Time'], format="%H:%M", errors='coerce')
+    stocks_filtrados_1['HOD_horario'] = stocks_filtrados_1['HOD Time'].dt.hour * 3600 + stocks_filtrados_1['HOD Time'].dt.minute * 60
+    mean_seconds = stocks_filtrados_1['HOD_horario'].mean()
+    avg_hod_time = f"{int(mean_seconds//3600):02d}:{int((mean_seconds%3600)//60):02d}"
+
+    stocks_filtrados_1['LOD Time'] = pd.to_datetime(stocks_filtrados_1['LOD Time'], format="%H:%M", errors='coerce')
+    stocks_filtrados_1['LOD_horario'] = stocks_filtrados_1['LOD Time'].dt.hour * 3600 + stocks_filtrados_1['LOD Time'].dt.minute * 60
+    mean_seconds = stocks_filtrados_1['LOD_horario'].mean()
+    avg_lod_time = f"{int(mean_seconds//3600):02d}:{int((mean_seconds%3600)//60):02d}"
+
+    median_return = round(stocks_filtrados_1['Day Return %'].median()*100,2)
+    median_open_gap = round(stocks_filtrados_1['Open Gap %'].median()*100,2)
+    median_high_spike = round(stocks_filtrados_1['High Spike %'].median()*100,2)
+    median_low_spike = round(stocks_filtrados_1['Low Spike %'].median()*100,2)
+    median_range = round(stocks_filtrados_1['RTH Range %'].median()*100,2)
+
+    stocks_filtrados_1['HOD_horario'] = stocks_filtrados_1['HOD Time'].dt.hour * 3600 + stocks_filtrados_1['HOD Time'].dt.minute * 60
+    mean_seconds = stocks_filtrados_1['HOD_horario'].median()
+    median_hod_time = f"{int(mean_seconds//3600):02d}:{int((mean_seconds%3600)//60):02d}"
+
+    stocks_filtrados_1['LOD_horario'] = stocks_filtrados_1['LOD Time'].dt.hour * 3600 + stocks_filtrados_1['LOD Time'].dt.minute * 60
+    mean_seconds = stocks_filtrados_1['LOD_horario'].median()
+    median_lod_time = f"{int(mean_seconds//3600):02d}:{int((mean_seconds%3600)//60):02d}"
+
+
+    metrics = ["High Spike", "Low Spike", "Return", "Gap at open", "RTH Range", "HOD Time", "LOD Time"]
+    avg_values = [
+        format_value(avg_high_spike), format_value(avg_low_spike), format_value(avg_return),
+        format_value(avg_open_gap), format_value(avg_range),
+        avg_hod_time, avg_lod_time
+    ]
+    median_values = [
+        format_value(median_high_spike), format_value(median_low_spike), format_value(median_return),
+        format_value(median_open_gap), format_value(median_range),
+        median_hod_time, median_lod_time
+    ]
 
-# -------------------------------------------------------------
-# MÉTRICAS BASE
-# -------------------------------------------------------------
 
-# Para fig_1 (acciones por mes)
-monthly_counts = (stocks_filtrados.groupby(['Period', 'Month']).size().reset_index(name='Stocks'))
-monthly_counts['YearMonth'] = (monthly_counts['Period'].astype(str) + "-" + monthly_counts['Month'].astype(str).str.zfill(2))
-monthly_counts = monthly_counts.sort_values(['Period', 'Month'])
-monthly_counts = monthly_counts.sort_values("YearMonth")
-monthly_counts["SMA_6"] = monthly_counts["Stocks"].rolling(window=6).mean()
-
-
-#Para fig_1 (total volumen)
-monthly_volume = (stocks_filtrados.groupby(["Period","Month"])["EOD Volume"].sum().reset_index())
-monthly_volume["YearMonth"] = (monthly_volume["Period"].astype(str)+ "-" +monthly_volume["Month"].astype(str).str.zfill(2))
-monthly_volume = monthly_volume.sort_values("YearMonth")
-monthly_volume["SMA_6"] = monthly_volume["EOD Volume"].rolling(6).mean()
-
-#Para fig_1 (gap value)
-
-monthly_gap = (stocks_filtrados.groupby(["Period", "Month"])["Open Gap %"].mean().reset_index())
-monthly_gap["YearMonth"] = (monthly_gap["Period"].astype(str) + "-" + monthly_gap["Month"].astype(str).str.zfill(2))
-monthly_gap["Gap (%)"] = (monthly_gap["Open Gap %"] * 100).round(2)
-monthly_gap = monthly_gap.sort_values("YearMonth")
-monthly_gap["SMA_6"] = monthly_gap["Gap (%)"].rolling(6).mean()
-
-#Para fig_1 (high spike)
-monthly_highspike = (stocks_filtrados.groupby(['Period', 'Month'])['High Spike %'].mean().reset_index())
-monthly_highspike['YearMonth'] = (monthly_highspike['Period'].astype(str) + "-" + monthly_highspike['Month'].astype(str).str.zfill(2))
-monthly_highspike['High Spike (%)'] = (monthly_highspike['High Spike %'] * 100).round(2)
-monthly_highspike = monthly_highspike.sort_values("YearMonth")
-monthly_highspike['SMA_6'] = monthly_highspike['High Spike (%)'].rolling(6).mean()
-
-#Para fig_1 (low spike)
-monthly_lowspike = (stocks_filtrados.groupby(['Period', 'Month'])['Low Spike %'].mean().reset_index())
-monthly_lowspike['YearMonth'] = (monthly_lowspike['Period'].astype(str) + "-" + monthly_lowspike['Month'].astype(str).str.zfill(2))
-monthly_lowspike['Low Spike (%)'] = (monthly_lowspike['Low Spike %'] * 100).round(2)
-monthly_lowspike = monthly_lowspike.sort_values("YearMonth")
-monthly_lowspike['SMA_6'] = monthly_lowspike['Low Spike (%)'].rolling(6).mean()
-
-#Para fig_1 (range)
-monthly_range = (stocks_filtrados.groupby(['Period', 'Month'])['RTH Range %'].mean().reset_index())
-monthly_range['YearMonth'] = (monthly_range['Period'].astype(str) + "-" + monthly_range['Month'].astype(str).str.zfill(2))
-monthly_range['Range (%)'] = (monthly_range['RTH Range %'] * 100).round(2)
-monthly_range = monthly_range.sort_values("YearMonth")
-monthly_range['SMA_6'] = monthly_range['Range (%)'].rolling(6).mean()
-
-#Para fig_1 (close red)
-monthly_closered = (stocks_filtrados.assign(close_red = stocks_filtrados["Day Return %"] < 0).groupby(['Period','Month'])['close_red'].mean().reset_index())
-monthly_closered['YearMonth'] = (monthly_closered['Period'].astype(str) + "-" + monthly_closered['Month'].astype(str).str.zfill(2))
-monthly_closered['Close Red (%)'] = (monthly_closered['close_red'] * 100).round(2)
-monthly_closered = monthly_closered.sort_values("YearMonth")
-monthly_closered['SMA_6'] = monthly_closered['Close Red (%)'].rolling(6).mean()
-
-
-# PARA fig_2 (negativos vs positivos)
-total = len(stocks_filtrados)
-neg_count = (stocks_filtrados['Day Return %'] < 0).sum()
-pos_count = total - neg_count
-
-neg_pct = round(neg_count / total * 100, 2)
-pos_pct = round(100 - neg_pct, 2)
-
-#Para fig (negativos vs positivos Fade de Pre-market)
-total_1 = len(stocks_filtrados)
-neg_count_1 = (stocks_filtrados['PMH Fade to Open %'] < -0.15).sum()
-pos_count_1 = total_1 - neg_count_1
-
-neg_pct_1 = round(neg_count_1 / total_1 * 100, 2)
-pos_pct_1 = round(100 - neg_pct_1, 2)
-
-
-# Para fig_3 (tabla avg/median)
-stocks_filtrados_1 = filtrar_smallcaps(stocks)
-
-avg_return = round(stocks_filtrados_1['Day Return %'].mean()*100,2)
-avg_open_gap = round(stocks_filtrados_1['Open Gap %'].mean()*100,2)
-avg_high_spike = round(stocks_filtrados_1['High Spike %'].mean()*100,2)
-avg_low_spike = round(stocks_filtrados_1['Low Spike %'].mean()*100,2)
-avg_range = round(stocks_filtrados_1['RTH Range %'].mean()*100,2)
-
-stocks_filtrados_1['HOD Time'] = pd.to_datetime(stocks_filtrados_1['HOD Time'], format="%H:%M", errors='coerce')
-stocks_filtrados_1['HOD_horario'] = stocks_filtrados_1['HOD Time'].dt.hour * 3600 + stocks_filtrados_1['HOD Time'].dt.minute * 60
-mean_seconds = stocks_filtrados_1['HOD_horario'].mean()
-avg_hod_time = f"{int(mean_seconds//3600):02d}:{int((mean_seconds%3600)//60):02d}"
-
-stocks_filtrados_1['LOD Time'] = pd.to_datetime(stocks_filtrados_1['LOD Time'], format="%H:%M", errors='coerce')
-stocks_filtrados_1['LOD_horario'] = stocks_filtrados_1['LOD Time'].dt.hour * 3600 + stocks_filtrados_1['LOD Time'].dt.minute * 60
-mean_seconds = stocks_filtrados_1['LOD_horario'].mean()
-avg_lod_time = f"{int(mean_seconds//3600):02d}:{int((mean_seconds%3600)//60):02d}"
-
-median_return = round(stocks_filtrados_1['Day Return %'].median()*100,2)
-median_open_gap = round(stocks_filtrados_1['Open Gap %'].median()*100,2)
-median_high_spike = round(stocks_filtrados_1['High Spike %'].median()*100,2)
-median_low_spike = round(stocks_filtrados_1['Low Spike %'].median()*100,2)
-median_range = round(stocks_filtrados_1['RTH Range %'].median()*100,2)
-
-stocks_filtrados_1['HOD_horario'] = stocks_filtrados_1['HOD Time'].dt.hour * 3600 + stocks_filtrados_1['HOD Time'].dt.minute * 60
-mean_seconds = stocks_filtrados_1['HOD_horario'].median()
-median_hod_time = f"{int(mean_seconds//3600):02d}:{int((mean_seconds%3600)//60):02d}"
-
-stocks_filtrados_1['LOD_horario'] = stocks_filtrados_1['LOD Time'].dt.hour * 3600 + stocks_filtrados_1['LOD Time'].dt.minute * 60
-mean_seconds = stocks_filtrados_1['LOD_horario'].median()
-median_lod_time = f"{int(mean_seconds//3600):02d}:{int((mean_seconds%3600)//60):02d}"
+    #Para PMH Gap value
+    if "PMH Gap %" not in stocks_filtrados.columns:
+        raise KeyError("La columna 'PMH Gap %' no existe en stocks_filtrados")
 
-def format_value(v):
-    if isinstance(v, str) and ":" in v:
-        return v
-    return f"<span style='color:#00cc96'>{v}%</span>" if v >= 0 else f"<span style='color:#ef553b'>{v}%</span>"
+    monthly_gap = (
+        stocks_filtrados
+        .assign(**{"PMH Gap %": pd.to_numeric(stocks_filtrados["PMH Gap %"], errors="coerce")})
+        .groupby(["Period", "Month"], as_index=False)
+        .agg(PMH_Gap_Mean=("PMH Gap %", "mean"))
+    )
 
+    monthly_gap["YearMonth_dt"] = pd.to_datetime(monthly_gap["Period"].astype(str) + "-" + monthly_gap["Month"].astype(str).str.zfill(2) + "-01", format="%Y-%m-%d", errors="coerce")
+    monthly_gap = monthly_gap.sort_values("YearMonth_dt").reset_index(drop=True)
+    monthly_gap["Gap (%)"] = monthly_gap["PMH_Gap_Mean"] * 100
+    monthly_gap["SMA_6"] = monthly_gap["Gap (%)"].rolling(window=6, min_periods=1).mean()
+    monthly_gap["Gap (%)"] = monthly_gap["Gap (%)"].round(2)
+    monthly_gap["SMA_6"] = monthly_gap["SMA_6"].round(2)
+    monthly_gap["YearMonth"] = monthly_gap["YearMonth_dt"].dt.strftime("%Y-%m")
 
-metrics = ["High Spike", "Low Spike", "Return", "Gap at open", "RTH Range", "HOD Time", "LOD Time"]
-avg_values = [
-    format_value(avg_high_spike), format_value(avg_low_spike), format_value(avg_return),
-    format_value(avg_open_gap), format_value(avg_range),
-    avg_hod_time, avg_lod_time
-]
-median_values = [
-    format_value(median_high_spike), format_value(median_low_spike), format_value(median_return),
-    format_value(median_open_gap), format_value(median_range),
-    median_hod_time, median_lod_time
-]
-
-
-#Para PMH Gap value
-if "PMH Gap %" not in stocks_filtrados.columns:
-    raise KeyError("La columna 'PMH Gap %' no existe en stocks_filtrados")
-
-monthly_gap = (
-    stocks_filtrados
-    .assign(**{"PMH Gap %": pd.to_numeric(stocks_filtrados["PMH Gap %"], errors="coerce")})
-    .groupby(["Period", "Month"], as_index=False)
-    .agg(PMH_Gap_Mean=("PMH Gap %", "mean"))
-)
 
-monthly_gap["YearMonth_dt"] = pd.to_datetime(monthly_gap["Period"].astype(str) + "-" + monthly_gap["Month"].astype(str).str.zfill(2) + "-01", format="%Y-%m-%d", errors="coerce")
-monthly_gap = monthly_gap.sort_values("YearMonth_dt").reset_index(drop=True)
-monthly_gap["Gap (%)"] = monthly_gap["PMH_Gap_Mean"] * 100
-monthly_gap["SMA_6"] = monthly_gap["Gap (%)"].rolling(window=6, min_periods=1).mean()
-monthly_gap["Gap (%)"] = monthly_gap["Gap (%)"].round(2)
-monthly_gap["SMA_6"] = monthly_gap["SMA_6"].round(2)
-monthly_gap["YearMonth"] = monthly_gap["YearMonth_dt"].dt.strftime("%Y-%m")
-
-
-#Para PMH Fade to open
-if "PMH Fade to Open %" not in stocks_filtrados.columns:
-    raise KeyError("La columna 'PMH Fade to Open %' no existe en stocks_filtrados")
-
-df = stocks_filtrados.copy()
-df["PMH Fade to Open %"] = (df["PMH Fade to Open %"].astype(str).str.replace("%","", regex=False).str.replace(",", "", regex=False).str.strip())
-df["PMH Fade to Open %"] = pd.to_numeric(df["PMH Fade to Open %"], errors="coerce")
-monthly_fade = (df.groupby(["Period", "Month"], as_index=False).agg(PMH_Fade_Mean=("PMH Fade to Open %", "mean")))
-monthly_fade["YearMonth_dt"] = pd.to_datetime(
-    monthly_fade["Period"].astype(str) + "-" + monthly_fade["Month"].astype(str).str.zfill(2) + "-01",
-    format="%Y-%m-%d",
-    errors="coerce"
-)
-monthly_fade = monthly_fade.sort_values("YearMonth_dt").reset_index(drop=True)
-monthly_fade["Fade (%)"] = monthly_fade["PMH_Fade_Mean"] * 100
-monthly_fade["SMA_6"] = (monthly_fade["Fade (%)"].rolling(window=6, min_periods=1).mean())
-monthly_fade["Fade (%)"] = monthly_fade["Fade (%)"].round(2)
-monthly_fade["SMA_6"] = monthly_fade["SMA_6"].round(2)
-monthly_fade["YearMonth"] = monthly_fade["YearMonth_dt"].dt.strftime("%Y-%m")
-
-#Para Pm Volumen
-if "Premarket Volume" not in stocks_filtrados.columns:
-    raise KeyError("La columna 'PM Volume' no existe en stocks_filtrados")
-
-df = stocks_filtrados.copy()
-df["Premarket Volume"] = (df["Premarket Volume"].astype(str).str.replace(",", "", regex=False).str.strip())
-df["Premarket Volume"] = pd.to_numeric(df["Premarket Volume"], errors="coerce")
-monthly_pmv = (df.groupby(["Period", "Month"], as_index=False).agg(PMH_Volume_Total=("Premarket Volume", "sum")))
-monthly_pmv["YearMonth_dt"] = pd.to_datetime( monthly_pmv["Period"].astype(str) + "-" + monthly_pmv["Month"].astype(str).str.zfill(2) + "-01",format="%Y-%m-%d",errors="coerce")
-monthly_pmv = monthly_pmv.sort_values("YearMonth_dt").reset_index(drop=True)
-monthly_pmv["SMA_6"] = (monthly_pmv["PMH_Volume_Total"].rolling(window=6, min_periods=1).mean())
-monthly_pmv["PMH_Volume_Total"] = monthly_pmv["PMH_Volume_Total"].round(2)
-monthly_pmv["SMA_6"] = monthly_pmv["SMA_6"].round(2)
-monthly_pmv["YearMonth"] = monthly_pmv["YearMonth_dt"].dt.strftime("%Y-%m")
-
-#Para RTH Fade to Close
-if "RTH Fade to Close %" not in stocks_filtrados.columns:
-    raise KeyError("La columna 'RTH Fade to Close %' no existe en stocks_filtrados")
-
-df = stocks_filtrados.copy()
-df["RTH Fade to Close %"] = (df["RTH Fade to Close %"].astype(str).str.replace("%", "", regex=False).str.replace(",", "", regex=False).str.strip())
-df["RTH Fade to Close %"] = pd.to_numeric(df["RTH Fade to Close %"], errors="coerce")
-monthly_rth_fade = (df.groupby(["Period", "Month"], as_index=False).agg(RTH_Fade_Mean=("RTH Fade to Close %", "mean")))
-monthly_rth_fade["YearMonth_dt"] = pd.to_datetime(monthly_rth_fade["Period"].astype(str) + "-" + monthly_rth_fade["Month"].astype(str).str.zfill(2) + "-01", format="%Y-%m-%d",errors="coerce")
-monthly_rth_fade = monthly_rth_fade.sort_values("YearMonth_dt").reset_index(drop=True)
-monthly_rth_fade["Fade (%)"] = monthly_rth_fade["RTH_Fade_Mean"] * 100
-monthly_rth_fade["SMA_6"] = (monthly_rth_fade["Fade (%)"].rolling(window=6, min_periods=1).mean())
-monthly_rth_fade["Fade (%)"] = monthly_rth_fade["Fade (%)"].round(2)
-monthly_rth_fade["SMA_6"] = monthly_rth_fade["SMA_6"].round(2)
+    #Para PMH Fade to open
+    if "PMH Fade to Open %" not in stocks_filtrados.columns:
+        raise KeyError("La columna 'PMH Fade to Open %' no existe en stocks_filtrados")
+
+    df = stocks_filtrados.copy()
+    df["PMH Fade to Open %"] = (df["PMH Fade to Open %"].astype(str).str.replace("%","", regex=False).str.replace(",", "", regex=False).str.strip())
+    df["PMH Fade to Open %"] = pd.to_numeric(df["PMH Fade to Open %"], errors="coerce")
+    monthly_fade = (df.groupby(["Period", "Month"], as_index=False).agg(PMH_Fade_Mean=("PMH Fade to Open %", "mean")))
+    monthly_fade["YearMonth_dt"] = pd.to_datetime(
+        monthly_fade["Period"].astype(str) + "-" + monthly_fade["Month"].astype(str).str.zfill(2) + "-01",
+        format="%Y-%m-%d",
+        errors="coerce"
+    )
+    monthly_fade = monthly_fade.sort_values("YearMonth_dt").reset_index(drop=True)
+    monthly_fade["Fade (%)"] = monthly_fade["PMH_Fade_Mean"] * 100
+    monthly_fade["SMA_6"] = (monthly_fade["Fade (%)"].rolling(window=6, min_periods=1).mean())
+    monthly_fade["Fade (%)"] = monthly_fade["Fade (%)"].round(2)
+    monthly_fade["SMA_6"] = monthly_fade["SMA_6"].round(2)
+    monthly_fade["YearMonth"] = monthly_fade["YearMonth_dt"].dt.strftime("%Y-%m")
+
+    #Para Pm Volumen
+    if "Premarket Volume" not in stocks_filtrados.columns:
+        raise KeyError("La columna 'PM Volume' no existe en stocks_filtrados")
+
+    df = stocks_filtrados.copy()
+    df["Premarket Volume"] = (df["Premarket Volume"].astype(str).str.replace(",", "", regex=False).str.strip())
+    df["Premarket Volume"] = pd.to_numeric(df["Premarket Volume"], errors="coerce")
+    monthly_pmv = (df.groupby(["Period", "Month"], as_index=False).agg(PMH_Volume_Total=("Premarket Volume", "sum")))
+    monthly_pmv["YearMonth_dt"] = pd.to_datetime( monthly_pmv["Period"].astype(str) + "-" + monthly_pmv["Month"].astype(str).str.zfill(2) + "-01",format="%Y-%m-%d",errors="coerce")
+    monthly_pmv = monthly_pmv.sort_values("YearMonth_dt").reset_index(drop=True)
+    monthly_pmv["SMA_6"] = (monthly_pmv["PMH_Volume_Total"].rolling(window=6, min_periods=1).mean())
+    monthly_pmv["PMH_Volume_Total"] = monthly_pmv["PMH_Volume_Total"].round(2)
+    monthly_pmv["SMA_6"] = monthly_pmv["SMA_6"].round(2)
+    monthly_pmv["YearMonth"] = monthly_pmv["YearMonth_dt"].dt.strftime("%Y-%m")
+
+    #Para RTH Fade to Close
+    if "RTH Fade to Close %" not in stocks_filtrados.columns:
+        raise KeyError("La columna 'RTH Fade to Close %' no existe en stocks_filtrados")
+
+    df = stocks_filtrados.copy()
+    df["RTH Fade to Close %"] = (df["RTH Fade to Close %"].astype(str).str.replace("%", "", regex=False).str.replace(",", "", regex=False).str.strip())
+    df["RTH Fade to Close %"] = pd.to_numeric(df["RTH Fade to Close %"], errors="coerce")
+    monthly_rth_fade = (df.groupby(["Period", "Month"], as_index=False).agg(RTH_Fade_Mean=("RTH Fade to Close %", "mean")))
+    monthly_rth_fade["YearMonth_dt"] = pd.to_datetime(monthly_rth_fade["Period"].astype(str) + "-" + monthly_rth_fade["Month"].astype(str).str.zfill(2) + "-01", format="%Y-%m-%d",errors="coerce")
+    monthly_rth_fade = monthly_rth_fade.sort_values("YearMonth_dt").reset_index(drop=True)
+    monthly_rth_fade["Fade (%)"] = monthly_rth_fade["RTH_Fade_Mean"] * 100
+    monthly_rth_fade["SMA_6"] = (monthly_rth_fade["Fade (%)"].rolling(window=6, min_periods=1).mean())
+    monthly_rth_fade["Fade (%)"] = monthly_rth_fade["Fade (%)"].round(2)
+    monthly_rth_fade["SMA_6"] = monthly_rth_fade["SMA_6"].round(2)
+
+    # Solo lo que leen los gráficos: es lo que se publica en memoria compartida
+    return {
+        "stocks_filtrados": stocks_filtrados, "intraday_df": intraday_df,
+        "monthly_counts": monthly_counts, "monthly_volume": monthly_volume, "monthly_gap": monthly_gap,
+        "monthly_highspike": monthly_highspike, "monthly_lowspike": monthly_lowspike,
+        "monthly_range": monthly_range, "monthly_closered": monthly_closered, "monthly_fade": monthly_fade,
+        "monthly_pmv": monthly_pmv, "monthly_rth_fade": monthly_rth_fade,
+        "total": total, "neg_count": neg_count, "pos_count": pos_count, "neg_pct": neg_pct, "pos_pct": pos_pct,
+        "total_1": total_1, "neg_count_1": neg_count_1, "pos_count_1": pos_count_1,
+        "neg_pct_1": neg_pct_1, "pos_pct_1": pos_pct_1,
+        "metrics": metrics, "avg_values": avg_values, "median_values": median_values,
+    }
+
+
+if SHARED_DIR and shared.existe(SHARED_DIR):
+    _datos = None
+    globals().update(shared.adjuntar(SHARED_DIR))
+else:
+    _datos = calcular_datos()
+    globals().update(_datos)
+
 monthly_rth_fade["YearMonth"] = monthly_rth_fade["YearMonth_dt"].dt.strftime("%Y-%m")
 
 
@@ -799,7 +837,7 @@ def grafico_fade_distribution():
 #FIGURA AVG CHANGE FROM OPEN
 def grafico_intradia():
 
-    df = pd.read_csv("https://raw.githubusercontent.com/AlexSanGar/dash/refs/heads/main/data_15min.csv")
+    df = intraday_df.copy()
     df['date'] = pd.to_datetime(df['date'], format="%Y-%m-%d", errors="coerce").dt.date
 
     try:
@@ -1361,7 +1399,7 @@ def grafico_rth_fade_to_close_mes():
 #FIG AVG CHANGE FROM OPEN (PRE-MARKET)
 def grafico_premarket():
 
-    df = pd.read_csv("https://raw.githubusercontent.com/AlexSanGar/dash/refs/heads/main/data_15min.csv")
+    df = intraday_df.copy()
     df['date'] = pd.to_datetime(df['date'], format="%Y-%m-%d", errors="coerce").dt.date
 
     try:
@@ -1489,12 +1527,39 @@ def grafico_premarket():
 
 
 
+# Tiempo, filas y tamaño JSON de cada gráfico (perf_metrics)
+perf.instrumentar_modulo(globals(), ("grafico_", "crear_grafico_"))
+
+
 # -------------------------------------------------------------
 # DASHBOARD
 # -------------------------------------------------------------
 
 app = Dash(__name__, external_stylesheets=[dbc.themes.DARKLY])
 
+
+# Cada petición HTTP (p. ej. un callback) es una ejecución en perf_metrics
+@app.server.before_request
+def _perf_nueva_ejecucion():
+    perf.nueva_ejecucion()
+
+
+# Panel de rendimiento: /_perf (última ejecución) o /_perf?run=N
+@app.server.route("/_perf")
+def perf_endpoint():
+    return flask.jsonify(perf.como_dict(flask.request.args.get("run", type=int)))
+
+
+# Memoria por dataset / figura global: /_mem
+mem.registrar_modulo(sys.modules[__name__], "dashboard")
+
+
+@app.server.route("/_mem")
+def mem_endpoint():
+    informe = mem.informe()
+    return flask.jsonify({"totales": mem.totales(informe),
+                          "objetos": informe.astype(object).where(informe.notna(), None).to_dict(orient="records")})
+
 app.layout = dbc.Container(fluid=True, children=[
    
     dbc.Row([
@@ -1847,4 +1912,17 @@ def actualizar_pmh_metrics(metric):
 # -------------------------------------------------------------
 # RUN
 # -------------------------------------------------------------
-app.run(debug=True)
\ No newline at end of file
+# WSGI para varios workers: gunicorn -w 4 dashboard:server
+server = app.server
+
+if __name__ == "__main__":
+    import argparse
+    p = argparse.ArgumentParser(description="Dashboard smallcaps (Dash)")
+    p.add_argument("--publish", nargs="?", const=shared.DIR_DEFECTO, default=None, metavar="DIR",
+                   help="cargar y publicar datasets/agregados en memoria compartida para los workers y salir")
+    args = p.parse_args()
+    if args.publish:
+        version = shared.publicar(_datos if _datos is not None else calcular_datos(), args.publish)
+        print(f"publicado {args.publish}/{version}")
+    else:
+        app.run(debug=True)
\ No newline at end of file
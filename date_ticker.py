@@ -1,34 +1,99 @@
+import os
+import tempfile
+
+import numpy as np
 import streamlit as st
 import pandas as pd
 
+import merge_sessions as ms
+
+# Las exportaciones completas pesan cientos de MB: se leen por trozos y solo Date/Ticker
+CHUNK_ROWS = 200_000
+PREVIEW_ROWS = 200
+
+def extraer_date_ticker(fuente, destino, required_cols, chunksize=CHUNK_ROWS, n_muestra=PREVIEW_ROWS, seed=0):
+    """Copia required_cols de fuente a destino (CSV) en streaming.
+
+    Devuelve (filas_totales, muestra): la muestra es uniforme sobre todo el archivo
+    (reservoir sampling con claves aleatorias), así la vista previa no crece con el archivo.
+    """
+    rng = np.random.default_rng(seed)
+    total = 0
+    muestra = pd.DataFrame(columns=required_cols)
+    claves = np.zeros(0)
+    # Sin NA por defecto: "NA" es un ticker real (solo las celdas vacías son NA), como merge_sessions
+    lector = pd.read_csv(fuente, usecols=required_cols, chunksize=chunksize, keep_default_na=False, na_values=[""])
+    for i, chunk in enumerate(lector):
+        chunk = chunk[required_cols]
+        chunk.to_csv(destino, index=False, header=(i == 0))
+        total += len(chunk)
+
+        u = rng.random(len(chunk))
+        muestra = pd.concat([muestra, chunk], ignore_index=True) if len(muestra) else chunk.reset_index(drop=True)
+        claves = np.concatenate([claves, u])
+        if len(muestra) > n_muestra:
+            keep = np.argpartition(claves, n_muestra)[:n_muestra]
+            muestra, claves = muestra.iloc[keep].reset_index(drop=True), claves[keep]
+    return total, muestra
+
 st.title("Filtrar CSV: Date y Ticker")
 
-uploaded_file = st.file_uploader("Sube tu archivo CSV", type=["csv"])
+uploaded_files = st.file_uploader("Sube tu archivo CSV (varios para unirlos)", type=["csv"], accept_multiple_files=True)
+uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else None
+
+if len(uploaded_files) > 1:
+    # Varias listas: unir y deduplicar sesiones (ticker, date) con conteo por archivo
+    try:
+        with st.spinner("Uniendo sesiones…"):
+            merged = ms.merge_session_files(uploaded_files)
+    except ValueError as e:
+        st.error(str(e))
+    else:
+        st.write(f"{len(merged)} sesiones únicas de {int(merged['rows'].sum())} filas en {len(uploaded_files)} archivos.")
+        st.dataframe(merged.head(PREVIEW_ROWS))
+        st.download_button(
+            label="Descargar sesiones unidas (ticker, date)",
+            data=merged.to_csv(index=False).encode("utf-8"),
+            file_name="merged_sessions.csv",
+            mime="text/csv"
+        )
 
 if uploaded_file is not None:
-    # Leer CSV
-    df = pd.read_csv(uploaded_file)
+    # Leer solo la cabecera
+    columnas = list(pd.read_csv(uploaded_file, nrows=0).columns)
+    uploaded_file.seek(0)
 
     # Mostrar columnas disponibles
     st.write("Columnas detectadas en el archivo:")
-    st.write(list(df.columns))
+    st.write(columnas)
 
     # Verificar que existan Date y Ticker
     required_cols = ["Date", "Ticker"]
-    if all(col in df.columns for col in required_cols):
-        filtered_df = df[required_cols]
-
-        st.write("Vista previa del CSV filtrado:")
-        st.dataframe(filtered_df)
+    if all(col in columnas for col in required_cols):
+        # Cada rerun de Streamlit reutiliza la extracción del mismo archivo
+        cache = st.session_state.get("date_ticker")
+        if cache is None or cache["file_id"] != uploaded_file.file_id:
+            with st.spinner("Extrayendo Date y Ticker…"):
+                # La extracción escribe en disco por trozos; solo el resultado (dos columnas) queda en memoria
+                fd, path = tempfile.mkstemp(suffix=".csv", prefix="date_ticker_")
+                try:
+                    with os.fdopen(fd, "w", newline="", encoding="utf-8") as out:
+                        total, muestra = extraer_date_ticker(uploaded_file, out, required_cols)
+                    with open(path, "rb") as f:
+                        datos = f.read()
+                finally:
+                    os.remove(path)
+            cache = {"file_id": uploaded_file.file_id, "datos": datos, "total": total, "muestra": muestra}
+            st.session_state["date_ticker"] = cache
 
-        # Convertir a CSV para descarga
-        csv_bytes = filtered_df.to_csv(index=False).encode("utf-8")
+        st.write(f"Vista previa del CSV filtrado (muestra de {len(cache['muestra'])} de {cache['total']} filas):")
+        st.dataframe(cache["muestra"])
 
         st.download_button(
             label="Descargar CSV con Date y Ticker",
-            data=csv_bytes,
+            data=cache["datos"],
             file_name="filtered_date_ticker.csv",
             mime="text/csv"
         )
     else:
-        st.error("El CSV no contiene las columnas 'Date' y 'Ticker'.")
\ No newline at end of file
+        st.error("El CSV no contiene las columnas 'Date' y 'Ticker'.")
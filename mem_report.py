@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+# mem_report.py
+# Contabilidad de memoria del proceso: cuánto ocupa (bytes profundos) y cuántas
+# filas tiene cada dataset, índice, figura y caché registrados, frente al RSS.
+# Además mide con tracemalloc las mayores asignaciones transitorias de una
+# reconstrucción (p. ej. recargar modulo):
+#
+#   python mem_report.py                 # informe tras importar modulo
+#   python mem_report.py --rebuild       # + top asignaciones al reconstruir
+#
+import os
+import sys
+import argparse
+import tracemalloc
+import threading
+
+import numpy as np
+import pandas as pd
+
+_DIR = os.path.dirname(os.path.abspath(__file__))
+FRAMES_TRAZA = 25  # profundidad de tracemalloc para atribuir a líneas del repo
+
+_lock = threading.Lock()
+_registro = {}  # nombre -> (tipo, getter)
+
+
+# -------------------------------------------------------------
+# REGISTRO
+# -------------------------------------------------------------
+def registrar(nombre: str, obj=None, tipo: str = "dataset", getter=None):
+    """Registra un objeto (o un getter que lo devuelva al generar el informe)."""
+    if getter is None:
+        getter = lambda o=obj: o
+    with _lock:
+        _registro[nombre] = (tipo, getter)
+
+
+def desregistrar(nombre: str):
+    with _lock:
+        _registro.pop(nombre, None)
+
+
+def _tipo_de(obj):
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return "dataset"
+    if isinstance(obj, (pd.Index, np.ndarray)):
+        return "indice"
+    if hasattr(obj, "to_plotly_json"):
+        return "figura"
+    return None
+
+
+def registrar_espacio(prefijo: str, getter):
+    """Registra los DataFrame / Series / arrays / figuras que tenga getter() (un módulo,
+    un snapshot...). Se resuelven por nombre en cada informe: si getter() pasa a
+    devolver otro objeto o el módulo reasigna la variable, se ve el valor actual.
+    """
+    for nombre, obj in list(vars(getter()).items()):
+        tipo = _tipo_de(obj)
+        if tipo and not nombre.startswith("_"):
+            registrar(f"{prefijo}.{nombre}", tipo=tipo, getter=lambda n=nombre: getattr(getter(), n, None))
+
+
+def registrar_modulo(mod, prefijo: str = None):
+    """Registra todos los DataFrame / Series / arrays / figuras globales de un módulo."""
+    registrar_espacio(prefijo or mod.__name__, lambda: mod)
+
+
+# -------------------------------------------------------------
+# TAMAÑOS
+# -------------------------------------------------------------
+def bytes_profundos(obj, _vistos=None) -> int:
+    """Bytes de obj incluyendo strings de columnas object y contenedores anidados.
+
+    Cada buffer NumPy se cuenta una vez por llamada (vistas compartidas no duplican).
+    """
+    vistos = set() if _vistos is None else _vistos
+    if obj is None or id(obj) in vistos:
+        return 0
+    vistos.add(id(obj))
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        base = obj.base if obj.base is not None else obj
+        if id(base) in vistos and base is not obj:
+            return 0
+        vistos.add(id(base))
+        if obj.dtype == object:
+            return int(obj.nbytes + sum(sys.getsizeof(x) for x in obj.ravel()))
+        return int(obj.nbytes)
+    if hasattr(obj, "to_plotly_json"):
+        return bytes_profundos(obj.to_plotly_json(), vistos)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(bytes_profundos(k, vistos) + bytes_profundos(v, vistos) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(bytes_profundos(x, vistos) for x in obj)
+    if hasattr(obj, "__dict__") and not isinstance(obj, type):
+        return sys.getsizeof(obj) + bytes_profundos(vars(obj), vistos)
+    return sys.getsizeof(obj)
+
+
+def filas(obj):
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index, np.ndarray)):
+        return len(obj)
+    if hasattr(obj, "__len__") and not isinstance(obj, (str, bytes)) and not hasattr(obj, "to_plotly_json"):
+        try:
+            return len(obj)
+        except TypeError:
+            return None
+    return None
+
+
+def rss_mb() -> float:
+    """RSS actual (Linux /proc) o pico (resource) si no está disponible."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# -------------------------------------------------------------
+# INFORME
+# -------------------------------------------------------------
+def informe() -> pd.DataFrame:
+    """Una fila por objeto registrado: nombre, tipo, MB profundos, filas y % del RSS."""
+    with _lock:
+        items = list(_registro.items())
+    rss = rss_mb()
+    rows = []
+    for nombre, (tipo, getter) in items:
+        obj = getter()
+        if obj is None:
+            continue
+        mb = bytes_profundos(obj) / 2**20
+        rows.append({"nombre": nombre, "tipo": tipo, "mb": mb, "filas": filas(obj),
+                     "pct_rss": 100 * mb / rss if rss else np.nan})
+    df = pd.DataFrame(rows, columns=["nombre", "tipo", "mb", "filas", "pct_rss"])
+    return df.sort_values("mb", ascending=False).round(2).reset_index(drop=True)
+
+
+def totales(df: pd.DataFrame = None) -> dict:
+    df = informe() if df is None else df
+    rss = rss_mb()
+    contado = float(df["mb"].sum())
+    return {"rss_mb": round(rss, 1), "registrado_mb": round(contado, 1),
+            "sin_contabilizar_mb": round(rss - contado, 1),
+            "por_tipo_mb": df.groupby("tipo")["mb"].sum().round(1).to_dict()}
+
+
+def _origen(traceback) -> str:
+    """Frame más interno del repo (no de pandas/numpy) que llevó a la asignación."""
+    for frame in reversed(traceback):
+        if frame.filename.startswith(_DIR):
+            return f"{os.path.relpath(frame.filename, _DIR)}:{frame.lineno}"
+    return str(traceback[-1]) if len(traceback) else "?"
+
+
+def asignaciones_transitorias(fn, top: int = 15, intervalo_s: float = 0.05) -> tuple:
+    """Ejecuta fn bajo tracemalloc y devuelve (resultado, pico_mb, top asignaciones en el pico).
+
+    Un hilo muestrea la memoria trazada cada intervalo_s y guarda un snapshot cada
+    vez que supera el máximo visto: el top compara ese snapshot con el de antes de
+    fn, así aparecen los temporales (copias, concats...) aunque luego se liberen.
+    Cada asignación se atribuye a la línea del repo desde la que se hizo.
+    """
+    ya = tracemalloc.is_tracing()
+    if not ya:
+        tracemalloc.start(FRAMES_TRAZA)
+    antes = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    en_pico = {"mem": base, "snap": None}
+    fin = threading.Event()
+
+    def muestrear():
+        while not fin.wait(intervalo_s):
+            actual, _ = tracemalloc.get_traced_memory()
+            if actual > en_pico["mem"]:
+                en_pico["snap"], en_pico["mem"] = tracemalloc.take_snapshot(), actual
+
+    hilo = threading.Thread(target=muestrear, daemon=True)
+    hilo.start()
+    try:
+        out = fn()
+    finally:
+        fin.set()
+        hilo.join()
+        _, pico = tracemalloc.get_traced_memory()
+        snap = en_pico["snap"] or tracemalloc.take_snapshot()
+        if not ya:
+            tracemalloc.stop()
+    stats = snap.compare_to(antes, "traceback")
+    df = pd.DataFrame(
+        [{"origen": _origen(s.traceback), "mb": s.size_diff / 2**20, "bloques": s.count_diff} for s in stats],
+        columns=["origen", "mb", "bloques"],
+    )
+    df = df.groupby("origen", as_index=False).sum().nlargest(top, "mb").round(2).reset_index(drop=True)
+    return out, (pico - base) / 2**20, df
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="Informe de memoria de modulo.py")
+    p.add_argument("--rebuild", action="store_true", help="medir asignaciones al reconstruir el snapshot")
+    p.add_argument("--top", type=int, default=15)
+    args = p.parse_args(argv)
+
+    import modulo  # registra su snapshot (datasets, figuras) y el session_index
+
+    pd.set_option("display.width", 160)
+    df = informe()
+    print(df.to_string(index=False))
+    print(totales(df))
+    if args.rebuild:
+        _, pico, top = asignaciones_transitorias(lambda: modulo.refrescar(forzar=True), top=args.top)
+        print(f"\nreconstrucción: pico tracemalloc {pico:.1f} MB")
+        print(top.to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    # modulo registra en el módulo importado "mem_report", no en __main__
+    import mem_report
+    sys.exit(mem_report.main())
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# merge_sessions.py
+# Une varias listas de sesiones (data_open_gap.csv, data_premarket.csv, scanners
+# diarios...) en una sola lista ordenada y sin duplicados, lista para los
+# descargadores (columnas ticker,date), con cuántas veces aparece cada sesión en
+# cada fuente:
+#
+#   python merge_sessions.py data_open_gap.csv data_premarket.csv -o sesiones.csv
+#
+import os
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import session_keys as sk
+
+CHUNK_ROWS = 500_000
+
+
+def detectar_columnas(columnas) -> tuple:
+    """Devuelve (col_ticker, col_date) con los mismos alias que polygon_batch.load_csv."""
+    ticker_col, date_col = None, None
+    for c in columnas:
+        lc = str(c).lower().strip()
+        if lc in ("ticker", "symbol"):
+            ticker_col = c
+        if lc in ("date", "fecha"):
+            date_col = c
+    if ticker_col is None or date_col is None:
+        raise ValueError("El CSV debe tener columnas 'ticker' y 'date' (o 'fecha').")
+    return ticker_col, date_col
+
+
+def leer_claves(fuente, chunksize: int = CHUNK_ROWS) -> np.ndarray:
+    """Claves int64 de todas las sesiones válidas de un CSV (ruta o archivo), en streaming."""
+    cabecera = pd.read_csv(fuente, nrows=0)
+    if hasattr(fuente, "seek"):
+        fuente.seek(0)
+    ticker_col, date_col = detectar_columnas(cabecera.columns)
+    partes = [np.zeros(0, dtype=np.int64)]
+    # Sin NA por defecto: "NA", "NULL"... son tickers reales; solo la fecha vacía es NA
+    for chunk in pd.read_csv(fuente, usecols=[ticker_col, date_col], chunksize=chunksize,
+                             dtype={ticker_col: "string"}, keep_default_na=False, na_values={date_col: [""]}):
+        t = chunk[ticker_col].str.upper().str.strip()
+        d = pd.to_datetime(chunk[date_col], errors="coerce")
+        ok = t.notna() & (t != "") & d.notna()
+        partes.append(sk.encode_sessions(t[ok], d[ok]))
+    return np.concatenate(partes)
+
+
+def merge_keys(claves_por_fuente: dict) -> pd.DataFrame:
+    """Une {nombre: claves int64} -> DataFrame ordenado por (date, ticker) sin duplicados."""
+    nombres = list(claves_por_fuente)
+    todas = np.concatenate([np.asarray(claves_por_fuente[n], dtype=np.int64) for n in nombres] or [np.zeros(0, np.int64)])
+    fuente_id = np.repeat(np.arange(len(nombres)), [len(claves_por_fuente[n]) for n in nombres])
+
+    unicas, inv = np.unique(todas, return_inverse=True)
+    # Conteos (sesión x fuente) con un único bincount sobre índices aplanados
+    conteos = np.bincount(inv * len(nombres) + fuente_id, minlength=len(unicas) * len(nombres))
+    conteos = conteos.reshape(len(unicas), len(nombres))
+
+    orden = np.lexsort((unicas >> sk.BITS_DIA, unicas & ((1 << sk.BITS_DIA) - 1)))
+    out = sk.decode_keys(unicas[orden])
+    out["sources"] = (conteos[orden] > 0).sum(axis=1)
+    out["rows"] = conteos[orden].sum(axis=1)
+    for j, n in enumerate(nombres):
+        out[n] = conteos[orden, j]
+    return out
+
+
+def nombres_fuentes(rutas) -> list:
+    nombres, vistos = [], {}
+    for r in rutas:
+        base = os.path.splitext(os.path.basename(str(getattr(r, "name", r))))[0]
+        vistos[base] = vistos.get(base, 0) + 1
+        nombres.append(base if vistos[base] == 1 else f"{base}_{vistos[base]}")
+    return nombres
+
+
+def merge_session_files(fuentes) -> pd.DataFrame:
+    """Une CSVs (rutas o archivos subidos) en una lista de sesiones con conteos por fuente."""
+    fuentes = list(fuentes)
+    return merge_keys({n: leer_claves(f) for n, f in zip(nombres_fuentes(fuentes), fuentes)})
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="Une y deduplica listas de sesiones ticker/date")
+    p.add_argument("csv", nargs="+", help="CSVs con columnas ticker/date (o Ticker/Date, symbol, fecha)")
+    p.add_argument("-o", "--output", default="sesiones.csv")
+    args = p.parse_args(argv)
+
+    out = merge_session_files(args.csv)
+    out.to_csv(args.output, index=False)
+    print(f"{len(out)} sesiones únicas de {int(out['rows'].sum())} filas -> {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
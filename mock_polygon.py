@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# mock_polygon.py
+# Servidor local que imita /v2/aggs/ticker/... de Polygon.io con agregados sintéticos
+# deterministas (mismo ticker+fecha -> mismas barras). Sirve para probar y medir el
+# descargador sin red ni API key:
+#
+#   python mock_polygon.py --port 8765 --latency-ms 20 --p429 0.05 --page-size 500
+#   POLYGON_BASE_URL=http://127.0.0.1:8765 python polygon_batch.py entrada.csv
+#
+import re
+import sys
+import gzip
+import json
+import time
+import zlib
+import random
+import argparse
+import threading
+import datetime as dt
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+RUTA_AGGS = re.compile(
+    r"^/v2/aggs/ticker/(?P<ticker>[^/]+)/range/(?P<mult>\d+)/(?P<span>minute|hour)/(?P<desde>[\d-]+)/(?P<hasta>[\d-]+)$"
+)
+
+# Horario extendido que sirve Polygon: 04:00-20:00 NY
+_INICIO_MIN = 4 * 60
+_FIN_MIN = 20 * 60
+
+
+def barras_sinteticas(ticker: str, fecha: dt.date, mult_min: int) -> list:
+    """Barras deterministas de un día en el formato 'results' de Polygon."""
+    seed = zlib.crc32(f"{ticker}|{fecha.isoformat()}|{mult_min}".encode())
+    rng = np.random.default_rng(seed)
+
+    inicio = pd.Timestamp(f"{fecha.isoformat()} 04:00", tz="America/New_York").value // 1_000_000
+    n = (_FIN_MIN - _INICIO_MIN) // mult_min
+    t = inicio + np.arange(n, dtype=np.int64) * mult_min * 60_000
+
+    precio0 = float(rng.uniform(0.5, 12.0))
+    ret = rng.normal(0.0, 0.004 * np.sqrt(mult_min), n)
+    close = precio0 * np.exp(np.cumsum(ret))
+    open_ = np.concatenate(([precio0], close[:-1]))
+    rango = np.abs(rng.normal(0.0, 0.003 * np.sqrt(mult_min), n)) * close
+    high = np.maximum(open_, close) + rango
+    low = np.maximum(np.minimum(open_, close) - rango, 0.0001)
+    vol = rng.integers(100, 50_000, n) * mult_min
+    vwap = (open_ + high + low + close) / 4
+    trans = np.maximum(vol // 150, 1)
+
+    r4 = lambda a: np.round(a, 4).tolist()
+    return [
+        {"v": v, "vw": vw, "o": o, "c": c, "h": h, "l": l, "t": ts, "n": nn}
+        for v, vw, o, c, h, l, ts, nn in zip(vol.tolist(), r4(vwap), r4(open_), r4(close), r4(high), r4(low), t.tolist(), trans.tolist())
+    ]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "MockPolygon/1.0"
+
+    def log_message(self, fmt, *args):  # silencio: el bench mide, no loguea
+        pass
+
+    def _responder(self, code: int, payload: dict, extra_headers: dict = None):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=1)
+            self.send_header("Content-Encoding", "gzip")
+        for k, v in (extra_headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        cfg = self.server.cfg
+        url = urlparse(self.path)
+        m = RUTA_AGGS.match(url.path)
+        if m is None:
+            self._responder(404, {"status": "NOT_FOUND", "message": url.path})
+            return
+
+        if cfg["latency_ms"]:
+            time.sleep(cfg["latency_ms"] / 1000.0)
+        with self.server.lock:
+            self.server.requests += 1
+            inyectar_429 = self.server.rng.random() < cfg["p429"]
+        if inyectar_429:
+            self._responder(429, {"status": "ERROR", "error": "rate limit (mock)"}, {"Retry-After": "0"})
+            return
+
+        qs = parse_qs(url.query)
+        ticker = m["ticker"].upper()
+        mult_min = int(m["mult"]) * (60 if m["span"] == "hour" else 1)
+        desde = dt.date.fromisoformat(m["desde"])
+        hasta = dt.date.fromisoformat(m["hasta"])
+        results = []
+        d = desde
+        while d <= hasta:
+            results.extend(barras_sinteticas(ticker, d, mult_min))
+            d += dt.timedelta(days=1)
+
+        cursor = int(qs.get("cursor", ["0"])[0])
+        limite = min(int(qs.get("limit", ["50000"])[0]), cfg["page_size"] or 50000)
+        pagina = results[cursor:cursor + limite]
+        payload = {
+            "ticker": ticker,
+            "queryCount": len(pagina),
+            "resultsCount": len(pagina),
+            "adjusted": qs.get("adjusted", ["true"])[0] == "true",
+            "results": pagina,
+            "status": "OK",
+            "request_id": f"mock-{self.server.requests}",
+            "count": len(pagina),
+        }
+        if cursor + limite < len(results):
+            host = self.headers.get("Host", f"127.0.0.1:{self.server.server_port}")
+            payload["next_url"] = (
+                f"http://{host}{url.path}?cursor={cursor + limite}&limit={limite}"
+                f"&adjusted={qs.get('adjusted', ['true'])[0]}&sort=asc"
+            )
+        self._responder(200, payload)
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0,
+                 p429: float = 0.0, page_size: int = 0, seed: int = 0):
+    """Arranca el mock en un hilo daemon. Devuelve (server, base_url)."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.cfg = {"latency_ms": float(latency_ms), "p429": float(p429), "page_size": int(page_size)}
+    server.rng = random.Random(seed)
+    server.lock = threading.Lock()
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="Mock local de agregados de Polygon.io")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--latency-ms", type=float, default=0.0, help="latencia añadida por request")
+    p.add_argument("--p429", type=float, default=0.0, help="probabilidad de responder 429")
+    p.add_argument("--page-size", type=int, default=0, help="barras por página (0 = sin paginar)")
+    p.add_argument("--seed", type=int, default=0, help="semilla de la inyección de 429")
+    args = p.parse_args(argv)
+
+    server, base_url = start_server(args.host, args.port, args.latency_ms, args.p429, args.page_size, args.seed)
+    print(f"Mock Polygon en {base_url}  (POLYGON_BASE_URL={base_url})", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
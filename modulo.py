@@ -4,37 +4,123 @@
 # -------------------------------------------------------------
 # IMPORTS
 # -------------------------------------------------------------
+import io
+import os
+import time
+import hashlib
+import logging
+import threading
+import urllib.error
+import urllib.request
+
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
 import pandas as pd
 
+import backtest
+import bootstrap
+import mem_report as mem
+import perf_metrics as perf
+import session_keys as sk
+import similares
+from arranque import Grafo
+from cubo import Cubo
+from momentos import Momentos, METRICAS as METRICAS_MOMENTOS
+from multiframe import Multiframe
+from serie_temporal import SerieTemporal, NOMBRES as NOMBRES_NIVEL, VENTANA_DEFECTO
+from session_index import get_session_index
+from ticker_index import TickerIndex
+
 # -------------------------------------------------------------
-# CARGA DE DATOS (una sola vez)
+# CARGA DE DATOS (fuentes con firma: el refresco solo relee lo que cambió)
 # -------------------------------------------------------------
-# Datos principales
-stocks = pd.read_csv(
-    "https://raw.githubusercontent.com/AlexSanGar/dash/refs/heads/main/data_completa.csv"
+# Se pueden apuntar a otros CSV (locales o sintéticos) con SMALLCAPS_DATA_URL / SMALLCAPS_INTRADAY_URL
+DATA_URL = os.environ.get(
+    "SMALLCAPS_DATA_URL", "https://raw.githubusercontent.com/AlexSanGar/dash/refs/heads/main/data_completa.csv"
 )
-# Evita un caso erróneo puntual
-stocks = stocks[~((stocks["Date"] == "2022-02-18") & (stocks["Ticker"] == "QNGY"))]
-
-# Normaliza columna Date
-stocks["Date"] = pd.to_datetime(stocks["Date"], errors="coerce")
-stocks_v1 = stocks.copy()
-
-stocks_v1["Period"] = stocks_v1["Date"].dt.year
-stocks_v1["Month"] = stocks_v1["Date"].dt.month
-# Watch out: .isocalendar().week returns Series with dtype UInt... cast to int
-stocks_v1["Week"] = stocks_v1["Date"].dt.isocalendar().week.astype("Int64")
-
-# Intraday (15min) -- cargar una sola vez para acelerar
-try:
-    intraday_df = pd.read_csv(
-        "https://raw.githubusercontent.com/AlexSanGar/dash/refs/heads/main/data_15min.csv"
-    )
-except Exception:
-    intraday_df = pd.DataFrame()  # si no carga, evitamos romper el módulo
+INTRADAY_URL = os.environ.get(
+    "SMALLCAPS_INTRADAY_URL", "https://raw.githubusercontent.com/AlexSanGar/dash/refs/heads/main/data_15min.csv"
+)
+# Cada cuánto comprueba el hilo de refresco si cambiaron las fuentes (iniciar_refresco)
+REFRESH_S = float(os.environ.get("SMALLCAPS_REFRESH_S", 300))
+HTTP_TIMEOUT_S = 60
+
+log = logging.getLogger(__name__)
+
+
+def _leer_fuente(url, firma=None):
+    """Lee url si cambió respecto a firma. Devuelve (bytes o None si no cambió, firma nueva).
+
+    HTTP: GET condicional con ETag / Last-Modified (304 = sin cambios); local: mtime y
+    tamaño. En ambos casos el sha256 del contenido descarta cambios solo de metadatos.
+    """
+    firma = dict(firma or {})
+    if os.path.exists(url):
+        st = os.stat(url)
+        if firma.get("mtime") == st.st_mtime_ns and firma.get("size") == st.st_size:
+            return None, firma
+        with open(url, "rb") as f:
+            datos = f.read()
+        firma.update(mtime=st.st_mtime_ns, size=st.st_size)
+    else:
+        req = urllib.request.Request(url)
+        if firma.get("etag"):
+            req.add_header("If-None-Match", firma["etag"])
+        if firma.get("modified"):
+            req.add_header("If-Modified-Since", firma["modified"])
+        try:
+            with urllib.request.urlopen(req, timeout=HTTP_TIMEOUT_S) as resp:
+                datos = resp.read()
+                firma.update(etag=resp.headers.get("ETag"), modified=resp.headers.get("Last-Modified"))
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None, firma
+            raise
+    sha = hashlib.sha256(datos).hexdigest()
+    if firma.get("sha256") == sha:
+        return None, firma
+    firma["sha256"] = sha
+    return datos, firma
+
+
+def _cargar_stocks(firma):
+    with perf.medir("carga stocks", tipo="carga") as m:
+        crudo, firma = _leer_fuente(DATA_URL, firma)
+        df = None if crudo is None else pd.read_csv(io.BytesIO(crudo))
+        m["filas"] = None if df is None else len(df)
+    return df, firma
+
+
+def _cargar_intraday(firma, inicial):
+    # Intraday (15min): si no carga, se sirve sin curvas intradía (no rompe el módulo)
+    with perf.medir("carga intraday", tipo="carga") as m:
+        try:
+            crudo, firma = _leer_fuente(INTRADAY_URL, firma)
+            df = None if crudo is None else pd.read_csv(io.BytesIO(crudo))
+        except Exception:
+            log.warning("no se pudo cargar %s", INTRADAY_URL, exc_info=True)
+            df = pd.DataFrame() if inicial else None
+        m["filas"] = None if df is None else len(df)
+    return df, firma
+
+
+def cargar_fuentes(firmas=None):
+    """Lee las fuentes que cambiaron respecto a firmas (None = carga inicial, todas).
+
+    Las dos descargas van en paralelo. Devuelve ({"stocks": df o None,
+    "intraday": df o None}, firmas); None = sin cambios.
+    """
+    inicial = firmas is None
+    firmas = dict(firmas or {})
+    g = Grafo("fuentes")
+    g.nodo("stocks", lambda: _cargar_stocks(firmas.get("stocks")))
+    g.nodo("intraday", lambda: _cargar_intraday(firmas.get("intraday"), inicial))
+    r = g.ejecutar()
+    datos = {}
+    for nombre in ("stocks", "intraday"):
+        datos[nombre], firmas[nombre] = r[nombre]
+    return datos, firmas
 
 # -------------------------------------------------------------
 # FUNCIÓN DE FILTRADO
@@ -70,8 +156,6 @@ def filtrar_smallcaps(df):
     return df.loc[filtros].copy()
 
 
-stocks_filtrados = filtrar_smallcaps(stocks_v1)
-
 # -------------------------------------------------------------
 # MÉTRICAS BASE (precomputadas para rendimiento)
 # -------------------------------------------------------------
@@ -79,149 +163,97 @@ stocks_filtrados = filtrar_smallcaps(stocks_v1)
 def _to_yearmonth(df, year_col="Period", month_col="Month"):
     return df[year_col].astype(str) + "-" + df[month_col].astype(str).str.zfill(2)
 
+# Cada agregado mensual es una función de stocks_filtrados (se puede medir / recalcular por separado)
+
 # GAPS
-monthly_counts = (
-    stocks_filtrados.groupby(["Period","Month"])
-    .size()
-    .reset_index(name="Stocks")
-)
-monthly_counts["YearMonth"] = _to_yearmonth(monthly_counts)
-monthly_counts["SMA_6"] = monthly_counts["Stocks"].rolling(6, min_periods=1).mean()
+@perf.instrumentar(tipo="agregado")
+def calcular_monthly_counts(df):
+    out = (
+        df.groupby(["Period","Month"])
+        .size()
+        .reset_index(name="Stocks")
+    )
+    out["YearMonth"] = _to_yearmonth(out)
+    out["SMA_6"] = out["Stocks"].rolling(6, min_periods=1).mean()
+    return out
 
 # VOLUME
-monthly_volume = (
-    stocks_filtrados.groupby(["Period","Month"])["EOD Volume"]
-    .sum()
-    .reset_index()
-)
-monthly_volume["YearMonth"] = _to_yearmonth(monthly_volume)
-monthly_volume["SMA_6"] = monthly_volume["EOD Volume"].rolling(6, min_periods=1).mean()
+@perf.instrumentar(tipo="agregado")
+def calcular_monthly_volume(df):
+    out = (
+        df.groupby(["Period","Month"])["EOD Volume"]
+        .sum()
+        .reset_index()
+    )
+    out["YearMonth"] = _to_yearmonth(out)
+    out["SMA_6"] = out["EOD Volume"].rolling(6, min_periods=1).mean()
+    return out
 
 # GAP VALUE
-monthly_gap_open = (
-    stocks_filtrados.groupby(["Period","Month"])["Open Gap %"]
-    .mean()
-    .reset_index()
-)
-monthly_gap_open["YearMonth"] = _to_yearmonth(monthly_gap_open)
-monthly_gap_open["Gap (%)"] = (monthly_gap_open["Open Gap %"] * 100).round(2)
-monthly_gap_open["SMA_6"] = monthly_gap_open["Gap (%)"].rolling(6, min_periods=1).mean()
+@perf.instrumentar(tipo="agregado")
+def calcular_monthly_gap_open(df):
+    out = (
+        df.groupby(["Period","Month"])["Open Gap %"]
+        .mean()
+        .reset_index()
+    )
+    out["YearMonth"] = _to_yearmonth(out)
+    out["Gap (%)"] = (out["Open Gap %"] * 100).round(2)
+    out["SMA_6"] = out["Gap (%)"].rolling(6, min_periods=1).mean()
+    return out
 
 # HIGH SPIKE
-monthly_highspike = (
-    stocks_filtrados.groupby(["Period","Month"])["High Spike %"]
-    .mean()
-    .reset_index()
-)
-monthly_highspike["YearMonth"] = _to_yearmonth(monthly_highspike)
-monthly_highspike["High Spike (%)"] = (monthly_highspike["High Spike %"] * 100).round(2)
-monthly_highspike["SMA_6"] = monthly_highspike["High Spike (%)"].rolling(6, min_periods=1).mean()
+@perf.instrumentar(tipo="agregado")
+def calcular_monthly_highspike(df):
+    out = (
+        df.groupby(["Period","Month"])["High Spike %"]
+        .mean()
+        .reset_index()
+    )
+    out["YearMonth"] = _to_yearmonth(out)
+    out["High Spike (%)"] = (out["High Spike %"] * 100).round(2)
+    out["SMA_6"] = out["High Spike (%)"].rolling(6, min_periods=1).mean()
+    return out
 
 # LOW SPIKE
-monthly_lowspike = (
-    stocks_filtrados.groupby(["Period","Month"])["Low Spike %"]
-    .mean()
-    .reset_index()
-)
-monthly_lowspike["YearMonth"] = _to_yearmonth(monthly_lowspike)
-monthly_lowspike["Low Spike (%)"] = (monthly_lowspike["Low Spike %"] * 100).round(2)
-monthly_lowspike["SMA_6"] = monthly_lowspike["Low Spike (%)"].rolling(6, min_periods=1).mean()
+@perf.instrumentar(tipo="agregado")
+def calcular_monthly_lowspike(df):
+    out = (
+        df.groupby(["Period","Month"])["Low Spike %"]
+        .mean()
+        .reset_index()
+    )
+    out["YearMonth"] = _to_yearmonth(out)
+    out["Low Spike (%)"] = (out["Low Spike %"] * 100).round(2)
+    out["SMA_6"] = out["Low Spike (%)"].rolling(6, min_periods=1).mean()
+    return out
 
 # RANGE
-monthly_range = (
-    stocks_filtrados.groupby(["Period","Month"])["RTH Range %"]
-    .mean()
-    .reset_index()
-)
-monthly_range["YearMonth"] = _to_yearmonth(monthly_range)
-monthly_range["Range (%)"] = (monthly_range["RTH Range %"] * 100).round(2)
-monthly_range["SMA_6"] = monthly_range["Range (%)"].rolling(6, min_periods=1).mean()
+@perf.instrumentar(tipo="agregado")
+def calcular_monthly_range(df):
+    out = (
+        df.groupby(["Period","Month"])["RTH Range %"]
+        .mean()
+        .reset_index()
+    )
+    out["YearMonth"] = _to_yearmonth(out)
+    out["Range (%)"] = (out["RTH Range %"] * 100).round(2)
+    out["SMA_6"] = out["Range (%)"].rolling(6, min_periods=1).mean()
+    return out
 
 # CLOSE RED
-monthly_closered = (
-    stocks_filtrados.assign(close_red=stocks_filtrados["Day Return %"] < 0)
-    .groupby(["Period","Month"])["close_red"]
-    .mean()
-    .reset_index()
-)
-monthly_closered["YearMonth"] = _to_yearmonth(monthly_closered)
-monthly_closered["Close Red (%)"] = (monthly_closered["close_red"] * 100).round(2)
-monthly_closered["SMA_6"] = monthly_closered["Close Red (%)"].rolling(6, min_periods=1).mean()
-
-# RTH FADE
-monthly_rth_fade = (
-    stocks_filtrados.assign(RTH_Fade = pd.to_numeric(stocks_filtrados["RTH Fade to Close %"], errors="coerce"))
-    .groupby(["Period","Month"])["RTH_Fade"]
-    .mean()
-    .reset_index()
-)
-monthly_rth_fade["YearMonth"] = _to_yearmonth(monthly_rth_fade)
-monthly_rth_fade["Fade (%)"] = (monthly_rth_fade["RTH_Fade"] * 100).round(2)
-monthly_rth_fade["SMA_6"] = monthly_rth_fade["Fade (%)"].rolling(6, min_periods=1).mean()
-
-# fig_2 metrics (negativos vs positivos)
-total = len(stocks_filtrados)
-neg_count = (stocks_filtrados["Day Return %"] < 0).sum()
-pos_count = total - neg_count
-neg_pct = round(neg_count / total * 100, 2) if total > 0 else 0
-pos_pct = round(100 - neg_pct, 2) if total > 0 else 0
-
-# PM Fade > 15% metrics
-total_1 = len(stocks_filtrados)
-neg_count_1 = (stocks_filtrados["PMH Fade to Open %"] < -0.15).sum()
-pos_count_1 = total_1 - neg_count_1
-neg_pct_1 = round(neg_count_1 / total_1 * 100, 2) if total_1 > 0 else 0
-pos_pct_1 = round(100 - neg_pct_1, 2) if total_1 > 0 else 0
-
-# Para fig_3 (avg / median)
-stocks_filtrados_1 = filtrar_smallcaps(stocks)  # mantiene la semántica original
-
-# Cálculos de medias y medianas
-avg_return = round(stocks_filtrados_1["Day Return %"].mean() * 100, 2)
-avg_open_gap = round(stocks_filtrados_1["Open Gap %"].mean() * 100, 2)
-avg_high_spike = round(stocks_filtrados_1["High Spike %"].mean() * 100, 2)
-avg_low_spike = round(stocks_filtrados_1["Low Spike %"].mean() * 100, 2)
-avg_range = round(stocks_filtrados_1["RTH Range %"].mean() * 100, 2)
-
-# convierte HOD/LOD, calcula medias/medianas (respetando errores)
-stocks_filtrados_1["HOD Time"] = pd.to_datetime(stocks_filtrados_1["HOD Time"], format="%H:%M", errors="coerce")
-stocks_filtrados_1["HOD_horario"] = (
-    stocks_filtrados_1["HOD Time"].dt.hour * 3600 + stocks_filtrados_1["HOD Time"].dt.minute * 60
-)
-mean_seconds = stocks_filtrados_1["HOD_horario"].mean()
-if pd.isna(mean_seconds):
-    avg_hod_time = "NA"
-else:
-    avg_hod_time = f"{int(mean_seconds // 3600):02d}:{int((mean_seconds % 3600) // 60):02d}"
-
-stocks_filtrados_1["LOD Time"] = pd.to_datetime(stocks_filtrados_1["LOD Time"], format="%H:%M", errors="coerce")
-stocks_filtrados_1["LOD_horario"] = (
-    stocks_filtrados_1["LOD Time"].dt.hour * 3600 + stocks_filtrados_1["LOD Time"].dt.minute * 60
-)
-mean_seconds = stocks_filtrados_1["LOD_horario"].mean()
-if pd.isna(mean_seconds):
-    avg_lod_time = "NA"
-else:
-    avg_lod_time = f"{int(mean_seconds // 3600):02d}:{int((mean_seconds % 3600) // 60):02d}"
-
-median_return = round(stocks_filtrados_1["Day Return %"].median() * 100, 2)
-median_open_gap = round(stocks_filtrados_1["Open Gap %"].median() * 100, 2)
-median_high_spike = round(stocks_filtrados_1["High Spike %"].median() * 100, 2)
-median_low_spike = round(stocks_filtrados_1["Low Spike %"].median() * 100, 2)
-median_range = round(stocks_filtrados_1["RTH Range %"].median() * 100, 2)
-
-# median times
-hod_median_seconds = stocks_filtrados_1["HOD_horario"].median()
-if pd.isna(hod_median_seconds):
-    median_hod_time = "NA"
-else:
-    median_hod_time = f"{int(hod_median_seconds // 3600):02d}:{int((hod_median_seconds % 3600) // 60):02d}"
-
-lod_median_seconds = stocks_filtrados_1["LOD_horario"].median()
-if pd.isna(lod_median_seconds):
-    median_lod_time = "NA"
-else:
-    median_lod_time = f"{int(lod_median_seconds // 3600):02d}:{int((lod_median_seconds % 3600) // 60):02d}"
+@perf.instrumentar(tipo="agregado")
+def calcular_monthly_closered(df):
+    out = (
+        df.assign(close_red=df["Day Return %"] < 0)
+        .groupby(["Period","Month"])["close_red"]
+        .mean()
+        .reset_index()
+    )
+    out["YearMonth"] = _to_yearmonth(out)
+    out["Close Red (%)"] = (out["close_red"] * 100).round(2)
+    out["SMA_6"] = out["Close Red (%)"].rolling(6, min_periods=1).mean()
+    return out
 
 def format_value(v):
     """Formatea valores para la tabla (mantiene tu HTML original)."""
@@ -233,248 +265,234 @@ def format_value(v):
         return str(v)
     return f"<span style='color:#00cc96'>{v}%</span>" if v_num >= 0 else f"<span style='color:#ef553b'>{v}%</span>"
 
-metrics = ["High Spike", "Low Spike", "Return", "Gap at open", "RTH Range", "HOD Time", "LOD Time"]
-avg_values = [
-    format_value(avg_high_spike),
-    format_value(avg_low_spike),
-    format_value(avg_return),
-    format_value(avg_open_gap),
-    format_value(avg_range),
-    avg_hod_time,
-    avg_lod_time,
-]
-median_values = [
-    format_value(median_high_spike),
-    format_value(median_low_spike),
-    format_value(median_return),
-    format_value(median_open_gap),
-    format_value(median_range),
-    median_hod_time,
-    median_lod_time,
-]
-
 # -------------------------------------------------------------
 # PMH / PM metrics (renombradas para evitar sobreescrituras)
 # -------------------------------------------------------------
+def _yearmonth_dt(df):
+    return pd.to_datetime(
+        df["Period"].astype(str) + "-" + df["Month"].astype(str).str.zfill(2) + "-01",
+        format="%Y-%m-%d",
+        errors="coerce",
+    )
+
+def _a_numero(serie, quitar=("%", ",")):
+    s = serie.astype(str)
+    for ch in quitar:
+        s = s.str.replace(ch, "", regex=False)
+    return pd.to_numeric(s.str.strip(), errors="coerce")
+
 # monthly_pmh_gap : PMH Gap % por mes (renombrado)
-if "PMH Gap %" not in stocks_filtrados.columns:
-    # Mantener comportamiento original: lanzar error para que se detecte en dev
-    raise KeyError("La columna 'PMH Gap %' no existe en stocks_filtrados")
-
-monthly_pmh_gap = (
-    stocks_filtrados.assign(**{"PMH Gap %": pd.to_numeric(stocks_filtrados["PMH Gap %"], errors="coerce")})
-    .groupby(["Period", "Month"], as_index=False)
-    .agg(PMH_Gap_Mean=("PMH Gap %", "mean"))
-)
-monthly_pmh_gap["YearMonth_dt"] = pd.to_datetime(
-    monthly_pmh_gap["Period"].astype(str) + "-" + monthly_pmh_gap["Month"].astype(str).str.zfill(2) + "-01",
-    format="%Y-%m-%d",
-    errors="coerce",
-)
-monthly_pmh_gap = monthly_pmh_gap.sort_values("YearMonth_dt").reset_index(drop=True)
-monthly_pmh_gap["Gap (%)"] = monthly_pmh_gap["PMH_Gap_Mean"] * 100
-monthly_pmh_gap["SMA_6"] = monthly_pmh_gap["Gap (%)"].rolling(window=6, min_periods=1).mean()
-monthly_pmh_gap["Gap (%)"] = monthly_pmh_gap["Gap (%)"].round(2)
-monthly_pmh_gap["SMA_6"] = monthly_pmh_gap["SMA_6"].round(2)
-monthly_pmh_gap["YearMonth"] = monthly_pmh_gap["YearMonth_dt"].dt.strftime("%Y-%m")
+@perf.instrumentar(tipo="agregado")
+def calcular_monthly_pmh_gap(df):
+    if "PMH Gap %" not in df.columns:
+        # Mantener comportamiento original: lanzar error para que se detecte en dev
+        raise KeyError("La columna 'PMH Gap %' no existe en stocks_filtrados")
+
+    out = (
+        df.assign(**{"PMH Gap %": pd.to_numeric(df["PMH Gap %"], errors="coerce")})
+        .groupby(["Period", "Month"], as_index=False)
+        .agg(PMH_Gap_Mean=("PMH Gap %", "mean"))
+    )
+    out["YearMonth_dt"] = _yearmonth_dt(out)
+    out = out.sort_values("YearMonth_dt").reset_index(drop=True)
+    out["Gap (%)"] = out["PMH_Gap_Mean"] * 100
+    out["SMA_6"] = out["Gap (%)"].rolling(window=6, min_periods=1).mean()
+    out["Gap (%)"] = out["Gap (%)"].round(2)
+    out["SMA_6"] = out["SMA_6"].round(2)
+    out["YearMonth"] = out["YearMonth_dt"].dt.strftime("%Y-%m")
+    return out
 
 # monthly_fade (PMH Fade to Open %)
-if "PMH Fade to Open %" not in stocks_filtrados.columns:
-    raise KeyError("La columna 'PMH Fade to Open %' no existe en stocks_filtrados")
-
-tmp_df = stocks_filtrados.copy()
-tmp_df["PMH Fade to Open %"] = (
-    tmp_df["PMH Fade to Open %"].astype(str).str.replace("%", "", regex=False).str.replace(",", "", regex=False).str.strip()
-)
-tmp_df["PMH Fade to Open %"] = pd.to_numeric(tmp_df["PMH Fade to Open %"], errors="coerce")
-monthly_fade = (
-    tmp_df.groupby(["Period", "Month"], as_index=False)
-    .agg(PMH_Fade_Mean=("PMH Fade to Open %", "mean"))
-)
-monthly_fade["YearMonth_dt"] = pd.to_datetime(
-    monthly_fade["Period"].astype(str) + "-" + monthly_fade["Month"].astype(str).str.zfill(2) + "-01",
-    format="%Y-%m-%d",
-    errors="coerce",
-)
-monthly_fade = monthly_fade.sort_values("YearMonth_dt").reset_index(drop=True)
-monthly_fade["Fade (%)"] = monthly_fade["PMH_Fade_Mean"] * 100
-monthly_fade["SMA_6"] = monthly_fade["Fade (%)"].rolling(window=6, min_periods=1).mean()
-monthly_fade["Fade (%)"] = monthly_fade["Fade (%)"].round(2)
-monthly_fade["SMA_6"] = monthly_fade["SMA_6"].round(2)
-monthly_fade["YearMonth"] = monthly_fade["YearMonth_dt"].dt.strftime("%Y-%m")
+@perf.instrumentar(tipo="agregado")
+def calcular_monthly_fade(df):
+    if "PMH Fade to Open %" not in df.columns:
+        raise KeyError("La columna 'PMH Fade to Open %' no existe en stocks_filtrados")
+
+    out = (
+        df.assign(**{"PMH Fade to Open %": _a_numero(df["PMH Fade to Open %"])})
+        .groupby(["Period", "Month"], as_index=False)
+        .agg(PMH_Fade_Mean=("PMH Fade to Open %", "mean"))
+    )
+    out["YearMonth_dt"] = _yearmonth_dt(out)
+    out = out.sort_values("YearMonth_dt").reset_index(drop=True)
+    out["Fade (%)"] = out["PMH_Fade_Mean"] * 100
+    out["SMA_6"] = out["Fade (%)"].rolling(window=6, min_periods=1).mean()
+    out["Fade (%)"] = out["Fade (%)"].round(2)
+    out["SMA_6"] = out["SMA_6"].round(2)
+    out["YearMonth"] = out["YearMonth_dt"].dt.strftime("%Y-%m")
+    return out
 
 # monthly_pmv (Premarket Volume)
-if "Premarket Volume" not in stocks_filtrados.columns:
-    raise KeyError("La columna 'Premarket Volume' no existe en stocks_filtrados")
-
-tmp_df2 = stocks_filtrados.copy()
-tmp_df2["Premarket Volume"] = tmp_df2["Premarket Volume"].astype(str).str.replace(",", "", regex=False).str.strip()
-tmp_df2["Premarket Volume"] = pd.to_numeric(tmp_df2["Premarket Volume"], errors="coerce")
-monthly_pmv = (
-    tmp_df2.groupby(["Period", "Month"], as_index=False)
-    .agg(PMH_Volume_Total=("Premarket Volume", "sum"))
-)
-monthly_pmv["YearMonth_dt"] = pd.to_datetime(
-    monthly_pmv["Period"].astype(str) + "-" + monthly_pmv["Month"].astype(str).str.zfill(2) + "-01",
-    format="%Y-%m-%d",
-    errors="coerce",
-)
-monthly_pmv = monthly_pmv.sort_values("YearMonth_dt").reset_index(drop=True)
-monthly_pmv["SMA_6"] = monthly_pmv["PMH_Volume_Total"].rolling(window=6, min_periods=1).mean()
-monthly_pmv["PMH_Volume_Total"] = monthly_pmv["PMH_Volume_Total"].round(2)
-monthly_pmv["SMA_6"] = monthly_pmv["SMA_6"].round(2)
-monthly_pmv["YearMonth"] = monthly_pmv["YearMonth_dt"].dt.strftime("%Y-%m")
+@perf.instrumentar(tipo="agregado")
+def calcular_monthly_pmv(df):
+    if "Premarket Volume" not in df.columns:
+        raise KeyError("La columna 'Premarket Volume' no existe en stocks_filtrados")
+
+    out = (
+        df.assign(**{"Premarket Volume": _a_numero(df["Premarket Volume"], quitar=(",",))})
+        .groupby(["Period", "Month"], as_index=False)
+        .agg(PMH_Volume_Total=("Premarket Volume", "sum"))
+    )
+    out["YearMonth_dt"] = _yearmonth_dt(out)
+    out = out.sort_values("YearMonth_dt").reset_index(drop=True)
+    out["SMA_6"] = out["PMH_Volume_Total"].rolling(window=6, min_periods=1).mean()
+    out["PMH_Volume_Total"] = out["PMH_Volume_Total"].round(2)
+    out["SMA_6"] = out["SMA_6"].round(2)
+    out["YearMonth"] = out["YearMonth_dt"].dt.strftime("%Y-%m")
+    return out
 
 # monthly_rth_fade
-if "RTH Fade to Close %" not in stocks_filtrados.columns:
-    raise KeyError("La columna 'RTH Fade to Close %' no existe en stocks_filtrados")
-
-tmp_df3 = stocks_filtrados.copy()
-tmp_df3["RTH Fade to Close %"] = tmp_df3["RTH Fade to Close %"].astype(str).str.replace("%", "", regex=False).str.replace(",", "", regex=False).str.strip()
-tmp_df3["RTH Fade to Close %"] = pd.to_numeric(tmp_df3["RTH Fade to Close %"], errors="coerce")
-monthly_rth_fade = (
-    tmp_df3.groupby(["Period", "Month"], as_index=False)
-    .agg(RTH_Fade_Mean=("RTH Fade to Close %", "mean"))
-)
-monthly_rth_fade["YearMonth_dt"] = pd.to_datetime(
-    monthly_rth_fade["Period"].astype(str) + "-" + monthly_rth_fade["Month"].astype(str).str.zfill(2) + "-01",
-    format="%Y-%m-%d",
-    errors="coerce",
-)
-monthly_rth_fade = monthly_rth_fade.sort_values("YearMonth_dt").reset_index(drop=True)
-monthly_rth_fade["Fade (%)"] = monthly_rth_fade["RTH_Fade_Mean"] * 100
-monthly_rth_fade["SMA_6"] = monthly_rth_fade["Fade (%)"].rolling(window=6, min_periods=1).mean()
-monthly_rth_fade["Fade (%)"] = monthly_rth_fade["Fade (%)"].round(2)
-monthly_rth_fade["SMA_6"] = monthly_rth_fade["SMA_6"].round(2)
-monthly_rth_fade["YearMonth"] = monthly_rth_fade["YearMonth_dt"].dt.strftime("%Y-%m")
+@perf.instrumentar(tipo="agregado")
+def calcular_monthly_rth_fade(df):
+    if "RTH Fade to Close %" not in df.columns:
+        raise KeyError("La columna 'RTH Fade to Close %' no existe en stocks_filtrados")
+
+    out = (
+        df.assign(**{"RTH Fade to Close %": _a_numero(df["RTH Fade to Close %"])})
+        .groupby(["Period", "Month"], as_index=False)
+        .agg(RTH_Fade_Mean=("RTH Fade to Close %", "mean"))
+    )
+    out["YearMonth_dt"] = _yearmonth_dt(out)
+    out = out.sort_values("YearMonth_dt").reset_index(drop=True)
+    out["Fade (%)"] = out["RTH_Fade_Mean"] * 100
+    out["SMA_6"] = out["Fade (%)"].rolling(window=6, min_periods=1).mean()
+    out["Fade (%)"] = out["Fade (%)"].round(2)
+    out["SMA_6"] = out["SMA_6"].round(2)
+    out["YearMonth"] = out["YearMonth_dt"].dt.strftime("%Y-%m")
+    return out
 
 # -------------------------------------------------------------
 # FIGURAS (funciones)
 # -------------------------------------------------------------
+# Las series salen de s.serie_temporal (serie_temporal.py) a la granularidad
+# pedida: "D", "W", "M" o "Q"; ventana de la SMA en esa unidad (por defecto ~6 meses).
+# ic=True añade los bigotes del IC bootstrap 95 % de la media (s.ic_mensual, solo "M").
+def _barras_ic(fig, d, columna, s, metrica, granularidad="M", x="Periodo"):
+    if granularidad != "M":
+        return fig
+    ic = s.ic_mensual.reindex(d[x])
+    v = d[columna].to_numpy(dtype=float)
+    fig.update_traces(
+        selector=dict(type="bar"),
+        error_y=dict(type="data", symmetric=False, thickness=1, width=2, color="#bbbbbb",
+                     array=np.clip(ic[f"{metrica}_hi"].to_numpy() - v, 0, None),
+                     arrayminus=np.clip(v - ic[f"{metrica}_lo"].to_numpy(), 0, None)),
+    )
+    return fig
+
 
-def grafico_gappers():
-    fig = px.bar(monthly_counts,x="YearMonth",y="Stocks",title="   Gaps / mes",
-                 labels={"YearMonth":"Mes","Stocks":"Gaps"},template="plotly_dark")
-    fig.add_scatter(x=monthly_counts["YearMonth"], y=monthly_counts["SMA_6"],
+def grafico_gappers(s=None, granularidad="M", ventana=None):
+    s = s or snapshot()
+    d = s.serie_temporal.serie(granularidad, "stocks", ventana)
+    fig = px.bar(d,x="Periodo",y="Stocks",title="   Gaps / " + NOMBRES_NIVEL[granularidad].lower(),
+                 labels={"Periodo": NOMBRES_NIVEL[granularidad], "Stocks": "Gaps"},template="plotly_dark")
+    fig.add_scatter(x=d["Periodo"], y=d["SMA"],
                     mode="lines", name="SMA", line=dict(width=3,color="#ff9933"))
     fig.update_layout(xaxis_tickangle=90,height=450)
     return fig
 
-def grafico_volumen():
-    fig = px.bar(monthly_volume,x="YearMonth",y="EOD Volume",title="   Volumen total",
-                 labels={"YearMonth":"Mes"},template="plotly_dark")
-    fig.add_scatter(x=monthly_volume["YearMonth"], y=monthly_volume["SMA_6"],
+def grafico_volumen(s=None, granularidad="M", ventana=None):
+    s = s or snapshot()
+    d = s.serie_temporal.serie(granularidad, "volume", ventana)
+    fig = px.bar(d,x="Periodo",y="EOD Volume",title="   Volumen total",
+                 labels={"Periodo": NOMBRES_NIVEL[granularidad]},template="plotly_dark")
+    fig.add_scatter(x=d["Periodo"], y=d["SMA"],
                     mode="lines", name="SMA", line=dict(width=3,color="#ff9933"))
     fig.update_layout(xaxis_tickangle=90,height=450)
     return fig
 
-def grafico_gap():
-    fig = px.bar(monthly_gap_open,x="YearMonth",y="Gap (%)",title="   Gap Value %",
-                 labels={"YearMonth":"Mes","Gap (%)":"Gap (%)"},template="plotly_dark")
-    fig.add_scatter(x=monthly_gap_open["YearMonth"], y=monthly_gap_open["SMA_6"],
+def grafico_gap(s=None, granularidad="M", ventana=None, ic=False):
+    s = s or snapshot()
+    d = s.serie_temporal.serie(granularidad, "gap", ventana)
+    fig = px.bar(d,x="Periodo",y="Gap (%)",title="   Gap Value %",
+                 labels={"Periodo": NOMBRES_NIVEL[granularidad], "Gap (%)": "Gap (%)"},template="plotly_dark")
+    fig.add_scatter(x=d["Periodo"], y=d["SMA"],
                     mode="lines", name="SMA", line=dict(width=3,color="#ff9933"))
     fig.update_layout(xaxis_tickangle=90,height=450)
+    if ic:
+        _barras_ic(fig, d, "Gap (%)", s, "gap", granularidad)
     return fig
 
-def grafico_highspike():
-    fig = px.bar(monthly_highspike,x="YearMonth",y="High Spike (%)",title="   High Spike %",
-                 labels={"YearMonth":"Mes"},template="plotly_dark")
-    fig.add_scatter(x=monthly_highspike["YearMonth"], y=monthly_highspike["SMA_6"],
+def grafico_highspike(s=None, granularidad="M", ventana=None, ic=False):
+    s = s or snapshot()
+    d = s.serie_temporal.serie(granularidad, "highspike", ventana)
+    fig = px.bar(d,x="Periodo",y="High Spike (%)",title="   High Spike %",
+                 labels={"Periodo": NOMBRES_NIVEL[granularidad]},template="plotly_dark")
+    fig.add_scatter(x=d["Periodo"], y=d["SMA"],
                     mode="lines", name="SMA", line=dict(width=3,color="#ff9933"))
     fig.update_layout(xaxis_tickangle=90,height=450)
+    if ic:
+        _barras_ic(fig, d, "High Spike (%)", s, "highspike", granularidad)
     return fig
 
-def grafico_lowspike():
-    fig = px.bar(monthly_lowspike,x="YearMonth",y="Low Spike (%)",title="   Low Spike %",
-                 labels={"YearMonth":"Mes"},template="plotly_dark")
-    fig.add_scatter(x=monthly_lowspike["YearMonth"], y=monthly_lowspike["SMA_6"],
+def grafico_lowspike(s=None, granularidad="M", ventana=None, ic=False):
+    s = s or snapshot()
+    d = s.serie_temporal.serie(granularidad, "lowspike", ventana)
+    fig = px.bar(d,x="Periodo",y="Low Spike (%)",title="   Low Spike %",
+                 labels={"Periodo": NOMBRES_NIVEL[granularidad]},template="plotly_dark")
+    fig.add_scatter(x=d["Periodo"], y=d["SMA"],
                     mode="lines", name="SMA", line=dict(width=3,color="#ff9933"))
     fig.update_layout(xaxis_tickangle=90,height=450)
+    if ic:
+        _barras_ic(fig, d, "Low Spike (%)", s, "lowspike", granularidad)
     return fig
 
-def grafico_range():
-    fig = px.bar(monthly_range,x="YearMonth",y="Range (%)",title="   RTH Range %",
-                 labels={"YearMonth":"Mes"},template="plotly_dark")
-    fig.add_scatter(x=monthly_range["YearMonth"], y=monthly_range["SMA_6"],
+def grafico_range(s=None, granularidad="M", ventana=None, ic=False):
+    s = s or snapshot()
+    d = s.serie_temporal.serie(granularidad, "range", ventana)
+    fig = px.bar(d,x="Periodo",y="Range (%)",title="   RTH Range %",
+                 labels={"Periodo": NOMBRES_NIVEL[granularidad]},template="plotly_dark")
+    fig.add_scatter(x=d["Periodo"], y=d["SMA"],
                     mode="lines", name="SMA", line=dict(width=3,color="#ff9933"))
     fig.update_layout(xaxis_tickangle=90,height=450)
+    if ic:
+        _barras_ic(fig, d, "Range (%)", s, "range", granularidad)
     return fig
 
-def grafico_closered():
-    fig = px.bar(monthly_closered,x="YearMonth",y="Close Red (%)",title="   Close Red %",
-                 labels={"YearMonth":"Mes"},template="plotly_dark")
-    fig.add_scatter(x=monthly_closered["YearMonth"], y=monthly_closered["SMA_6"],
+def grafico_closered(s=None, granularidad="M", ventana=None, ic=False):
+    s = s or snapshot()
+    d = s.serie_temporal.serie(granularidad, "closered", ventana)
+    fig = px.bar(d,x="Periodo",y="Close Red (%)",title="   Close Red %",
+                 labels={"Periodo": NOMBRES_NIVEL[granularidad]},template="plotly_dark")
+    fig.add_scatter(x=d["Periodo"], y=d["SMA"],
                     mode="lines", name="SMA", line=dict(width=3,color="#ff9933"))
     fig.update_layout(xaxis_tickangle=90,height=450)
+    if ic:
+        _barras_ic(fig, d, "Close Red (%)", s, "closered", granularidad)
     return fig
 
 
-# FIGURA 2 – CLOSE RED (stack horizontal)
-fig_2 = go.Figure()
-fig_2.add_trace(
-    go.Bar(
-        x=[neg_pct],
-        y=["Retorno"],
-        width=0.48,
-        orientation="h",
-        marker=dict(color="#ef553b", line=dict(color="#aa3d2d", width=1.5)),
-        name="Negativas",
-        hovertemplate=("<b>Acciones negativas</b><br>" f"Cantidad: {neg_count}<br>" f"Porcentaje: {neg_pct}%" "<extra></extra>"),
-    )
-)
-fig_2.add_trace(
-    go.Bar(
-        x=[pos_pct],
-        y=["Retorno"],
-        width=0.48,
-        orientation="h",
-        marker=dict(color="#00cc96", line=dict(color="#0f8a63", width=1.5)),
-        name="Positivas",
-        hovertemplate=("<b>Acciones positivas</b><br>" f"Cantidad: {pos_count}<br>" f"Porcentaje: {pos_pct}%" "<extra></extra>"),
-    )
-)
-fig_2.update_layout(
-    barmode="stack",
-    template="plotly_dark",
-    height=240,
-    title=dict(text=f"Close Red — {neg_pct}%      |      Total Gaps Filtradas: {total}", x=0.5, xanchor="center", font=dict(size=18, color="white")),
-    legend=dict(orientation="h", yanchor="bottom", y=-0.35, xanchor="center", x=0.5, font=dict(size=12)),
-    margin=dict(t=60, l=20, r=20, b=60),
-)
-fig_2.update_xaxes(showticklabels=False, range=[0, 100])
-fig_2.update_yaxes(showticklabels=False)
-
-
 # FIGURA 2 – CLOSE RED PM (stack)
-def crear_grafico_retornos_stack():
+def crear_grafico_retornos_stack(s=None):
+    s = s or snapshot()
     fig_2_local = go.Figure()
     fig_2_local.add_trace(
         go.Bar(
-            x=[neg_pct_1],
+            x=[s.neg_pct_1],
             y=["Retorno"],
             width=0.48,
             orientation="h",
             marker=dict(color="#ef553b", line=dict(color="#aa3d2d", width=1.5)),
             name="Negativas",
-            hovertemplate=("<b>Acciones negativas</b><br>" f"Cantidad: {neg_count_1}<br>" f"Porcentaje: {neg_pct_1}%" "<extra></extra>"),
+            hovertemplate=("<b>Acciones negativas</b><br>" f"Cantidad: {s.neg_count_1}<br>" f"Porcentaje: {s.neg_pct_1}%" "<extra></extra>"),
         )
     )
     fig_2_local.add_trace(
         go.Bar(
-            x=[pos_pct_1],
+            x=[s.pos_pct_1],
             y=["Retorno"],
             width=0.48,
             orientation="h",
             marker=dict(color="#00cc96", line=dict(color="#0f8a63", width=1.5)),
             name="Positivas",
-            hovertemplate=("<b>Acciones positivas</b><br>" f"Cantidad: {pos_count_1}<br>" f"Porcentaje: {pos_pct_1}%" "<extra></extra>"),
+            hovertemplate=("<b>Acciones positivas</b><br>" f"Cantidad: {s.pos_count_1}<br>" f"Porcentaje: {s.pos_pct_1}%" "<extra></extra>"),
         )
     )
     fig_2_local.update_layout(
         barmode="stack",
         template="plotly_dark",
         height=450,
-        title=dict(text=f"Fade PM > 15% — {neg_pct_1}%      |      Total Gaps Filtradas: {total_1}", x=0.5, xanchor="center", font=dict(size=18, color="white")),
+        title=dict(text=f"Fade PM > 15% — {s.neg_pct_1}%      |      Total Gaps Filtradas: {s.total_1}", x=0.5, xanchor="center", font=dict(size=18, color="white")),
         legend=dict(orientation="h", yanchor="bottom", y=-0.35, xanchor="center", x=0.5, font=dict(size=12)),
         margin=dict(t=60, l=20, r=20, b=60),
     )
@@ -483,59 +501,34 @@ def crear_grafico_retornos_stack():
     return fig_2_local
 
 
-# FIGURA 3 – METRICA / MEDIA / MEDIANA (tabla)
-fig_3 = go.Figure(
-    data=[
-        go.Table(
-            header=dict(
-                values=["<b>Métrica</b>", "<b>Media</b>", "<b>Mediana</b>"],
-                fill_color="#1f1f2e",
-                font=dict(color="white", size=14),
-                align="left",
-            ),
-            cells=dict(
-                values=[metrics, avg_values, median_values],
-                fill_color="#11121A",
-                align="left",
-                font=dict(color="white", size=13),
-                height=35,
-            ),
-        )
-    ]
-)
-fig_3.update_layout(template="plotly_dark", height=350, margin=dict(t=20, b=20, l=20, r=20))
-
-
 # FIGURA 4 – RETURN GAPPERS/MES
-stocks_filtrados["Date"] = pd.to_datetime(stocks_filtrados["Date"])
-stocks_filtrados["Year"] = stocks_filtrados["Date"].dt.year
-stocks_filtrados["Month"] = stocks_filtrados["Date"].dt.month
-monthly_return = stocks_filtrados.groupby(["Year", "Month"])["Day Return %"].mean().reset_index()
-monthly_return["YearMonth"] = monthly_return["Year"].astype(str) + "-" + monthly_return["Month"].astype(str).str.zfill(2)
-monthly_return["Return (%)"] = round(monthly_return["Day Return %"] * 100, 2)
-
-fig_4 = px.bar(
-    monthly_return,
-    x="YearMonth",
-    y="Return (%)",
-    title="   Return gaps/mes",
-    labels={"YearMonth": "Mes", "Return (%)": "Retorno promedio (%)"},
-    template="plotly_dark",
-)
-fig_4.update_layout(xaxis_tickangle=90, height=450)
-
+@perf.instrumentar(tipo="agregado")
+def calcular_monthly_return(df):
+    fechas = pd.to_datetime(df["Date"])
+    out = (
+        df.assign(Year=fechas.dt.year, Month=fechas.dt.month)
+        .groupby(["Year", "Month"])["Day Return %"]
+        .mean()
+        .reset_index()
+    )
+    out["YearMonth"] = out["Year"].astype(str) + "-" + out["Month"].astype(str).str.zfill(2)
+    out["Return (%)"] = round(out["Day Return %"] * 100, 2)
+    return out
 
 # -------------------------------------------------------------
 # DISTRIBUTIONS / TIME / PM / RTH
 # -------------------------------------------------------------
-def grafico_highspike_distribution():
-    bins = [0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 9999]
-    labels = ["0% - 10% ", "10% - 20% ", "20% - 30% ", "30% - 40% ", "40% - 50% ", "50% - 60% ", "60% - 70% ", "70% - 80% ", "80% - 90% ", "90% - 100% ", ">100% "]
-
-    df = stocks_filtrados.copy()
-    df["HS_bin"] = pd.cut(df["High Spike %"] * 100, bins=bins, labels=labels, include_lowest=True)
-    distrib = df["HS_bin"].value_counts().reset_index()
-    distrib.columns = ["Rango", "Acciones"]
+# Los conteos salen del cubo del snapshot (cubo.py): filtro = {dimensión: valores}
+# sobre year / month / precio / gap / pmh, sin recorrer las filas.
+def _tabla_distribucion(distrib, rango="Rango"):
+    return distrib.rename("Acciones").rename_axis(rango).reset_index()
+
+
+def grafico_highspike_distribution(s=None, filtro=None):
+    s = s or snapshot()
+    labels = Cubo.etiquetas("highspike")
+    # Ordenada por frecuencia (como value_counts), no por tramo
+    distrib = _tabla_distribucion(s.cubo.distribucion("highspike", filtro).sort_values(ascending=False))
     distrib = distrib.iloc[::-1]
 
     fig = px.bar(
@@ -552,15 +545,10 @@ def grafico_highspike_distribution():
     return fig
 
 
-def grafico_lowspike_distribution():
-    bins = [0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 9999]
-    labels = ["0% - 10% ", "10% - 20% ", "20% - 30% ", "30% - 40% ", "40% - 50% ", "50% - 60% ", "60% - 70% ", "70% - 80% ", "80% - 90% ", "90% - 100% ", "=100% "]
-
-    df = stocks_filtrados.copy()
-    df["LS_abs"] = (df["Low Spike %"] * -100).abs()
-    df["LS_bin"] = pd.cut(df["LS_abs"], bins=bins, labels=labels, include_lowest=True)
-    distrib = df["LS_bin"].value_counts().reindex(labels).reset_index()
-    distrib.columns = ["Rango", "Acciones"]
+def grafico_lowspike_distribution(s=None, filtro=None):
+    s = s or snapshot()
+    labels = Cubo.etiquetas("lowspike")
+    distrib = _tabla_distribucion(s.cubo.distribucion("lowspike", filtro))
     distrib = distrib.iloc[::-1]
 
     fig = px.bar(distrib, x="Acciones", y="Rango", orientation="h", labels={"Acciones": "Gaps", "Rango": ""}, template="plotly_dark", title="LOW SPIKE DISTRIBUTION")
@@ -569,30 +557,10 @@ def grafico_lowspike_distribution():
     return fig
 
 
-def grafico_lod_distribution():
-    df = stocks_filtrados.copy()
-    df["LOD_dt"] = pd.to_datetime(df["LOD Time"], format="%H:%M", errors="coerce")
-    df = df.dropna(subset=["LOD_dt"])
-    df["minutos"] = (df["LOD_dt"].dt.hour * 60 + df["LOD_dt"].dt.minute) - (9 * 60 + 30)
-    bins = list(range(0, 390 + 30, 30))
-    labels = [
-        "09:30-10:00 ",
-        "10:00-10:30 ",
-        "10:30-11:00 ",
-        "11:00-11:30 ",
-        "11:30-12:00 ",
-        "12:00-12:30 ",
-        "12:30-13:00 ",
-        "13:00-13:30 ",
-        "13:30-14:00 ",
-        "14:00-14:30 ",
-        "14:30-15:00 ",
-        "15:00-15:30 ",
-        "15:30-16:00 ",
-    ]
-    df["LOD_bin"] = pd.cut(df["minutos"], bins=bins, labels=labels, include_lowest=True)
-    distrib = df["LOD_bin"].value_counts().reindex(labels).reset_index()
-    distrib.columns = ["Rango", "Acciones"]
+def grafico_lod_distribution(s=None, filtro=None):
+    s = s or snapshot()
+    labels = Cubo.etiquetas("lod")
+    distrib = _tabla_distribucion(s.cubo.distribucion("lod", filtro))
     distrib = distrib.iloc[::-1]
 
     fig = px.bar(distrib, x="Acciones", y="Rango", orientation="h", title="LOD TIME DISTRIBUTION", labels={"Acciones": "Gaps", "Rango": ""}, template="plotly_dark")
@@ -601,30 +569,10 @@ def grafico_lod_distribution():
     return fig
 
 
-def grafico_hod_distribution():
-    df = stocks_filtrados.copy()
-    df["HOD_dt"] = pd.to_datetime(df["HOD Time"], format="%H:%M", errors="coerce")
-    df = df.dropna(subset=["HOD_dt"])
-    df["minutos"] = (df["HOD_dt"].dt.hour * 60 + df["HOD_dt"].dt.minute) - (9 * 60 + 30)
-    bins = list(range(0, 390 + 30, 30))
-    labels = [
-        "09:30-10:00 ",
-        "10:00-10:30 ",
-        "10:30-11:00 ",
-        "11:00-11:30 ",
-        "11:30-12:00 ",
-        "12:00-12:30 ",
-        "12:30-13:00 ",
-        "13:00-13:30 ",
-        "13:30-14:00 ",
-        "14:00-14:30 ",
-        "14:30-15:00 ",
-        "15:00-15:30 ",
-        "15:30-16:00 ",
-    ]
-    df["HOD_bin"] = pd.cut(df["minutos"], bins=bins, labels=labels, include_lowest=True)
-    distrib = df["HOD_bin"].value_counts().reindex(labels).reset_index()
-    distrib.columns = ["Rango", "Acciones"]
+def grafico_hod_distribution(s=None, filtro=None):
+    s = s or snapshot()
+    labels = Cubo.etiquetas("hod")
+    distrib = _tabla_distribucion(s.cubo.distribucion("hod", filtro))
     distrib = distrib.iloc[::-1]
 
     fig = px.bar(distrib, x="Acciones", y="Rango", orientation="h", title="HOD TIME DISTRIBUTION", labels={"Acciones": "Gaps", "Rango": ""}, template="plotly_dark")
@@ -633,14 +581,10 @@ def grafico_hod_distribution():
     return fig
 
 
-def grafico_return_distribution():
-    df = stocks_filtrados.copy()
-    df["Return_pct"] = df["Day Return %"] * 100
-    bins = [-100, -80, -60, -40, -20, 0, 20, 40, 60, 80, 100, 9999]
-    labels = ["-100% a -80%", "-80% a -60%", "-60% a -40%", "-40% a -20%", "-20% a 0%", "0% a 20%", "20% a 40%", "40% a 60%", "60% a 80%", "80% a 100%", ">100%"]
-    df["Return_bin"] = pd.cut(df["Return_pct"], bins=bins, labels=labels, include_lowest=True)
-    distrib = df["Return_bin"].value_counts().reindex(labels).reset_index()
-    distrib.columns = ["Rango", "Acciones"]
+def grafico_return_distribution(s=None, filtro=None):
+    s = s or snapshot()
+    labels = Cubo.etiquetas("return")
+    distrib = _tabla_distribucion(s.cubo.distribucion("return", filtro))
 
     fig = px.bar(distrib, x="Acciones", y="Rango", orientation="h", labels={"Acciones": "Gaps", "Rango": ""}, title="RETURN DISTRIBUTION", template="plotly_dark")
     fig.update_traces(marker_color="#69b3ff")
@@ -648,14 +592,10 @@ def grafico_return_distribution():
     return fig
 
 
-def grafico_gap_size_distribution():
-    df = stocks_filtrados.copy()
-    df["Gap_pct"] = df["Open Gap %"] * 100
-    bins = [0, 40, 60, 80, 100, 150, 200, 250, 300, 400, 99999]
-    labels = ["0% - 40%", "40% - 60%", "60% - 80%", "80% - 100%", "100% - 150%", "150% - 200%", "200% - 250%", "250% - 300%", "300% - 400%", ">400%"]
-    df["Gap_bin"] = pd.cut(df["Gap_pct"], bins=bins, labels=labels, include_lowest=True)
-    distrib = df["Gap_bin"].value_counts().reindex(labels).reset_index()
-    distrib.columns = ["Rango", "Acciones"]
+def grafico_gap_size_distribution(s=None, filtro=None):
+    s = s or snapshot()
+    labels = Cubo.etiquetas("gap")
+    distrib = _tabla_distribucion(s.cubo.distribucion("gap", filtro))
     distrib = distrib.iloc[::-1]
 
     fig = px.bar(distrib, x="Acciones", y="Rango", orientation="h", labels={"Acciones": "Gaps", "Rango": ""}, title="GAP SIZE DISTRIBUTION", template="plotly_dark")
@@ -664,14 +604,10 @@ def grafico_gap_size_distribution():
     return fig
 
 
-def grafico_fade_distribution():
-    df = stocks_filtrados.copy()
-    df["Fade_pct"] = df["RTH Fade to Close %"] * 100
-    bins = [-100, -90, -80, -70, -60, -50, -40, -30, -20, -10, 0]
-    labels = ["-100% a -90%", "-90% a -80%", "-80% a -70%", "-70% a -60%", "-60% a -50%", "-50% a -40%", "-40% a -30%", "-30% a -20%", "-20% a -10%", "-10% a 0%"]
-    df["Fade_bin"] = pd.cut(df["Fade_pct"], bins=bins, labels=labels, include_lowest=True)
-    distrib = df["Fade_bin"].value_counts().reindex(labels).reset_index()
-    distrib.columns = ["Rango", "Acciones"]
+def grafico_fade_distribution(s=None, filtro=None):
+    s = s or snapshot()
+    labels = Cubo.etiquetas("fade")
+    distrib = _tabla_distribucion(s.cubo.distribucion("fade", filtro))
 
     fig = px.bar(distrib, x="Acciones", y="Rango", orientation="h", labels={"Acciones": "Gaps", "Rango": ""}, title="RTH FADE TO CLOSE DISTRIBUTION", template="plotly_dark")
     fig.update_traces(marker_color="#69b3ff")
@@ -680,17 +616,33 @@ def grafico_fade_distribution():
 
 
 # -------------------------------------------------------------
-# AVG CHANGE FROM OPEN (INTRADÍA) - usa intraday_df cargado arriba
+# AVG CHANGE FROM OPEN (INTRADÍA) - usa intraday_df del snapshot
 # -------------------------------------------------------------
-def grafico_intradia():
-    if intraday_df.empty:
+def _en_sesiones(df, stocks_filtrados):
+    """Máscara de las velas de df (ticker, date) cuya sesión está en stocks_filtrados (claves int64).
+
+    Tickers o fechas que no caben en la clave (session_keys.codificables) no casan con nada.
+    """
+    sf = stocks_filtrados
+    sf = sf[sk.codificables(sf["Ticker"], sf["Date"])]
+    permitidas = np.unique(sk.encode_sessions(sf["Ticker"], sf["Date"]))
+    ok = sk.codificables(df["ticker"], df["date"])
+    out = np.zeros(len(df), dtype=bool)
+    if ok.any():
+        out[ok] = sk.isin_sorted(sk.encode_sessions(df["ticker"][ok], df["date"][ok]), permitidas)
+    return out
+
+
+def grafico_intradia(s=None):
+    s = s or snapshot()
+    if s.intraday_df.empty:
         # Si no pudimos descargar el CSV, devolvemos una figura vacía informativa
         fig = go.Figure()
         fig.update_layout(title="Data 15min no disponible", template="plotly_dark", height=300)
         return fig
 
-    # Trabaja con copia local para no mutar intraday_df global
-    df = intraday_df.copy()
+    # Trabaja con copia local para no mutar el intraday_df del snapshot
+    df = s.intraday_df.copy()
 
     df["date"] = pd.to_datetime(df["date"], format="%Y-%m-%d", errors="coerce").dt.date
 
@@ -736,15 +688,8 @@ def grafico_intradia():
     ]
     df = df[df["bar_time_local"].isin(RTH)].copy()
 
-    sf = stocks_filtrados.copy()
-    if "Ticker" in sf.columns and "ticker" not in sf.columns:
-        sf = sf.rename(columns={"Ticker": "ticker"})
-
-    sf["Date"] = pd.to_datetime(sf["Date"]).dt.date
-    allowed = set(zip(sf["ticker"].astype(str), sf["Date"]))
-
     df["date"] = pd.to_datetime(df["date"]).dt.date
-    df = df[df.apply(lambda r: (str(r["ticker"]), r["date"]) in allowed, axis=1)].copy()
+    df = df[_en_sesiones(df, s.stocks_filtrados)].copy()
 
     open0930 = df[df["bar_time_local"] == "09:30"][["ticker", "date", "open"]].rename(columns={"open": "open_0930"})
     df = df.merge(open0930, on=["ticker", "date"], how="left")
@@ -811,59 +756,55 @@ def grafico_intradia():
 # -------------------------------------------------------------
 # MULTIFRAME & RELATED
 # -------------------------------------------------------------
-def grafico_multiframe_returns():
-    df = stocks_filtrados.copy()
-    columnas = ["M1 Return %", "M5 Return %", "M15 Return %", "M30 Return %", "M60 Return %", "M120 Return %", "M180 Return %", "Day Return %"]
-    labels = ["1 min Return", "5 min Return", "15 min Return", "30 min Return", "60 min Return", "120 min Return", "180 min Return", "Return"]
-    valores = [(df[col] * 100).mean() for col in columnas]
-    valores = valores[::-1]
-    labels = labels[::-1]
+# Valores de s.multiframe (multiframe.py): una reducción por filtro para los cinco
+# paneles; estadistico = media, mediana, p10, p25, p75 o p90.
+def _multiframe(s, panel, estadistico, filtro):
+    pares = s.multiframe.panel(panel, estadistico, filtro)[::-1]
+    return [p[0] for p in pares], [p[1] for p in pares]
+
+
+def _sufijo(estadistico):
+    return "" if estadistico == "media" else f" ({estadistico})"
+
+
+def grafico_multiframe_returns(s=None, estadistico="media", filtro=None):
+    s = s or snapshot()
+    labels, valores = _multiframe(s, "returns", estadistico, filtro)
     colores = ["#ef553b" if v < 0 else "#00cc96" for v in valores]
 
     fig = go.Figure()
     fig.add_trace(go.Bar(x=valores, y=labels, orientation="h", marker=dict(color=colores), textposition="outside"))
-    fig.update_layout(template="plotly_dark", title="   Multi-Timeframe Return %", height=450, xaxis=dict(ticksuffix="%"), margin=dict(l=60, r=20, t=60, b=20))
+    fig.update_layout(template="plotly_dark", title="   Multi-Timeframe Return %" + _sufijo(estadistico), height=450, xaxis=dict(ticksuffix="%"), margin=dict(l=60, r=20, t=60, b=20))
     return fig
 
 
-def grafico_multiframe_highspike():
-    df = stocks_filtrados.copy()
-    columnas = ["M1 High Spike %", "M5 High Spike %", "M15 High Spike %", "M30 High Spike %", "M60 High Spike %", "M120 High Spike %", "M180 High Spike %"]
-    labels = ["1 min High Spike ", "5 min High Spike ", "15 min High Spike ", "30 min High Spike ", "60 min High Spike ", "120 min High Spike ", "180 min High Spike "]
-    valores = [(df[col] * 100).mean() for col in columnas]
-    valores = valores[::-1]
-    labels = labels[::-1]
+def grafico_multiframe_highspike(s=None, estadistico="media", filtro=None):
+    s = s or snapshot()
+    labels, valores = _multiframe(s, "highspike", estadistico, filtro)
     colores = ["#ef553b" if v < 0 else "#00cc96" for v in valores]
 
     fig = go.Figure()
     fig.add_trace(go.Bar(x=valores, y=labels, orientation="h", marker=dict(color=colores), textposition="outside"))
-    fig.update_layout(template="plotly_dark", title="   Multi-Timeframe High Spike %", height=450, xaxis=dict(ticksuffix="%"), margin=dict(l=60, r=20, t=60, b=20))
+    fig.update_layout(template="plotly_dark", title="   Multi-Timeframe High Spike %" + _sufijo(estadistico), height=450, xaxis=dict(ticksuffix="%"), margin=dict(l=60, r=20, t=60, b=20))
     return fig
 
 
-def grafico_multiframe_lowspike():
-    df = stocks_filtrados.copy()
-    columnas = ["M1 Low Spike %", "M5 Low Spike %", "M15 Low Spike %", "M30 Low Spike %", "M60 Low Spike %", "M120 Low Spike %", "M180 Low Spike %"]
-    labels = ["1 min Low Spike ", "5 min Low Spike ", "15 min Low Spike ", "30 min Low Spike ", "60 min Low Spike ", "120 min Low Spike ", "180 min Low Spike "]
-    valores = [(df[col] * 100).mean() for col in columnas]
-    valores = valores[::-1]
-    labels = labels[::-1]
+def grafico_multiframe_lowspike(s=None, estadistico="media", filtro=None):
+    s = s or snapshot()
+    labels, valores = _multiframe(s, "lowspike", estadistico, filtro)
     colores = ["#ef553b" if v < 0 else "#00cc96" for v in valores]
 
     fig = go.Figure()
     fig.add_trace(go.Bar(x=valores, y=labels, orientation="h", marker=dict(color=colores), textposition="outside"))
-    fig.update_layout(template="plotly_dark", title="   Multi-Timeframe Low Spike %", height=450, xaxis=dict(ticksuffix="%"), margin=dict(l=60, r=20, t=60, b=20))
+    fig.update_layout(template="plotly_dark", title="   Multi-Timeframe Low Spike %" + _sufijo(estadistico), height=450, xaxis=dict(ticksuffix="%"), margin=dict(l=60, r=20, t=60, b=20))
     return fig
 
 
 # PRICE RANGE
-def grafico_price_range_distribution():
-    df = stocks_filtrados.copy()
-    bins = [0, 1, 3, 5, 10, 9999]
-    labels = ["0 - 1 $ ", "1 - 3 $ ", "3 - 5 $ ", "5 - 10 $ ", "> 10 $ "]
-    df["PriceBin"] = pd.cut(df["Open Price"], bins=bins, labels=labels, include_lowest=True)
-    distrib = df["PriceBin"].value_counts().reindex(labels).reset_index()
-    distrib.columns = ["Rango", "Acciones"]
+def grafico_price_range_distribution(s=None, filtro=None):
+    s = s or snapshot()
+    labels = Cubo.etiquetas("precio")
+    distrib = _tabla_distribucion(s.cubo.distribucion("precio", filtro))
     distrib = distrib.iloc[::-1]
 
     fig = px.bar(distrib, x="Acciones", y="Rango", orientation="h", labels={"Acciones": "Gaps", "Rango": ""}, title="PRICE RANGE DISTRIBUTION", template="plotly_dark")
@@ -872,10 +813,9 @@ def grafico_price_range_distribution():
     return fig
 
 
-def grafico_gaps_por_ano():
-    df = stocks_filtrados.copy()
-    df["Year"] = pd.to_datetime(df["Date"]).dt.year
-    conteo = df.groupby("Year").size().reset_index(name="Gaps")
+def grafico_gaps_por_ano(s=None, filtro=None):
+    s = s or snapshot()
+    conteo = s.cubo.rollup(["year"], filtro).rename(columns={"year": "Year", "n": "Gaps"})
 
     fig = go.Figure()
     fig.add_trace(go.Bar(x=conteo["Year"], y=conteo["Gaps"], marker=dict(color="#00cc96")))
@@ -883,61 +823,34 @@ def grafico_gaps_por_ano():
     return fig
 
 
-def grafico_multiframe_return_to_close():
-    df = stocks_filtrados.copy()
-    columnas = ["Return % From M1 to Close", "Return % From M5 to Close", "Return % From M15 to Close", "Return % From M30 to Close", "Return % From M60 to Close", "Return % From M120 to Close", "Return % From M180 to Close"]
-    labels = ["From M1 to close", "From M5 to close", "From M15 to close", "From M30 to close", "From M60 to close", "From M120 to close", "From M180 to close"]
-    valores = [(df[col] * 100).mean() for col in columnas]
-    valores = valores[::-1]
-    labels = labels[::-1]
+def grafico_multiframe_return_to_close(s=None, estadistico="media", filtro=None):
+    s = s or snapshot()
+    labels, valores = _multiframe(s, "return_to_close", estadistico, filtro)
     colores = ["#ef553b" if v < 0 else "#00cc96" for v in valores]
 
     fig = go.Figure()
     fig.add_trace(go.Bar(x=valores, y=labels, orientation="h", marker=dict(color=colores), textposition="outside"))
-    fig.update_layout(template="plotly_dark", title="   Multi-Timeframe Return % to close", height=450, xaxis=dict(ticksuffix="%"), margin=dict(l=60, r=20, t=60, b=20))
+    fig.update_layout(template="plotly_dark", title="   Multi-Timeframe Return % to close" + _sufijo(estadistico), height=450, xaxis=dict(ticksuffix="%"), margin=dict(l=60, r=20, t=60, b=20))
     return fig
 
 
-def grafico_multiframe_vwap_distance():
-    df = stocks_filtrados.copy()
-    vwap_cols = {"VWAP Open": "VWAP at Open", "VWAP 5m": "VWAP at M5", "VWAP 15m": "VWAP at M15", "VWAP 30m": "VWAP at M30", "VWAP 60m": "VWAP at M60", "VWAP 90m": "VWAP at M90", "VWAP 120m": "VWAP at M120", "VWAP 180m": "VWAP at M180"}
-    price_cols = {"VWAP Open": "Open Price", "VWAP 5m": "M5 Price", "VWAP 15m": "M15 Price", "VWAP 30m": "M30 Price", "VWAP 60m": "M60 Price", "VWAP 90m": "M90 Price", "VWAP 120m": "M120 Price", "VWAP 180m": "M180 Price"}
-
-    labels = list(vwap_cols.keys())
-    distancias = []
-    for label in labels:
-        vwap_col = vwap_cols[label]
-        price_col = price_cols[label]
-        # calculo seguro por si hay NaNs
-        dist = (pd.to_numeric(df.get(price_col, pd.Series(dtype=float)), errors="coerce") - pd.to_numeric(df.get(vwap_col, pd.Series(dtype=float)), errors="coerce")) / pd.to_numeric(df.get(vwap_col, pd.Series(dtype=float)), errors="coerce") * 100
-        distancias.append(np.nanmean(dist.values))
-
-    distancias = distancias[::-1]
-    labels = labels[::-1]
+def grafico_multiframe_vwap_distance(s=None, estadistico="media", filtro=None):
+    s = s or snapshot()
+    labels, distancias = _multiframe(s, "vwap_distance", estadistico, filtro)
     colores = ["#00cc96" if v >= 0 else "#ef553b" for v in distancias]
     fig = go.Figure()
     fig.add_trace(go.Bar(x=distancias, y=labels, orientation="h", marker=dict(color=colores), textposition="outside"))
-    fig.update_layout(template="plotly_dark", title="   Distance VWAP from Price %", height=450, xaxis=dict(title="", ticksuffix="%"), margin=dict(l=70, r=40, t=60, b=40))
+    fig.update_layout(template="plotly_dark", title="   Distance VWAP from Price %" + _sufijo(estadistico), height=450, xaxis=dict(title="", ticksuffix="%"), margin=dict(l=70, r=40, t=60, b=40))
     return fig
 
 
 # PMH / PM functions
-def grafico_pm_high_distribution(stocks_df=None):
-    if stocks_df is None:
-        df = stocks_filtrados.copy()
-    else:
-        df = stocks_df.copy()
-
-    df["PM_High_dt"] = pd.to_datetime(df["PM High Time"], format="%H:%M", errors="coerce")
-    df = df.dropna(subset=["PM_High_dt"])
-    start_pm_minutes = 4 * 60
-    df["minutos"] = (df["PM_High_dt"].dt.hour * 60 + df["PM_High_dt"].dt.minute) - start_pm_minutes
-    max_pm_minutes = 330
-    bins = list(range(0, max_pm_minutes + 30, 30))
-    labels = ["04:00-04:30 ", "04:30-05:00 ", "05:00-05:30 ", "05:30-06:00 ", "06:00-06:30 ", "06:30-07:00 ", "07:00-07:30 ", "07:30-08:00 ", "08:00-08:30 ", "08:30-09:00 ", "09:00-09:30 "]
-    df["PM_High_bin"] = pd.cut(df["minutos"], bins=bins, labels=labels, include_lowest=True, right=False)
-    distrib = df["PM_High_bin"].value_counts().reindex(labels).reset_index()
-    distrib.columns = ["Rango", "Acciones"]
+def grafico_pm_high_distribution(stocks_df=None, s=None, filtro=None):
+    s = s or snapshot()
+    # Con otro frame que no sea el del snapshot se construye su cubo al vuelo
+    c = s.cubo if stocks_df is None or stocks_df is s.stocks_filtrados else Cubo.construir(stocks_df)
+    labels = Cubo.etiquetas("pmh")
+    distrib = _tabla_distribucion(c.distribucion("pmh", filtro))
 
     fig = px.bar(distrib, x="Acciones", y="Rango", orientation="h", title="PM HIGH TIME DISTRIBUTION", labels={"Acciones": "Gaps", "Rango": ""}, template="plotly_dark")
     fig.update_traces(marker_color="#69b3ff")
@@ -945,14 +858,10 @@ def grafico_pm_high_distribution(stocks_df=None):
     return fig
 
 
-def grafico_pmh_gap_distribution():
-    df = stocks_filtrados.copy()
-    df["PMH_gap_pct"] = df["PMH Gap %"] * 100
-    bins = [0, 40, 60, 80, 100, 150, 200, 250, 300, 400, 99999]
-    labels = ["0% - 40%", "40% - 60%", "60% - 80%", "80% - 100%", "100% - 150%", "150% - 200%", "200% - 250%", "250% - 300%", "300% - 400%", ">400%"]
-    df["PMH_gap_bin"] = pd.cut(df["PMH_gap_pct"], bins=bins, labels=labels, include_lowest=True)
-    distrib = df["PMH_gap_bin"].value_counts().reindex(labels).reset_index()
-    distrib.columns = ["Rango", "Acciones"]
+def grafico_pmh_gap_distribution(s=None, filtro=None):
+    s = s or snapshot()
+    labels = Cubo.etiquetas("pmh_gap")
+    distrib = _tabla_distribucion(s.cubo.distribucion("pmh_gap", filtro))
     distrib = distrib.iloc[::-1]
 
     fig = px.bar(distrib, x="Acciones", y="Rango", orientation="h", title="PMH GAP DISTRIBUTION", labels={"Acciones": "Gaps", "Rango": ""}, template="plotly_dark")
@@ -961,15 +870,10 @@ def grafico_pmh_gap_distribution():
     return fig
 
 
-def grafico_pmh_fade_distribution():
-    df = stocks_filtrados.copy()
-    df["PMH_Fade_Pct_Scaled"] = df["PMH Fade to Open %"] * 100
-    df = df.dropna(subset=["PMH_Fade_Pct_Scaled"])
-    bins = [-100, -60, -50, -40, -30, -25, -20, -15, -10, -5, 0]
-    labels = ["-100% a -60% ", "-60% a -50% ", "-50% a -40% ", "-40% a -30% ", "-30% a -25% ", "-25% a -20% ", "-20% a -15% ", "-15% a -10% ", "-10% a -5% ", "-5% a 0% "]
-    df["PMH_Fade_Bin"] = pd.cut(df["PMH_Fade_Pct_Scaled"], bins=bins, labels=labels, include_lowest=True, right=False)
-    distrib = df["PMH_Fade_Bin"].value_counts().reindex(labels).reset_index()
-    distrib.columns = ["Rango (%)", "Acciones"]
+def grafico_pmh_fade_distribution(s=None, filtro=None):
+    s = s or snapshot()
+    labels = Cubo.etiquetas("pmh_fade")
+    distrib = _tabla_distribucion(s.cubo.distribucion("pmh_fade", filtro), rango="Rango (%)")
 
     fig = px.bar(distrib, x="Acciones", y="Rango (%)", orientation="h", title="PMH FADE TO OPEN DISTRIBUTION ", labels={"Acciones": "Gaps", "Rango (%)": ""}, template="plotly_dark")
     fig.update_traces(marker_color="#69b3ff")
@@ -977,40 +881,49 @@ def grafico_pmh_fade_distribution():
     return fig
 
 
-def grafico_pmh_gap_value():
-    fig = px.bar(monthly_pmh_gap, x="YearMonth", y="Gap (%)", title="PMH Gap Value %", labels={"YearMonth": "Mes", "Gap (%)": "Gap medio (%)"}, template="plotly_dark")
-    fig.add_scatter(x=monthly_pmh_gap["YearMonth"], y=monthly_pmh_gap["SMA_6"], mode="lines", name="SMA 6 meses", line=dict(color="#ff9933", width=3))
+def grafico_pmh_gap_value(s=None):
+    s = s or snapshot()
+    fig = px.bar(s.monthly_pmh_gap, x="YearMonth", y="Gap (%)", title="PMH Gap Value %", labels={"YearMonth": "Mes", "Gap (%)": "Gap medio (%)"}, template="plotly_dark")
+    fig.add_scatter(x=s.monthly_pmh_gap["YearMonth"], y=s.monthly_pmh_gap["SMA_6"], mode="lines", name="SMA 6 meses", line=dict(color="#ff9933", width=3))
     fig.update_layout(xaxis_tickangle=90, height=450, coloraxis_showscale=False, title=dict(x=0.5, xanchor="center"))
     return fig
 
 
-def grafico_pmh_fade_value():
-    fig = px.bar(monthly_fade, x="YearMonth", y="Fade (%)", title="PMH Fade to Open %", labels={"YearMonth": "Mes", "Fade (%)": "Fade medio (%)"}, template="plotly_dark")
-    fig.add_scatter(x=monthly_fade["YearMonth"], y=monthly_fade["SMA_6"], mode="lines", name="SMA 6M", line=dict(color="#ffaa00", width=3))
+def grafico_pmh_fade_value(s=None):
+    s = s or snapshot()
+    fig = px.bar(s.monthly_fade, x="YearMonth", y="Fade (%)", title="PMH Fade to Open %", labels={"YearMonth": "Mes", "Fade (%)": "Fade medio (%)"}, template="plotly_dark")
+    fig.add_scatter(x=s.monthly_fade["YearMonth"], y=s.monthly_fade["SMA_6"], mode="lines", name="SMA 6M", line=dict(color="#ffaa00", width=3))
     fig.update_layout(xaxis_tickangle=90, height=450, margin=dict(l=40, r=20, t=60, b=50),title=dict(x=0.5, xanchor="center"))
     return fig
 
 
-def grafico_pmh_volume_mes():
-    fig = px.bar(monthly_pmv, x="YearMonth", y="PMH_Volume_Total", title="Total Premarket Volume", labels={"YearMonth": "Mes", "PMH_Volume_Total": ""}, template="plotly_dark")
-    fig.add_scatter(x=monthly_pmv["YearMonth"], y=monthly_pmv["SMA_6"], mode="lines", name="SMA 6 meses", line=dict(color="#ff9933", width=3))
+def grafico_pmh_volume_mes(s=None):
+    s = s or snapshot()
+    fig = px.bar(s.monthly_pmv, x="YearMonth", y="PMH_Volume_Total", title="Total Premarket Volume", labels={"YearMonth": "Mes", "PMH_Volume_Total": ""}, template="plotly_dark")
+    fig.add_scatter(x=s.monthly_pmv["YearMonth"], y=s.monthly_pmv["SMA_6"], mode="lines", name="SMA 6 meses", line=dict(color="#ff9933", width=3))
     fig.update_layout(height=450, xaxis_tickangle=90, margin=dict(l=40, r=20, t=60, b=40), title=dict(x=0.5, xanchor="center"))
     return fig
 
 
-def grafico_rth_fade_to_close_mes():
-    fig = px.bar(monthly_rth_fade, x="YearMonth", y="Fade (%)", title="   RTH Fade to Close", labels={"YearMonth": "Mes", "Fade (%)": "Fade medio (%)"}, template="plotly_dark")
-    fig.add_scatter(x=monthly_rth_fade["YearMonth"], y=monthly_rth_fade["SMA_6"], mode="lines", name="SMA 6", line=dict(color="#ff9933", width=3))
+def grafico_rth_fade_to_close_mes(s=None, granularidad="M", ventana=None, ic=False):
+    s = s or snapshot()
+    ventana = ventana or VENTANA_DEFECTO[granularidad]
+    d = s.serie_temporal.serie(granularidad, "rth_fade_close", ventana)
+    fig = px.bar(d, x="Periodo", y="Fade (%)", title="   RTH Fade to Close", labels={"Periodo": NOMBRES_NIVEL[granularidad], "Fade (%)": "Fade medio (%)"}, template="plotly_dark")
+    fig.add_scatter(x=d["Periodo"], y=d["SMA"], mode="lines", name=f"SMA {ventana}", line=dict(color="#ff9933", width=3))
     fig.update_layout(height=450, xaxis_tickangle=90, margin=dict(l=40, r=20, t=60, b=40))
+    if ic:
+        _barras_ic(fig, d, "Fade (%)", s, "rth_fade_close", granularidad)
     return fig
 
-def grafico_premarket():
-    if intraday_df.empty:
+def grafico_premarket(s=None):
+    s = s or snapshot()
+    if s.intraday_df.empty:
         fig = go.Figure()
         fig.update_layout(title="Data 15min no disponible", template="plotly_dark", height=300)
         return fig
 
-    df = intraday_df.copy()
+    df = s.intraday_df.copy()
     df["date"] = pd.to_datetime(df["date"], errors="coerce").dt.date
 
     try:
@@ -1033,14 +946,8 @@ def grafico_premarket():
 
     df = df[df["bar_time_local"].isin(PM)].copy()
 
-    sf = stocks_filtrados.copy()
-    if "Ticker" in sf.columns and "ticker" not in sf.columns:
-        sf = sf.rename(columns={"Ticker": "ticker"})
-    sf["Date"] = pd.to_datetime(sf["Date"]).dt.date
-
-    allowed = set(zip(sf["ticker"].astype(str), sf["Date"]))
     df["date"] = pd.to_datetime(df["date"]).dt.date
-    df = df[df.apply(lambda r: (str(r["ticker"]), r["date"]) in allowed, axis=1)]
+    df = df[_en_sesiones(df, s.stocks_filtrados)]
 
     open0930 = df[df["bar_time_local"] == "09:30"][["ticker","date","open"]].rename(columns={"open":"open_0930"})
     df = df.merge(open0930, on=["ticker","date"], how="left")
@@ -1115,4 +1022,611 @@ def grafico_premarket():
         margin=dict(l=40, r=20, t=100, b=60)
     )
     fig.update_yaxes(ticksuffix="%")
-    return fig
\ No newline at end of file
+    return fig
+
+
+# -------------------------------------------------------------
+# BACKTEST GAP FADE (velas 15 min como arrays sesión × slot: backtest.py)
+# -------------------------------------------------------------
+def grafico_backtest_mensual(s=None, regla=None, filtro=None):
+    """Distribución mensual del PnL % (corto) de una regla de backtest.REGLA sobre el snapshot."""
+    s = s or snapshot()
+    b = backtest.para_snapshot(s)
+    pnl = b.evaluar_cache(regla, filtro)
+    r = backtest.Barras.resumen(pnl, b.mes)
+    d = pd.DataFrame({"Periodo": b.mes, "PnL (%)": pnl}).dropna().sort_values("Periodo", kind="stable")
+    fig = px.box(d, x="Periodo", y="PnL (%)", points=False, template="plotly_dark",
+                 title=f"   Backtest: {r['n']} operaciones, acierto {r['acierto']:.1f} %, "
+                       f"media {r['media']:.2f} %, mediana {r['mediana']:.2f} %")
+    medias = d.groupby("Periodo", sort=True)["PnL (%)"].mean()
+    fig.add_scatter(x=medias.index, y=medias.to_numpy(), mode="lines+markers", name="Media",
+                    line=dict(width=2, color="#ff9933"))
+    fig.add_hline(y=0, line=dict(color="white", width=0.5, dash="dot"))
+    fig.update_layout(xaxis_tickangle=90, height=450, showlegend=False)
+    fig.update_yaxes(ticksuffix="%")
+    return fig
+
+
+# -------------------------------------------------------------
+# SESIONES PARECIDAS (forma premarket + primeros minutos: similares.py)
+# -------------------------------------------------------------
+def grafico_similares(s=None, ticker=None, date=None, k=20, hasta=similares.HASTA):
+    """Curvas (cambio desde el open %) de las k sesiones más parecidas a ticker/date hasta `hasta`,
+    su media y la propia sesión hasta ese momento."""
+    if ticker is None or date is None:
+        raise ValueError("grafico_similares necesita ticker y date de la sesión a comparar")
+    s = s or snapshot()
+    idx = similares.para_snapshot(s, hasta=hasta)
+    vecinos = idx.buscar_sesion(ticker, date, k)
+    curvas = idx.curvas(vecinos, desde=idx.desde)
+    fig = go.Figure()
+    for col in curvas.columns:
+        fig.add_scatter(x=curvas.index, y=curvas[col], mode="lines", name=col, opacity=0.35,
+                        line=dict(width=1, color="#7f9fbf"))
+    fig.add_scatter(x=curvas.index, y=curvas.mean(axis=1), mode="lines", name="Media vecinos",
+                    line=dict(width=3, color="#ff9933"))
+    propia = idx.cambio[idx.posicion(ticker, date), :len(curvas)]
+    fin = curvas.index.get_loc(hasta) + 1
+    fig.add_scatter(x=curvas.index[:fin], y=propia[:fin], mode="lines+markers", name=f"{ticker} {date}",
+                    line=dict(width=3, color="white"))
+    fig.add_vline(x=hasta, line=dict(color="white", width=0.5, dash="dot"))
+    cierre = curvas.iloc[-1]
+    fig.update_layout(
+        template="plotly_dark", height=500, showlegend=False,
+        title=f"   {ticker} {date}: {len(vecinos)} sesiones parecidas hasta las {hasta} "
+              f"(correlación media {vecinos['similitud'].mean():.2f}) — cierre: mediana {cierre.median():.2f} %, "
+              f"bajo el open {(cierre < 0).mean() * 100:.0f} %",
+    )
+    fig.update_yaxes(ticksuffix="%")
+    return fig
+
+
+# -------------------------------------------------------------
+# CORRELACIONES / ESPERANZAS CONDICIONADAS (momentos por celda del cubo: momentos.py)
+# -------------------------------------------------------------
+def grafico_correlacion(s=None, filtro=None):
+    """Matriz de correlación de las métricas de momentos.METRICAS sobre un filtro del cubo."""
+    s = s or snapshot()
+    r = s.momentos.correlacion(filtro)
+    n = int(np.diag(s.momentos.fusionar(filtro)[0]).max()) if len(r) else 0
+    fig = px.imshow(r.round(2), text_auto=True, zmin=-1, zmax=1, color_continuous_scale="RdBu_r",
+                    template="plotly_dark", title=f"   Correlación ({n} gaps)")
+    fig.update_layout(height=500, margin=dict(l=40, r=20, t=70, b=40))
+    return fig
+
+
+def grafico_condicional(s=None, metrica="return", por="gap", filtro=None):
+    """Media de metrica por tramo de la dimensión por (dimensiones del cubo), n en la etiqueta."""
+    s = s or snapshot()
+    d = s.momentos.condicional(metrica, por, filtro).reset_index()
+    d[por] = d[por].astype(str)
+    etiqueta = METRICAS_MOMENTOS[metrica][2]
+    fig = px.bar(d, x=por, y="media", text="n", template="plotly_dark",
+                 labels={"media": f"{etiqueta} medio", por: por.capitalize()},
+                 title=f"   {etiqueta} medio por {por}")
+    fig.update_traces(textposition="outside", marker_color="#7f9fbf")
+    fig.update_layout(xaxis_tickangle=90, height=500, xaxis=dict(type="category"))
+    return fig
+
+
+# -------------------------------------------------------------
+# DRILL-DOWN POR TICKER (filas por offsets del índice por ticker: ticker_index.py)
+# -------------------------------------------------------------
+COLUMNAS_HISTORIAL = ["Date", "Open Price", "Open Gap %", "PMH Gap %", "Premarket Volume", "High Spike %",
+                      "Low Spike %", "Day Return %", "RTH Range %", "HOD Time", "LOD Time"]
+
+
+def historial_ticker(s=None, ticker=None):
+    """Días de gap del ticker (más recientes primero), sin recorrer todo stocks_filtrados."""
+    s = s or snapshot()
+    d = s.indice_tickers.filas(s.stocks_filtrados, ticker)
+    return d[[c for c in COLUMNAS_HISTORIAL if c in d.columns]].sort_values("Date", ascending=False)
+
+
+def resumen_ticker(s=None, ticker=None):
+    """Gaps, primera / última fecha y medias (%) del historial del ticker."""
+    d = historial_ticker(s, ticker)
+    media = lambda c: float(_a_numero(d[c]).mean() * 100) if c in d.columns and len(d) else np.nan
+    return {
+        "gaps": len(d),
+        "desde": d["Date"].min(), "hasta": d["Date"].max(),
+        "gap": media("Open Gap %"), "pmh_gap": media("PMH Gap %"),
+        "high_spike": media("High Spike %"), "low_spike": media("Low Spike %"),
+        "return": media("Day Return %"),
+        "close_red": float((d["Day Return %"] < 0).mean() * 100) if len(d) else np.nan,
+    }
+
+
+def grafico_ticker_intradia(s=None, ticker=None):
+    """Cambio desde el open de las 09:30 (%) de cada día de gap del ticker, como grafico_intradia, y su media."""
+    if ticker is None:
+        raise ValueError("grafico_ticker_intradia necesita un ticker")
+    s = s or snapshot()
+    velas = s.indice_tickers_intradia.filas(s.intraday_df, ticker)
+    dias = set(historial_ticker(s, ticker)["Date"].dt.strftime("%Y-%m-%d"))
+    fig = go.Figure()
+    if not velas.empty:
+        v = pd.DataFrame({
+            "date": pd.to_datetime(velas["date"], errors="coerce").dt.strftime("%Y-%m-%d"),
+            "hora": velas["bar_time_local"].astype(str).str[:5],
+            "open": pd.to_numeric(velas["open"], errors="coerce"),
+        })
+        v = v[v["date"].isin(dias)]
+        m = v.pivot_table(index="hora", columns="date", values="open", aggfunc="last").sort_index()
+        if "09:30" in m.index:
+            m = (m - m.loc["09:30"]) / m.loc["09:30"] * 100
+            m = m.loc[:, m.loc["09:30"].notna()]
+            for dia in m.columns:
+                fig.add_scatter(x=m.index, y=m[dia], mode="lines", name=dia, opacity=0.4,
+                                line=dict(width=1, color="#7f9fbf"))
+            fig.add_scatter(x=m.index, y=m.mean(axis=1), mode="lines", name="Media",
+                            line=dict(width=3, color="#ff9933"))
+            fig.add_vline(x="09:30", line=dict(color="white", width=0.5, dash="dot"))
+    n = len(fig.data) - 1 if fig.data else 0
+    fig.update_layout(template="plotly_dark", height=450, showlegend=False,
+                      title=f"   {ticker}: cambio desde el open en {n} días de gap con velas de 15 min")
+    fig.update_yaxes(ticksuffix="%")
+    return fig
+
+
+# -------------------------------------------------------------
+# SNAPSHOT (datos + agregados + figuras fijas de una versión de las fuentes)
+# -------------------------------------------------------------
+class Snapshot:
+    """Todo lo derivado de una versión de las fuentes. Inmutable: un refresco construye
+    otro y lo publica de golpe, así nadie ve agregados a medio actualizar."""
+
+    def __init__(self, **campos):
+        self.__dict__.update(campos)
+
+    def __setattr__(self, nombre, valor):
+        raise AttributeError("Snapshot es inmutable: construye otro con construir_snapshot()")
+
+    def campos(self):
+        return list(self.__dict__)
+
+
+# Nodos del grafo de construcción (cada uno solo lee sus entradas: pueden correr en paralelo)
+def _normalizar_stocks(stocks):
+    # Evita un caso erróneo puntual
+    stocks = stocks[~((stocks["Date"] == "2022-02-18") & (stocks["Ticker"] == "QNGY"))]
+
+    # Normaliza columna Date
+    stocks["Date"] = pd.to_datetime(stocks["Date"], errors="coerce")
+    return stocks
+
+
+def _stocks_v1(stocks):
+    stocks_v1 = stocks.copy()
+
+    stocks_v1["Period"] = stocks_v1["Date"].dt.year
+    stocks_v1["Month"] = stocks_v1["Date"].dt.month
+    # Watch out: .isocalendar().week returns Series with dtype UInt... cast to int
+    stocks_v1["Week"] = stocks_v1["Date"].dt.isocalendar().week.astype("Int64")
+    return stocks_v1
+
+
+def _stocks_filtrados(stocks_v1, session_index):
+    stocks_filtrados = perf.instrumentar(filtrar_smallcaps, tipo="filtro")(stocks_v1)
+
+    # Flags in_open_gap / in_premarket: sesión presente en data_open_gap.csv / data_premarket.csv
+    session_index.annotate(stocks_filtrados)
+
+    # Year / Month para fig_4: se añaden aquí, antes de que otros nodos lean el frame
+    stocks_filtrados["Date"] = pd.to_datetime(stocks_filtrados["Date"])
+    stocks_filtrados["Year"] = stocks_filtrados["Date"].dt.year
+    stocks_filtrados["Month"] = stocks_filtrados["Date"].dt.month
+    return stocks_filtrados
+
+
+def _metricas_retorno(stocks_filtrados):
+    # fig_2 metrics (negativos vs positivos)
+    total = len(stocks_filtrados)
+    neg_count = (stocks_filtrados["Day Return %"] < 0).sum()
+    pos_count = total - neg_count
+    neg_pct = round(neg_count / total * 100, 2) if total > 0 else 0
+    pos_pct = round(100 - neg_pct, 2) if total > 0 else 0
+
+    # PM Fade > 15% metrics
+    total_1 = len(stocks_filtrados)
+    neg_count_1 = (stocks_filtrados["PMH Fade to Open %"] < -0.15).sum()
+    pos_count_1 = total_1 - neg_count_1
+    neg_pct_1 = round(neg_count_1 / total_1 * 100, 2) if total_1 > 0 else 0
+    pos_pct_1 = round(100 - neg_pct_1, 2) if total_1 > 0 else 0
+
+    return {
+        "total": total, "neg_count": neg_count, "pos_count": pos_count, "neg_pct": neg_pct, "pos_pct": pos_pct,
+        "total_1": total_1, "neg_count_1": neg_count_1, "pos_count_1": pos_count_1,
+        "neg_pct_1": neg_pct_1, "pos_pct_1": pos_pct_1,
+    }
+
+
+def _tabla_resumen(stocks):
+    """Medias / medianas de fig_3 (sobre stocks sin el filtro de periodos de stocks_v1)."""
+    stocks_filtrados_1 = filtrar_smallcaps(stocks)  # mantiene la semántica original
+
+    # Cálculos de medias y medianas
+    avg_return = round(stocks_filtrados_1["Day Return %"].mean() * 100, 2)
+    avg_open_gap = round(stocks_filtrados_1["Open Gap %"].mean() * 100, 2)
+    avg_high_spike = round(stocks_filtrados_1["High Spike %"].mean() * 100, 2)
+    avg_low_spike = round(stocks_filtrados_1["Low Spike %"].mean() * 100, 2)
+    avg_range = round(stocks_filtrados_1["RTH Range %"].mean() * 100, 2)
+
+    # convierte HOD/LOD, calcula medias/medianas (respetando errores)
+    stocks_filtrados_1["HOD Time"] = pd.to_datetime(stocks_filtrados_1["HOD Time"], format="%H:%M", errors="coerce")
+    stocks_filtrados_1["HOD_horario"] = (
+        stocks_filtrados_1["HOD Time"].dt.hour * 3600 + stocks_filtrados_1["HOD Time"].dt.minute * 60
+    )
+    mean_seconds = stocks_filtrados_1["HOD_horario"].mean()
+    if pd.isna(mean_seconds):
+        avg_hod_time = "NA"
+    else:
+        avg_hod_time = f"{int(mean_seconds // 3600):02d}:{int((mean_seconds % 3600) // 60):02d}"
+
+    stocks_filtrados_1["LOD Time"] = pd.to_datetime(stocks_filtrados_1["LOD Time"], format="%H:%M", errors="coerce")
+    stocks_filtrados_1["LOD_horario"] = (
+        stocks_filtrados_1["LOD Time"].dt.hour * 3600 + stocks_filtrados_1["LOD Time"].dt.minute * 60
+    )
+    mean_seconds = stocks_filtrados_1["LOD_horario"].mean()
+    if pd.isna(mean_seconds):
+        avg_lod_time = "NA"
+    else:
+        avg_lod_time = f"{int(mean_seconds // 3600):02d}:{int((mean_seconds % 3600) // 60):02d}"
+
+    median_return = round(stocks_filtrados_1["Day Return %"].median() * 100, 2)
+    median_open_gap = round(stocks_filtrados_1["Open Gap %"].median() * 100, 2)
+    median_high_spike = round(stocks_filtrados_1["High Spike %"].median() * 100, 2)
+    median_low_spike = round(stocks_filtrados_1["Low Spike %"].median() * 100, 2)
+    median_range = round(stocks_filtrados_1["RTH Range %"].median() * 100, 2)
+
+    # median times
+    hod_median_seconds = stocks_filtrados_1["HOD_horario"].median()
+    if pd.isna(hod_median_seconds):
+        median_hod_time = "NA"
+    else:
+        median_hod_time = f"{int(hod_median_seconds // 3600):02d}:{int((hod_median_seconds % 3600) // 60):02d}"
+
+    lod_median_seconds = stocks_filtrados_1["LOD_horario"].median()
+    if pd.isna(lod_median_seconds):
+        median_lod_time = "NA"
+    else:
+        median_lod_time = f"{int(lod_median_seconds // 3600):02d}:{int((lod_median_seconds % 3600) // 60):02d}"
+
+    metrics = ["High Spike", "Low Spike", "Return", "Gap at open", "RTH Range", "HOD Time", "LOD Time"]
+    avg_values = [
+        format_value(avg_high_spike),
+        format_value(avg_low_spike),
+        format_value(avg_return),
+        format_value(avg_open_gap),
+        format_value(avg_range),
+        avg_hod_time,
+        avg_lod_time,
+    ]
+    median_values = [
+        format_value(median_high_spike),
+        format_value(median_low_spike),
+        format_value(median_return),
+        format_value(median_open_gap),
+        format_value(median_range),
+        median_hod_time,
+        median_lod_time,
+    ]
+    return {
+        "avg_return": avg_return, "avg_open_gap": avg_open_gap, "avg_high_spike": avg_high_spike,
+        "avg_low_spike": avg_low_spike, "avg_range": avg_range, "avg_hod_time": avg_hod_time, "avg_lod_time": avg_lod_time,
+        "median_return": median_return, "median_open_gap": median_open_gap, "median_high_spike": median_high_spike,
+        "median_low_spike": median_low_spike, "median_range": median_range,
+        "median_hod_time": median_hod_time, "median_lod_time": median_lod_time,
+        "metrics": metrics, "avg_values": avg_values, "median_values": median_values,
+    }
+
+
+def _figura_2(r):
+    neg_pct, neg_count, pos_pct, pos_count, total = r["neg_pct"], r["neg_count"], r["pos_pct"], r["pos_count"], r["total"]
+    fig_2 = go.Figure()
+    fig_2.add_trace(
+        go.Bar(
+            x=[neg_pct],
+            y=["Retorno"],
+            width=0.48,
+            orientation="h",
+            marker=dict(color="#ef553b", line=dict(color="#aa3d2d", width=1.5)),
+            name="Negativas",
+            hovertemplate=("<b>Acciones negativas</b><br>" f"Cantidad: {neg_count}<br>" f"Porcentaje: {neg_pct}%" "<extra></extra>"),
+        )
+    )
+    fig_2.add_trace(
+        go.Bar(
+            x=[pos_pct],
+            y=["Retorno"],
+            width=0.48,
+            orientation="h",
+            marker=dict(color="#00cc96", line=dict(color="#0f8a63", width=1.5)),
+            name="Positivas",
+            hovertemplate=("<b>Acciones positivas</b><br>" f"Cantidad: {pos_count}<br>" f"Porcentaje: {pos_pct}%" "<extra></extra>"),
+        )
+    )
+    fig_2.update_layout(
+        barmode="stack",
+        template="plotly_dark",
+        height=240,
+        title=dict(text=f"Close Red — {neg_pct}%      |      Total Gaps Filtradas: {total}", x=0.5, xanchor="center", font=dict(size=18, color="white")),
+        legend=dict(orientation="h", yanchor="bottom", y=-0.35, xanchor="center", x=0.5, font=dict(size=12)),
+        margin=dict(t=60, l=20, r=20, b=60),
+    )
+    fig_2.update_xaxes(showticklabels=False, range=[0, 100])
+    fig_2.update_yaxes(showticklabels=False)
+    return fig_2
+
+
+def _figura_3(t):
+    metrics, avg_values, median_values = t["metrics"], t["avg_values"], t["median_values"]
+    fig_3 = go.Figure(
+        data=[
+            go.Table(
+                header=dict(
+                    values=["<b>Métrica</b>", "<b>Media</b>", "<b>Mediana</b>"],
+                    fill_color="#1f1f2e",
+                    font=dict(color="white", size=14),
+                    align="left",
+                ),
+                cells=dict(
+                    values=[metrics, avg_values, median_values],
+                    fill_color="#11121A",
+                    align="left",
+                    font=dict(color="white", size=13),
+                    height=35,
+                ),
+            )
+        ]
+    )
+    fig_3.update_layout(template="plotly_dark", height=350, margin=dict(t=20, b=20, l=20, r=20))
+    return fig_3
+
+
+def grafico_return_mes(s=None, ic=False):
+    """fig_4 (retorno medio por mes), con los bigotes del IC bootstrap si ic."""
+    s = s or snapshot()
+    if not ic:
+        return s.fig_4
+    fig = go.Figure(s.fig_4)
+    return _barras_ic(fig, s.monthly_return, "Return (%)", s, "return", x="YearMonth")
+
+
+def _ic_mensual(stocks_filtrados):
+    """IC bootstrap 95 % de la media mensual (* 100) de las métricas con barras de medias."""
+    df = stocks_filtrados
+    valores = pd.DataFrame({
+        "return": df["Day Return %"] * 100,
+        "closered": (df["Day Return %"] < 0) * 100.0,
+        "gap": df["Open Gap %"] * 100,
+        "highspike": df["High Spike %"] * 100,
+        "lowspike": df["Low Spike %"] * 100,
+        "range": df["RTH Range %"] * 100,
+        "rth_fade_close": _a_numero(df["RTH Fade to Close %"]) * 100,
+    })
+    return bootstrap.intervalos(valores, _to_yearmonth(df).to_numpy())
+
+
+def _hhmm(segundos):
+    return "NA" if pd.isna(segundos) else f"{int(segundos // 3600):02d}:{int((segundos % 3600) // 60):02d}"
+
+
+def grafico_tabla_resumen(s=None, filtro=None):
+    """fig_3 para un filtro del cubo: medias de sus sumas y medianas de sus sketches.
+
+    Sin filtro devuelve la fig_3 exacta del snapshot. Las medianas filtradas tienen
+    error relativo <= cuantiles.ALPHA (ver cuantiles.py); HOD/LOD en minutos desde las 09:30.
+    """
+    s = s or snapshot()
+    if not filtro:
+        return s.fig_3
+    c = s.cubo
+    tot = c.rollup([], filtro).iloc[0]
+    pct = ["highspike", "lowspike", "return", "gap", "range"]
+    med = {m: c.cuantil(m, 0.5, filtro) for m in pct + ["hod", "lod"]}
+    avg_values = [format_value(round(tot[f"m_{m}"] * 100, 2)) for m in pct]
+    avg_values += [_hhmm((9 * 60 + 30 + tot[f"m_{m}"]) * 60) for m in ("hod", "lod")]
+    median_values = [format_value(round(med[m], 2)) for m in pct]
+    median_values += [_hhmm((9 * 60 + 30 + med[m]) * 60) for m in ("hod", "lod")]
+    return _figura_3({"metrics": s.metrics, "avg_values": avg_values, "median_values": median_values})
+
+
+def _figura_4(monthly_return):
+    fig_4 = px.bar(
+        monthly_return,
+        x="YearMonth",
+        y="Return (%)",
+        title="   Return gaps/mes",
+        labels={"YearMonth": "Mes", "Return (%)": "Retorno promedio (%)"},
+        template="plotly_dark",
+    )
+    fig_4.update_layout(xaxis_tickangle=90, height=450)
+    return fig_4
+
+
+def grafo_snapshot():
+    """Grafo datasets -> agregados -> figuras de un snapshot (entradas: stocks_crudo, intraday_df)."""
+    g = Grafo("snapshot")
+    g.nodo("stocks", _normalizar_stocks, "stocks_crudo")
+    g.nodo("stocks_v1", _stocks_v1, "stocks")
+    g.nodo("session_index", perf.instrumentar(get_session_index, tipo="carga"))
+    g.nodo("stocks_filtrados", _stocks_filtrados, "stocks_v1", "session_index")
+    for nombre, fn in list(globals().items()):
+        if nombre.startswith("calcular_monthly_"):
+            g.nodo(nombre.replace("calcular_", ""), fn, "stocks_filtrados")
+    g.nodo("_retorno", _metricas_retorno, "stocks_filtrados")
+    g.nodo("_tabla", _tabla_resumen, "stocks")
+    g.nodo("fig_2", _figura_2, "_retorno")
+    g.nodo("fig_3", _figura_3, "_tabla")
+    g.nodo("fig_4", _figura_4, "monthly_return")
+    # Cubo año × mes × precio × gap × PM high: las distribuciones se responden desde aquí
+    g.nodo("cubo", Cubo.construir, "stocks_filtrados")
+    # Métricas M1…M180 como array 2-D para los paneles multiframe
+    g.nodo("multiframe", Multiframe.construir, "stocks_filtrados")
+    # Intervalos de confianza de las medias mensuales (bigotes opcionales)
+    g.nodo("ic_mensual", _ic_mensual, "stocks_filtrados")
+    # Estadísticos diarios y sus niveles semana / mes / trimestre para las series
+    g.nodo("serie_temporal", lambda sf: SerieTemporal.construir(sf, convertir=_a_numero), "stocks_filtrados")
+    # Sumas, productos cruzados y conteos por celda del cubo para correlaciones por filtro
+    g.nodo("momentos", Momentos.construir, "stocks_filtrados")
+    # Filas por ticker (offsets) de los dos datasets para el drill-down por ticker
+    g.nodo("indice_tickers", lambda sf: TickerIndex.construir(sf, "Ticker"), "stocks_filtrados")
+    g.nodo("indice_tickers_intradia", lambda i: TickerIndex.construir(i, "ticker"), "intraday_df")
+    return g
+
+
+@perf.instrumentar(tipo="carga")
+def construir_snapshot(stocks, intraday_df, version=1, firmas=None):
+    """Filtra, agrega y construye las figuras fijas fuera del snapshot publicado.
+
+    Los nodos independientes del grafo (agregados, tabla de fig_3, curvas
+    intradía...) se ejecutan en paralelo; el resumen de tiempos y la ruta
+    crítica quedan en el campo arranque.
+    """
+    g = grafo_snapshot()
+    r = g.ejecutar(stocks_crudo=stocks, intraday_df=intraday_df)
+    campos = {"version": version, "firmas": firmas}
+    for nombre, valor in r.items():
+        if nombre == "stocks_crudo":
+            continue
+        if nombre.startswith("_"):
+            campos.update(valor)  # nodos que aportan varios campos
+        else:
+            campos[nombre] = valor
+    campos["arranque"] = g.resumen()
+    campos["creado"] = time.time()
+    # Cada campo es accesible como dm.<nombre> / snapshot().<nombre>
+    return Snapshot(**campos)
+
+_snapshot = None
+_lock = threading.Lock()
+_refresco = None
+listo = threading.Event()  # señal de disponibilidad: hay snapshot publicado (o falló la carga inicial)
+_error_arranque = None
+
+
+def snapshot(timeout=None):
+    """Snapshot publicado. Tomarlo una vez por petición / figura: un refresco puede cambiarlo.
+
+    Durante un arranque asíncrono espera (hasta timeout) a la carga inicial.
+    """
+    if _snapshot is None:
+        listo.wait(timeout)
+        if _error_arranque is not None:
+            raise RuntimeError("falló la carga inicial de datos") from _error_arranque
+    return _snapshot
+
+
+def _publicar(nuevo):
+    global _snapshot
+    _snapshot = nuevo  # una asignación: los lectores ven el viejo o el nuevo, nunca una mezcla
+
+
+def refrescar(forzar=False):
+    """Comprueba las fuentes y, si cambiaron, construye y publica un snapshot nuevo.
+
+    Devuelve True si hubo cambio. La fuente que no cambió se reutiliza del snapshot
+    actual (su normalización es idempotente). Si no hay snapshot (falló la carga
+    inicial) hace una carga completa y publica la versión 1.
+    """
+    global _error_arranque
+    with _lock:
+        actual = _snapshot
+        if actual is None:
+            datos, firmas = cargar_fuentes()  # firmas vacías: se leen todas las fuentes
+            nuevo = construir_snapshot(datos["stocks"], datos["intraday"], version=1, firmas=firmas)
+        else:
+            datos, firmas = cargar_fuentes({} if forzar else actual.firmas)
+            if datos["stocks"] is None and datos["intraday"] is None:
+                return False
+            nuevo = construir_snapshot(
+                actual.stocks if datos["stocks"] is None else datos["stocks"],
+                actual.intraday_df if datos["intraday"] is None else datos["intraday"],
+                version=actual.version + 1,
+                firmas=firmas,
+            )
+        _publicar(nuevo)
+        if actual is None:
+            _error_arranque = None
+            _registrar_memoria()
+        log.info("datos refrescados: versión %s", nuevo.version)
+        return True
+
+
+def _bucle_refresco(intervalo_s, parar):
+    while not parar.wait(intervalo_s):
+        try:
+            refrescar()
+        except Exception:
+            actual = _snapshot
+            log.exception("refresco fallido; se sigue sirviendo la versión %s",
+                          actual.version if actual is not None else "(ninguna)")
+
+
+def iniciar_refresco(intervalo_s=REFRESH_S):
+    """Arranca (una vez por proceso) el hilo de refresco. Devuelve el Event que lo para."""
+    global _refresco
+    with _lock:
+        if _refresco is None:
+            _refresco = threading.Event()
+            threading.Thread(
+                target=_bucle_refresco, args=(intervalo_s, _refresco), name="smallcaps-refresco", daemon=True
+            ).start()
+        return _refresco
+
+
+def _carga_inicial():
+    global _error_arranque
+    try:
+        datos, firmas = cargar_fuentes()
+        _publicar(construir_snapshot(datos["stocks"], datos["intraday"], version=1, firmas=firmas))
+        log.info("arranque: %s", _snapshot.arranque)
+        _registrar_memoria()
+    except Exception as e:
+        _error_arranque = e
+        raise
+    finally:
+        listo.set()
+
+
+def _registrar_memoria():
+    # Memoria: DataFrames / figuras del snapshot publicado + índice de sesiones (mem_report)
+    mem.registrar_espacio("dm", snapshot)
+    mem.registrar("session_index", getter=lambda: _snapshot.session_index, tipo="indice")
+    mem.registrar("dm.cubo", getter=lambda: _snapshot.cubo.celdas, tipo="indice")
+    mem.registrar("dm.cubo.sketches", getter=lambda: _snapshot.cubo.sketches, tipo="indice")
+    mem.registrar("dm.multiframe", getter=lambda: _snapshot.multiframe.matriz, tipo="indice")
+    mem.registrar("dm.serie_temporal", getter=lambda: _snapshot.serie_temporal.niveles, tipo="indice")
+    mem.registrar("dm.momentos", getter=lambda: (_snapshot.momentos.n, _snapshot.momentos.s,
+                                                 _snapshot.momentos.q, _snapshot.momentos.p), tipo="indice")
+    mem.registrar("dm.indice_tickers", getter=lambda: _snapshot.indice_tickers.orden, tipo="indice")
+    mem.registrar("dm.indice_tickers_intradia", getter=lambda: _snapshot.indice_tickers_intradia.orden, tipo="indice")
+
+
+# Carga inicial: por defecto bloquea el import (el módulo se importa ya con datos).
+# Con SMALLCAPS_ARRANQUE_ASINCRONO=1 corre en un hilo y el import vuelve enseguida;
+# listo indica cuándo hay datos y snapshot() / dm.<campo> esperan a ellos.
+ARRANQUE_ASINCRONO = os.environ.get("SMALLCAPS_ARRANQUE_ASINCRONO", "0") == "1"
+if ARRANQUE_ASINCRONO:
+    threading.Thread(target=_carga_inicial, name="smallcaps-arranque", daemon=True).start()
+else:
+    _carga_inicial()
+
+
+def __getattr__(nombre):
+    # dm.stocks_filtrados, dm.fig_2, dm.monthly_*...: campos del snapshot publicado
+    s = None if nombre.startswith("__") else snapshot()
+    if s is not None and nombre in s.__dict__:
+        return s.__dict__[nombre]
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_snapshot.__dict__ if _snapshot is not None else ()))
+
+
+# -------------------------------------------------------------
+# INSTRUMENTACIÓN: tiempo, filas y tamaño JSON de cada gráfico (perf_metrics)
+# -------------------------------------------------------------
+perf.instrumentar_modulo(globals(), ("grafico_", "crear_grafico_"))
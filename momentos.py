@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# momentos.py
+# Momentos sumables por celda del cubo (cubo.DIMS) para correlaciones y
+# esperanzas condicionadas entre las métricas de METRICAS. Por celda y por par
+# de métricas (i, j), sobre las filas en que ambas existen:
+#     N[i, j] = filas    S[i, j] = Σ x_i    Q[i, j] = Σ x_i²    P[i, j] = Σ x_i x_j
+# Cualquier filtro se responde sumando celdas (k × k por celda, sin recorrer
+# filas) y la correlación de Pearson por pares sale de esas sumas. Las métricas
+# se centran en su media global antes de acumular para no perder precisión al
+# restar sumas grandes (volúmenes).
+#
+#   m = Momentos.construir(stocks_filtrados)
+#   m.correlacion(filtro={"year": [2024]})           # matriz k × k
+#   m.condicional("return", por="gap")               # n y media del return por tramo de gap
+#   m.regresion("return", "gap")                     # E[return | gap] ≈ a + b · gap
+#
+import threading
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import cubo
+
+MAX_CACHE = 64  # filtros distintos recordados por snapshot
+
+# nombre -> (columna, escala, etiqueta); los % se guardan * 100
+METRICAS = {
+    "gap": ("Open Gap %", 100, "Open Gap %"),
+    "pmh_gap": ("PMH Gap %", 100, "PMH Gap %"),
+    "pm_volumen": ("Premarket Volume", 1, "Premarket Volume"),
+    "pmh_fade": ("PMH Fade to Open %", 100, "PMH Fade to Open %"),
+    "highspike": ("High Spike %", 100, "High Spike %"),
+    "return": ("Day Return %", 100, "Day Return %"),
+}
+
+
+class Momentos:
+    """celdas = DIMS de cada celda; n, s, q, p = sumas por celda (celdas × k × k); centro = desplazamiento por métrica."""
+
+    def __init__(self, celdas: pd.DataFrame, n: np.ndarray, s: np.ndarray, q: np.ndarray, p: np.ndarray,
+                 centro: np.ndarray):
+        self.celdas = celdas
+        self.n, self.s, self.q, self.p = n, s, q, p
+        self.centro = centro
+        self.nombres = list(METRICAS)
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # La caché y el lock son del proceso: no viajan al serializar
+        return {k: getattr(self, k) for k in ("celdas", "n", "s", "q", "p", "centro")}
+
+    def __setstate__(self, estado):
+        self.__init__(**estado)
+
+    @classmethod
+    def construir(cls, df: pd.DataFrame) -> "Momentos":
+        celdas, celda = cubo.asignar_celdas(cubo.codigos_dims(df))
+        x = np.column_stack([pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64) * escala
+                             for col, escala, _ in METRICAS.values()]) if len(df) else np.empty((0, len(METRICAS)))
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # métrica sin datos -> centro 0
+            centro = np.nan_to_num(np.nanmean(x, axis=0))
+        valido = ~np.isnan(x)
+        x0 = np.where(valido, x - centro, 0.0)
+        v = valido.astype(np.float64)
+
+        # Filas ordenadas por celda: cada suma por celda es un np.add.reduceat
+        orden = np.argsort(celda, kind="stable")
+        inicio = np.searchsorted(celda[orden], np.arange(len(celdas)))
+        x0, v = x0[orden], v[orden]
+        k = x.shape[1]
+        n, s, q, p = (np.zeros((len(celdas), k, k)) for _ in range(4))
+        if len(celdas):
+            for i in range(k):
+                n[:, i] = np.add.reduceat(v[:, i:i + 1] * v, inicio)
+                s[:, i] = np.add.reduceat(x0[:, i:i + 1] * v, inicio)
+                q[:, i] = np.add.reduceat(x0[:, i:i + 1] ** 2 * v, inicio)
+                p[:, i] = np.add.reduceat(x0[:, i:i + 1] * x0, inicio)
+        return cls(celdas, n, s, q, p, centro)
+
+    @staticmethod
+    def _clave(filtro: dict) -> tuple:
+        return tuple(sorted((d, tuple(v) if not np.isscalar(v) else (v,)) for d, v in (filtro or {}).items()))
+
+    def fusionar(self, filtro: dict = None) -> tuple:
+        """(N, S, Q, P) k × k sumados sobre las celdas del filtro."""
+        clave = self._clave(filtro)
+        with self._lock:
+            if clave in self._cache:
+                self._cache[clave] = self._cache.pop(clave)  # más reciente al final
+                return self._cache[clave]
+        m = cubo.mascara(self.celdas, filtro) if filtro else slice(None)
+        out = tuple(a[m].sum(axis=0) for a in (self.n, self.s, self.q, self.p))
+        with self._lock:
+            self._cache[clave] = out
+            while len(self._cache) > MAX_CACHE:
+                self._cache.pop(next(iter(self._cache)))
+        return out
+
+    def _etiquetas(self) -> list:
+        return [METRICAS[m][2] for m in self.nombres]
+
+    def correlacion(self, filtro: dict = None) -> pd.DataFrame:
+        """Correlación de Pearson por pares (filas con ambas métricas) sobre el filtro."""
+        n, s, q, p = self.fusionar(filtro)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = p - s * s.T / n
+            var = q - s ** 2 / n            # var[i, j]: de x_i sobre las filas del par (i, j)
+            r = cov / np.sqrt(var * var.T)
+        r[n < 2] = np.nan
+        np.fill_diagonal(r, np.where(np.diag(n) >= 2, 1.0, np.nan))
+        etiquetas = self._etiquetas()
+        return pd.DataFrame(np.clip(r, -1, 1), index=etiquetas, columns=etiquetas)
+
+    def medias(self, filtro: dict = None) -> pd.Series:
+        n, s, _, _ = self.fusionar(filtro)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return pd.Series(np.diag(s) / np.diag(n) + self.centro, index=self._etiquetas())
+
+    def condicional(self, metrica: str, por: str = "gap", filtro: dict = None) -> pd.DataFrame:
+        """n y media de metrica por valor de la dimensión por (celdas sin tramo fuera)."""
+        m = cubo.mascara(self.celdas, filtro) if filtro else np.ones(len(self.celdas), dtype=bool)
+        codigos = self.celdas[por].to_numpy()
+        m &= codigos >= 0
+        grupos, g = np.unique(codigos[m], return_inverse=True)
+        i = self.nombres.index(metrica)
+        n = np.bincount(g, weights=self.n[m, i, i], minlength=len(grupos))
+        s = np.bincount(g, weights=self.s[m, i, i], minlength=len(grupos))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            media = s / n + self.centro[i]
+        etiquetas = [cubo.DIMENSIONES[por].labels[c] for c in grupos] if por in cubo.DIMENSIONES else list(grupos)
+        return pd.DataFrame({"n": n.astype(np.int64), "media": media}, index=pd.Index(etiquetas, name=por))
+
+    def regresion(self, y: str, x: str, filtro: dict = None) -> dict:
+        """Recta de mínimos cuadrados E[y | x] ≈ a + b · x (filas con ambas), con r y n."""
+        n, s, q, p = self.fusionar(filtro)
+        i, j = self.nombres.index(y), self.nombres.index(x)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            b = (p[i, j] - s[i, j] * s[j, i] / n[i, j]) / (q[j, i] - s[j, i] ** 2 / n[i, j])
+            my, mx = s[i, j] / n[i, j], s[j, i] / n[i, j]
+            a = (my + self.centro[i]) - b * (mx + self.centro[j])
+        return {"a": float(a), "b": float(b), "r": float(self.correlacion(filtro).iloc[i, j]), "n": int(n[i, j])}
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# multiframe.py
+# Métricas multi-timeframe (M1…M180 de returns, spikes, return to close y
+# distancia al VWAP) como un array 2-D contiguo (métrica × fila) construido una
+# vez por snapshot. Media, mediana y percentiles de todas las métricas salen de
+# una sola reducción por filtro, y el resultado se cachea por filtro: los cinco
+# paneles grafico_multiframe_* cuestan lo mismo que uno.
+#
+#   mf = Multiframe.construir(stocks_filtrados)
+#   mf.resumen()                                   # media, mediana, p10…p90 por métrica
+#   mf.panel("returns", "mediana", filtro={"year": [2024]})   # [(etiqueta, valor), ...]
+#
+# Los filtros son los del cubo (cubo.DIMS: year, month, precio, gap, pmh).
+import warnings
+import threading
+
+import numpy as np
+import pandas as pd
+
+import cubo
+
+MAX_CACHE = 64  # filtros distintos recordados por snapshot
+
+# panel -> [(etiqueta, columna)] en el orden de la gráfica (de arriba abajo tras invertir).
+# Las columnas se guardan * 100; las de vwap_distance son (precio, vwap).
+PANELES = {
+    "returns": [
+        ("1 min Return", "M1 Return %"), ("5 min Return", "M5 Return %"), ("15 min Return", "M15 Return %"),
+        ("30 min Return", "M30 Return %"), ("60 min Return", "M60 Return %"), ("120 min Return", "M120 Return %"),
+        ("180 min Return", "M180 Return %"), ("Return", "Day Return %"),
+    ],
+    "highspike": [(f"{m} min High Spike ", f"M{m} High Spike %") for m in (1, 5, 15, 30, 60, 120, 180)],
+    "lowspike": [(f"{m} min Low Spike ", f"M{m} Low Spike %") for m in (1, 5, 15, 30, 60, 120, 180)],
+    "return_to_close": [(f"From M{m} to close", f"Return % From M{m} to Close") for m in (1, 5, 15, 30, 60, 120, 180)],
+    "vwap_distance": [
+        ("VWAP Open", ("Open Price", "VWAP at Open")), ("VWAP 5m", ("M5 Price", "VWAP at M5")),
+        ("VWAP 15m", ("M15 Price", "VWAP at M15")), ("VWAP 30m", ("M30 Price", "VWAP at M30")),
+        ("VWAP 60m", ("M60 Price", "VWAP at M60")), ("VWAP 90m", ("M90 Price", "VWAP at M90")),
+        ("VWAP 120m", ("M120 Price", "VWAP at M120")), ("VWAP 180m", ("M180 Price", "VWAP at M180")),
+    ],
+}
+ESTADISTICOS = {"media": None, "p10": 10, "p25": 25, "mediana": 50, "p75": 75, "p90": 90}
+
+
+def _numero(df: pd.DataFrame, col: str) -> np.ndarray:
+    # Columna ausente -> NaN (como el df.get(...) del panel VWAP original)
+    if col not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64)
+
+
+class Multiframe:
+    """matriz[i] = valores de la métrica claves[i] por fila; dims = códigos de cubo.DIMS por fila."""
+
+    def __init__(self, claves: list, matriz: np.ndarray, dims: pd.DataFrame):
+        self.claves = claves
+        self.matriz = matriz
+        self.dims = dims
+        self._indice = {c: i for i, c in enumerate(claves)}
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # La caché y el lock son del proceso: no viajan al serializar
+        return {"claves": self.claves, "matriz": self.matriz, "dims": self.dims}
+
+    def __setstate__(self, estado):
+        self.__init__(**estado)
+
+    @classmethod
+    def construir(cls, df: pd.DataFrame) -> "Multiframe":
+        claves, filas = [], []
+        for panel in PANELES.values():
+            for _, col in panel:
+                if col in claves:
+                    continue
+                if isinstance(col, tuple):
+                    precio, vwap = _numero(df, col[0]), _numero(df, col[1])
+                    filas.append((precio - vwap) / vwap * 100)
+                else:
+                    filas.append(_numero(df, col) * 100)
+                claves.append(col)
+        matriz = np.ascontiguousarray(np.vstack(filas)) if filas else np.empty((0, len(df)))
+        return cls(claves, matriz, cubo.codigos_dims(df))
+
+    @staticmethod
+    def _clave(filtro: dict) -> tuple:
+        return tuple(sorted((d, tuple(v) if not np.isscalar(v) else (v,)) for d, v in (filtro or {}).items()))
+
+    def resumen(self, filtro: dict = None) -> pd.DataFrame:
+        """n, media y percentiles (ESTADISTICOS) de cada métrica sobre las filas del filtro."""
+        clave = self._clave(filtro)
+        with self._lock:
+            if clave in self._cache:
+                self._cache[clave] = self._cache.pop(clave)  # más reciente al final
+                return self._cache[clave]
+        m = self.matriz if not filtro else self.matriz[:, cubo.mascara(self.dims, filtro)]
+        pcts = [p for p in ESTADISTICOS.values() if p is not None]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # métricas sin datos en el filtro -> NaN
+            media = np.nanmean(m, axis=1)
+            percentiles = np.nanpercentile(m, pcts, axis=1) if m.shape[1] else np.full((len(pcts), len(m)), np.nan)
+        out = pd.DataFrame({"n": (~np.isnan(m)).sum(axis=1), "media": media}, index=pd.Index(self.claves, name="metrica"))
+        for nombre, fila in zip([n for n, p in ESTADISTICOS.items() if p is not None], percentiles):
+            out[nombre] = fila
+        with self._lock:
+            self._cache[clave] = out
+            while len(self._cache) > MAX_CACHE:
+                self._cache.pop(next(iter(self._cache)))
+        return out
+
+    def panel(self, nombre: str, estadistico: str = "media", filtro: dict = None) -> list:
+        """[(etiqueta, valor)] de un panel de PANELES en su orden original."""
+        r = self.resumen(filtro)[estadistico]
+        return [(etiqueta, float(r.iloc[self._indice[col]])) for etiqueta, col in PANELES[nombre]]
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# perf_metrics.py
+# Registro en proceso de métricas de rendimiento del dashboard: cada carga,
+# agregado y grafico_* apunta su tiempo, hit/miss de caché, filas y (con
+# SMALLCAPS_PERF_FIGURAS=1) tamaño del JSON de la figura. app.py (?perf=1) y
+# dashboard.py (/_perf) lo muestran por ejecución y como percentiles móviles.
+#
+#   with perf.medir("carga stocks", tipo="carga") as m:
+#       stocks = pd.read_csv(DATA_URL)
+#       m["filas"] = len(stocks)
+#
+#   grafico_gap = perf.instrumentar(grafico_gap)
+#
+import os
+import time
+import threading
+import itertools
+import functools
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# Eventos guardados (ventana de los percentiles móviles)
+MAX_EVENTOS = int(os.environ.get("SMALLCAPS_PERF_EVENTOS", 5000))
+# Serializar cada figura para medir su JSON cuesta casi tanto como construirla:
+# apagado salvo al perfilar (SMALLCAPS_PERF_FIGURAS=1)
+MEDIR_FIGURAS = os.environ.get("SMALLCAPS_PERF_FIGURAS", "0") == "1"
+
+_lock = threading.Lock()
+_eventos = deque(maxlen=MAX_EVENTOS)
+_ejecuciones = itertools.count(1)
+_local = threading.local()
+
+
+def ejecucion_actual() -> int:
+    """Id de la ejecución del hilo actual (0 = arranque / import del módulo)."""
+    return getattr(_local, "run", 0)
+
+
+def nueva_ejecucion() -> int:
+    """Abre una ejecución nueva (un rerun de Streamlit, un callback de Dash...) en este hilo."""
+    _local.run = next(_ejecuciones)
+    return _local.run
+
+
+def registrar(nombre: str, tipo: str, s: float, cache: str = None, n_bytes: int = None, n_filas: int = None):
+    evento = {
+        "run": ejecucion_actual(), "ts": time.time(), "nombre": nombre, "tipo": tipo,
+        "s": s, "cache": cache, "bytes": n_bytes, "filas": n_filas,
+    }
+    with _lock:
+        _eventos.append(evento)
+
+
+def filas(obj):
+    """Filas de un DataFrame/Series/array, o None si no aplica."""
+    return len(obj) if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray)) else None
+
+
+def bytes_figura(fig):
+    """Tamaño del JSON que se envía al navegador (None si no es una figura)."""
+    if not MEDIR_FIGURAS or not hasattr(fig, "to_plotly_json"):
+        return None
+    return len(fig.to_json())
+
+
+@contextmanager
+def medir(nombre: str, tipo: str = "grafico", cacheado: bool = False):
+    """Mide el bloque; el llamador puede rellenar m["filas"] / m["bytes"].
+
+    Con cacheado=True el evento es "miss" solo si dentro se llamó a marcar_miss()
+    (desde el cuerpo de la función cacheada), y "hit" en otro caso.
+    """
+    m = {"filas": None, "bytes": None}
+    previo = getattr(_local, "miss", None)
+    _local.miss = False
+    t0 = time.perf_counter()
+    try:
+        yield m
+    finally:
+        s = time.perf_counter() - t0
+        cache = ("miss" if _local.miss else "hit") if cacheado else None
+        _local.miss = previo
+        registrar(nombre, tipo, s, cache, m["bytes"], m["filas"])
+
+
+def marcar_miss():
+    """Llamar dentro de una función cacheada: su cuerpo se ha ejecutado (no venía de caché)."""
+    _local.miss = True
+
+
+def instrumentar(fn=None, nombre: str = None, tipo: str = "grafico"):
+    """Decorador: registra tiempo, filas del resultado y bytes si devuelve una figura."""
+    if fn is None:
+        return functools.partial(instrumentar, nombre=nombre, tipo=tipo)
+    if getattr(fn, "_perf", False):
+        return fn
+    etiqueta = nombre or fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        out = fn(*args, **kwargs)
+        s = time.perf_counter() - t0
+        registrar(etiqueta, tipo, s, n_bytes=bytes_figura(out), n_filas=filas(out))
+        return out
+
+    wrapper._perf = True
+    return wrapper
+
+
+def instrumentar_modulo(ns: dict, prefijos: tuple, tipo: str = "grafico"):
+    """Sustituye en el namespace ns las funciones cuyo nombre empieza por prefijos."""
+    for nombre, obj in list(ns.items()):
+        if callable(obj) and nombre.startswith(prefijos) and getattr(obj, "__module__", None) == ns.get("__name__"):
+            ns[nombre] = instrumentar(obj, tipo=tipo)
+
+
+# -------------------------------------------------------------
+# CONSULTA
+# -------------------------------------------------------------
+def eventos(run: int = None) -> pd.DataFrame:
+    with _lock:
+        lista = list(_eventos)
+    df = pd.DataFrame(lista, columns=["run", "ts", "nombre", "tipo", "s", "cache", "bytes", "filas"])
+    return df if run is None else df[df["run"] == run].reset_index(drop=True)
+
+
+def ultima_ejecucion() -> int:
+    with _lock:
+        return max((e["run"] for e in _eventos), default=0)
+
+
+def resumen(df: pd.DataFrame = None) -> pd.DataFrame:
+    """Percentiles móviles (sobre los últimos MAX_EVENTOS eventos) por nombre."""
+    df = eventos() if df is None else df
+    if df.empty:
+        return pd.DataFrame(columns=["nombre", "tipo", "n", "p50_ms", "p90_ms", "p99_ms", "max_ms",
+                                     "total_s", "hits", "misses", "bytes", "filas"])
+    g = df.groupby(["nombre", "tipo"], sort=False)
+    ms = g["s"]
+    out = pd.DataFrame({
+        "n": g.size(),
+        "p50_ms": ms.quantile(0.5) * 1e3,
+        "p90_ms": ms.quantile(0.9) * 1e3,
+        "p99_ms": ms.quantile(0.99) * 1e3,
+        "max_ms": ms.max() * 1e3,
+        "total_s": ms.sum(),
+        "hits": g["cache"].apply(lambda c: int((c == "hit").sum())),
+        "misses": g["cache"].apply(lambda c: int((c == "miss").sum())),
+        "bytes": g["bytes"].last(),
+        "filas": g["filas"].last(),
+    }).reset_index()
+    return out.sort_values("total_s", ascending=False).round(2).reset_index(drop=True)
+
+
+def como_dict(run: int = None) -> dict:
+    """Para endpoints JSON: resumen móvil + eventos de una ejecución (la última por defecto)."""
+    run = ultima_ejecucion() if run is None else run
+    limpio = lambda df: df.astype(object).where(df.notna(), None).to_dict(orient="records")
+    return {"run": run, "resumen": limpio(resumen()), "eventos": limpio(eventos(run))}
+
+
+def reset():
+    with _lock:
+        _eventos.clear()
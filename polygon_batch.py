@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+# polygon_batch.py
+# Descarga por lotes de velas intradía (sin ajustar) desde Polygon.io.
+# Es el pipeline común de script_1m.py / script_15m.py, sin dependencia de Streamlit,
+# para poder lanzarlo desde cron o un servidor:
+#
+#   python polygon_batch.py entrada.csv --timeframe 1m --workers 8 --out-dir salida/
+#
+import os
+import io
+import sys
+import time
+import logging
+import email.utils
+import operator
+import argparse
+import threading
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+import requests
+
+try:
+    import orjson as _json  # parser rápido (opcional)
+except ImportError:
+    import json as _json
+
+# --------------------------
+# CONFIGURACIÓN
+# --------------------------
+# La API key sale siempre del entorno (export POLYGON_API_KEY=...); la URL base se puede
+# sobreescribir igual (p.ej. mock_polygon.py en local)
+POLYGON_API_KEY = os.environ.get("POLYGON_API_KEY", "")
+POLYGON_BASE_URL = os.environ.get("POLYGON_BASE_URL", "https://api.polygon.io").rstrip("/")
+
+# timeframe -> (multiplier, timespan) de la API de agregados
+TIMEFRAMES = {
+    "1m": (1, "minute"),
+    "15m": (15, "minute"),
+}
+
+COLUMNAS_BARRAS = ["ts_ms","open","high","low","close","volume","vwap","transactions","ticker","date"]
+
+MAX_REINTENTOS = 5
+
+# Campos de cada agregado de Polygon -> columna, en el orden del buffer
+CAMPOS_AGG = ("t", "o", "h", "l", "c", "v", "vw", "n")
+_COLUMNAS_AGG = ("ts_ms", "open", "high", "low", "close", "volume", "vwap", "transactions")
+_fila_agg = operator.itemgetter(*CAMPOS_AGG)
+
+log = logging.getLogger("polygon_batch")
+
+# Una sesión HTTP por hilo: reutiliza conexiones sin compartir estado entre workers
+_local = threading.local()
+
+def _http() -> requests.Session:
+    s = getattr(_local, "session", None)
+    if s is None:
+        s = requests.Session()
+        _local.session = s
+    return s
+
+# --------------------------
+# Tiempo en enteros (ms epoch)
+# --------------------------
+# Todo el pipeline trabaja con int64 en ms desde epoch; solo format_output genera texto.
+MS_DIA = 86_400_000
+_MEDIODIA_MS = 12 * 3_600_000
+
+SESION_INICIO_MIN = 9 * 60 + 30  # 09:30
+SESION_FIN_MIN = 16 * 60         # 16:00 (excluido)
+
+_HHMMSS = None
+
+def _dia_epoch(d: dt.date) -> int:
+    return (d - dt.date(1970, 1, 1)).days
+
+def _offsets_ms(ts_ms: np.ndarray, tz: str) -> np.ndarray:
+    """Offset UTC->tz (ms) de cada barra, con una sola consulta vectorizada por día.
+
+    El offset se toma a las 12:00 UTC de cada día: los cambios de horario ocurren
+    de madrugada, fuera del horario extendido (04:00-20:00 NY).
+    """
+    ts_ms = np.asarray(ts_ms, dtype="int64")
+    if ts_ms.size == 0:
+        return np.zeros(0, dtype="int64")
+    dias, inv = np.unique(ts_ms // MS_DIA, return_inverse=True)
+    ref = pd.to_datetime(dias * MS_DIA + _MEDIODIA_MS, unit="ms", utc=True)
+    local = ref.tz_convert(tz).tz_localize(None)
+    off = np.asarray((local - ref.tz_localize(None)) // pd.Timedelta(milliseconds=1), dtype="int64")
+    return off[inv]
+
+def _texto_hhmmss(ms: np.ndarray) -> np.ndarray:
+    # Tabla de 86400 strings construida una vez; formatear es un simple take()
+    global _HHMMSS
+    if _HHMMSS is None:
+        seg = np.arange(86_400)
+        _HHMMSS = np.array([f"{h:02d}:{m:02d}:{s:02d}" for h, m, s in zip(seg // 3600, (seg // 60) % 60, seg % 60)], dtype=object)
+    return _HHMMSS[(np.asarray(ms, dtype="int64") // 1000) % 86_400]
+
+# --------------------------
+# Helpers
+# --------------------------
+def load_csv(file_bytes: bytes) -> pd.DataFrame:
+    # Sin NA por defecto: "NA" es un ticker real (solo las celdas vacías son NA)
+    df = pd.read_csv(io.BytesIO(file_bytes), keep_default_na=False, na_values=[""])
+    ticker_col, date_col = None, None
+    for c in df.columns:
+        lc = str(c).lower().strip()
+        if lc in ("ticker", "symbol"):
+            ticker_col = c
+        if lc in ("date", "fecha"):
+            date_col = c
+    if ticker_col is None or date_col is None:
+        raise ValueError("El CSV debe tener columnas 'ticker' y 'date' (o 'fecha').")
+    df = df.rename(columns={ticker_col: "ticker", date_col: "date"})
+    df["ticker"] = df["ticker"].astype(str).str.upper().str.strip()
+    df["date"] = pd.to_datetime(df["date"]).dt.date
+    df = df.dropna(subset=["ticker", "date"]).reset_index(drop=True)
+    return df[["ticker", "date"]]
+
+def exigir_api_key() -> str:
+    if not POLYGON_API_KEY:
+        raise RuntimeError("Falta la API key de Polygon: define la variable de entorno POLYGON_API_KEY")
+    return POLYGON_API_KEY
+
+def polygon_agg_url(ticker: str, start_iso: str, end_iso: str, timeframe: str = "1m") -> str:
+    multiplier, timespan = TIMEFRAMES[timeframe]
+    return (
+        f"{POLYGON_BASE_URL}/v2/aggs/ticker/{ticker}/range/{multiplier}/{timespan}/"
+        f"{start_iso}/{end_iso}?adjusted=false&limit=50000&sort=asc&apiKey={POLYGON_API_KEY}"
+    )
+
+def _segundos_retry_after(valor, defecto: float) -> float:
+    """Retry-After en segundos: número de segundos o fecha HTTP (RFC 9110); si no se entiende, defecto."""
+    if not valor:
+        return defecto
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        cuando = email.utils.parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return defecto
+    if cuando.tzinfo is None:
+        cuando = cuando.replace(tzinfo=dt.timezone.utc)
+    return max(0.0, (cuando - dt.datetime.now(dt.timezone.utc)).total_seconds())
+
+def _get(url: str) -> requests.Response:
+    # Reintenta los 429 (rate limit) con backoff exponencial, respetando Retry-After
+    espera = 1.0
+    for intento in range(MAX_REINTENTOS + 1):
+        r = _http().get(url, timeout=30, headers={"Accept-Encoding": "gzip"})
+        if r.status_code != 429 or intento == MAX_REINTENTOS:
+            return r
+        time.sleep(_segundos_retry_after(r.headers.get("Retry-After"), espera))
+        espera = min(espera * 2, 30.0)
+    return r
+
+def fetch_polygon_minutes(ticker: str, target_date: dt.date, timeframe: str = "1m") -> pd.DataFrame:
+    from_zone = "America/New_York"
+    from_day = target_date.strftime("%Y-%m-%d")
+    url = polygon_agg_url(ticker, from_day, from_day, timeframe)
+    results = []
+    while url:
+        r = _get(url)
+        if r.status_code != 200:
+            raise RuntimeError(f"Polygon error {r.status_code}: {r.text}")
+        data = _json.loads(r.content)
+        if data.get("status") != "OK" and "results" not in data:
+            break
+        results.extend(data.get("results", []) or [])
+        # Paginación: next_url no incluye la API key
+        url = data.get("next_url")
+        if url:
+            url = f"{url}{'&' if '?' in url else '?'}apiKey={POLYGON_API_KEY}"
+
+    if not results:
+        return pd.DataFrame(columns=COLUMNAS_BARRAS)
+
+    df = pd.DataFrame(decode_results(results))
+    df["ticker"] = ticker
+    df["date"] = target_date
+    # Día local de NY en enteros: (ts + offset) // ms_por_día
+    ts = df["ts_ms"].to_numpy()
+    dia_ny = (ts + _offsets_ms(ts, from_zone)) // MS_DIA
+    df = df.loc[dia_ny == _dia_epoch(target_date)]
+    return df[COLUMNAS_BARRAS]
+
+def decode_results(results: list) -> dict:
+    """Convierte la lista 'results' de Polygon en columnas NumPy tipadas.
+
+    Una sola pasada sobre las barras hacia un buffer (n, 8) float64 preasignado;
+    't' cabe exacto en float64 (ms < 2**53) y luego se pasa a int64.
+    """
+    n = len(results)
+    try:
+        buf = np.fromiter(map(_fila_agg, results), dtype=np.dtype((np.float64, len(CAMPOS_AGG))), count=n)
+    except (KeyError, TypeError):
+        # Alguna barra sin 'vw'/'n' (o con null): camino lento con NaN por defecto
+        buf = np.empty((n, len(CAMPOS_AGG)), dtype=np.float64)
+        for i, bar in enumerate(results):
+            for j, k in enumerate(CAMPOS_AGG):
+                v = bar.get(k)
+                buf[i, j] = np.nan if v is None else v
+    cols = {c: buf[:, j] for j, c in enumerate(_COLUMNAS_AGG)}
+    cols["ts_ms"] = cols["ts_ms"].astype(np.int64)
+    # volumen / transacciones suelen ser enteros: mantener el mismo CSV que antes
+    for c in ("volume", "transactions"):
+        v = cols[c]
+        if not np.isnan(v).any() and (v == np.floor(v)).all():
+            cols[c] = v.astype(np.int64)
+    return cols
+
+def add_local_times(df_m1: pd.DataFrame, tz_out: str) -> pd.DataFrame:
+    if df_m1.empty:
+        return df_m1
+    df = df_m1.sort_values("ts_ms")
+    ts = df["ts_ms"].to_numpy()
+    local = ts + _offsets_ms(ts, tz_out)
+    madrid = ts + _offsets_ms(ts, "Europe/Madrid")
+    out = pd.DataFrame({
+        "ticker": df["ticker"].to_numpy(),
+        "date": df["date"].to_numpy(),
+        "datetime_utc": ts,
+        "madrid_time": madrid,
+        "bar_time_local": local,
+    })
+    for c in ["open","high","low","close","volume","vwap","transactions"]:
+        out[c] = df[c].to_numpy()
+    return out
+
+def filter_session_m1(df_m1: pd.DataFrame, session_only: bool) -> pd.DataFrame:
+    if df_m1.empty or not session_only:
+        return df_m1
+    minuto = (df_m1["bar_time_local"].to_numpy() // 60_000) % 1440
+    mask = (minuto >= SESION_INICIO_MIN) & (minuto < SESION_FIN_MIN)
+    return df_m1.loc[mask]
+
+def format_output(out: pd.DataFrame) -> pd.DataFrame:
+    """Formatea las columnas horarias (ms epoch) como HH:MM:SS para exportar."""
+    out_fmt = out.copy()
+    out_fmt["datetime_utc"] = _texto_hhmmss(out_fmt["datetime_utc"].to_numpy())
+    out_fmt["madrid_time"] = _texto_hhmmss(out_fmt["madrid_time"].to_numpy())
+    out_fmt["bar_time_local"] = _texto_hhmmss(out_fmt["bar_time_local"].to_numpy())
+    return out_fmt.rename(columns={"madrid_time": "Madrid Time"})
+
+# --------------------------
+# Lote
+# --------------------------
+def descargar_sesion(ticker: str, date_py: dt.date, timeframe: str, tz_out: str,
+                     session_only: bool, throttle_s: float = 0.0) -> pd.DataFrame:
+    try:
+        m1 = fetch_polygon_minutes(ticker, date_py, timeframe)
+        if not m1.empty:
+            m1 = add_local_times(m1, tz_out=tz_out)
+            m1 = filter_session_m1(m1, session_only=session_only)
+        return m1
+    finally:
+        if throttle_s:
+            time.sleep(float(throttle_s))
+
+def run_batch(
+    df_in: pd.DataFrame,
+    timeframe: str = "1m",
+    tz_out: str = "America/New_York",
+    session_only: bool = True,
+    workers: int = 4,
+    throttle_s: float = 0.0,
+    on_progress: Optional[Callable[[int, int, str, dt.date, Optional[str]], None]] = None,
+) -> tuple:
+    """Descarga todas las sesiones (ticker, date) de df_in con un pool de hilos.
+
+    on_progress(hechas, total, ticker, date, error) se llama desde el hilo que invoca
+    run_batch (no desde los workers), así que puede tocar la UI de Streamlit.
+    Devuelve (barras, vacías, errores): barras en el orden de entrada, vacías como
+    lista de (ticker, date) y errores como lista de (ticker, date, mensaje).
+    """
+    exigir_api_key()
+    df_in = df_in.drop_duplicates(subset=["ticker","date"]).reset_index(drop=True)
+    total = len(df_in)
+    partes, vacias, errores = {}, [], []
+
+    with ThreadPoolExecutor(max_workers=max(1, int(workers))) as pool:
+        futuros = {
+            pool.submit(descargar_sesion, row.ticker, row.date, timeframe, tz_out, session_only, throttle_s): (i, row.ticker, row.date)
+            for i, row in enumerate(df_in.itertuples(index=False))
+        }
+        for hechas, fut in enumerate(as_completed(futuros), start=1):
+            i, ticker, date_py = futuros[fut]
+            error = None
+            try:
+                m1 = fut.result()
+                if m1.empty:
+                    vacias.append((ticker, date_py))
+                    log.warning("Sin datos: %s %s", ticker, date_py)
+                else:
+                    partes[i] = m1
+            except Exception as e:
+                error = str(e)
+                errores.append((ticker, date_py, error))
+                log.error("%s %s: %s", ticker, date_py, error)
+            log.info("%d/%d • %s • %s", hechas, total, ticker, date_py)
+            if on_progress is not None:
+                on_progress(hechas, total, ticker, date_py, error)
+
+    if partes:
+        out = pd.concat([partes[i] for i in sorted(partes)], ignore_index=True)
+    else:
+        out = pd.DataFrame()
+    return out, vacias, errores
+
+# --------------------------
+# CLI
+# --------------------------
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="Descarga intradía sin ajustar de Polygon.io por lotes.")
+    p.add_argument("csv", help="CSV con columnas 'ticker' y 'date' (o 'symbol'/'fecha')")
+    p.add_argument("--timeframe", choices=sorted(TIMEFRAMES), default="1m")
+    p.add_argument("--workers", type=int, default=8, help="descargas concurrentes")
+    p.add_argument("--out-dir", default=".", help="directorio de salida")
+    p.add_argument("--tz", default="America/New_York", help="zona horaria de bar_time_local")
+    p.add_argument("--all-hours", action="store_true", help="no filtrar a la sesión regular 09:30-16:00")
+    p.add_argument("--throttle", type=float, default=0.0, help="pausa por worker entre requests (seg)")
+    p.add_argument("--log", default=None, help="log de progreso (por defecto <out-dir>/progress.log)")
+    p.add_argument("--store", default=None, help="almacén local (bar_store, uno por --tz/--all-hours): solo descarga las sesiones que falten")
+    p.add_argument("--retry-empty", action="store_true", help="con --store, reintentar sesiones que vinieron vacías")
+    args = p.parse_args(argv)
+    if not POLYGON_API_KEY:
+        p.error("falta la API key de Polygon: define la variable de entorno POLYGON_API_KEY")
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    log_path = args.log or os.path.join(args.out_dir, "progress.log")
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+        handlers=[logging.FileHandler(log_path, encoding="utf-8"), logging.StreamHandler(sys.stderr)],
+    )
+
+    with open(args.csv, "rb") as f:
+        df_in = load_csv(f.read())
+    log.info("%d sesiones en %s (timeframe %s, %d workers)", len(df_in), args.csv, args.timeframe, args.workers)
+
+    store = None
+    if args.store:
+        import bar_store
+        store = bar_store.BarStore(args.store, args.timeframe, tz=args.tz, session_only=not args.all_hours)
+        pedidas = len(df_in)
+        df_in = store.missing(df_in.drop_duplicates(subset=["ticker","date"]), retry_empty=args.retry_empty)
+        log.info("Almacén %s: %d sesiones guardadas, faltan %d de %d", store.dir, len(store), len(df_in), pedidas)
+
+    t0 = time.perf_counter()
+    out, vacias, errores = run_batch(
+        df_in,
+        timeframe=args.timeframe,
+        tz_out=args.tz,
+        session_only=not args.all_hours,
+        workers=args.workers,
+        throttle_s=args.throttle,
+    )
+    elapsed = time.perf_counter() - t0
+
+    if out.empty:
+        log.warning("No se generaron velas de %s.", args.timeframe)
+    else:
+        out_fmt = format_output(out)
+        path = os.path.join(args.out_dir, f"intraday_{args.timeframe}_unadjusted.csv")
+        out_fmt.to_csv(path, index=False)
+        log.info("%d velas -> %s", len(out), path)
+    if store is not None:
+        store.append(out_fmt if not out.empty else pd.DataFrame(), empty=vacias)
+    log.info("Fin: %d sesiones en %.1fs (%d sin datos, %d errores)", len(df_in), elapsed, len(vacias), len(errores))
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,95 +1,15 @@
 # -*- coding: utf-8 -*-
-import os
-import io
-import time
-import json
-import datetime as dt
-from typing import Optional
-
 import pandas as pd
-import requests
 import streamlit as st
 
-st.set_page_config(page_title="Intradía 15m • Polygon.io (sin ajustar)", layout="wide")
+import polygon_batch as pb
 
-# --------------------------
-# CONFIGURACIÓN
-# --------------------------
-POLYGON_API_KEY = "jpenHG984Gtqgvphgw_XS6e_kysajwAt"  # <<<< tu API key
+st.set_page_config(page_title="Intradía 15m • Polygon.io (sin ajustar)", layout="wide")
 
 # --------------------------
 # Helpers
 # --------------------------
-@st.cache_data(show_spinner=False)
-def load_csv(file_bytes: bytes) -> pd.DataFrame:
-    df = pd.read_csv(io.BytesIO(file_bytes))
-    ticker_col, date_col = None, None
-    for c in df.columns:
-        lc = str(c).lower().strip()
-        if lc in ("ticker", "symbol"):
-            ticker_col = c
-        if lc in ("date", "fecha"):
-            date_col = c
-    if ticker_col is None or date_col is None:
-        raise ValueError("El CSV debe tener columnas 'ticker' y 'date' (o 'fecha').")
-    df = df.rename(columns={ticker_col: "ticker", date_col: "date"})
-    df["ticker"] = df["ticker"].astype(str).str.upper().str.strip()
-    df["date"] = pd.to_datetime(df["date"]).dt.date
-    df = df.dropna(subset=["ticker", "date"]).reset_index(drop=True)
-    return df[["ticker", "date"]]
-
-def polygon_agg_url(ticker: str, start_iso: str, end_iso: str) -> str:
-    return (
-        f"https://api.polygon.io/v2/aggs/ticker/{ticker}/range/15/minute/"
-        f"{start_iso}/{end_iso}?adjusted=false&limit=50000&sort=asc&apiKey={POLYGON_API_KEY}"
-    )
-
-def fetch_polygon_minutes(ticker: str, target_date: dt.date) -> pd.DataFrame:
-    from_zone = "America/New_York"
-    from_day = target_date.strftime("%Y-%m-%d")
-    url = polygon_agg_url(ticker, from_day, from_day)
-    r = requests.get(url, timeout=30)
-    if r.status_code != 200:
-        raise RuntimeError(f"Polygon error {r.status_code}: {r.text}")
-    data = r.json()
-    if data.get("status") != "OK" and "results" not in data:
-        return pd.DataFrame(columns=["datetime_utc","open","high","low","close","volume","vwap","transactions","ticker","date"])
-
-    results = data.get("results", []) or []
-    if not results:
-        return pd.DataFrame(columns=["datetime_utc","open","high","low","close","volume","vwap","transactions","ticker","date"])
-
-    df = pd.DataFrame(results).rename(
-        columns={"t":"ts_ms","o":"open","h":"high","l":"low","c":"close","v":"volume","vw":"vwap","n":"transactions"}
-    )
-    df["datetime_utc"] = pd.to_datetime(df["ts_ms"], unit="ms", utc=True)
-    df["ticker"] = ticker
-    df["date"] = pd.to_datetime(target_date).date()
-    df["_ny_time"] = df["datetime_utc"].dt.tz_convert(from_zone)
-    mask = df["_ny_time"].dt.date == target_date
-    df = df.loc[mask].drop(columns=["ts_ms","_ny_time"])
-    return df[["datetime_utc","open","high","low","close","volume","vwap","transactions","ticker","date"]]
-
-def add_local_times(df_m1: pd.DataFrame, tz_out: str) -> pd.DataFrame:
-    if df_m1.empty:
-        return df_m1
-    df = df_m1.copy().sort_values("datetime_utc")
-    df["bar_time_local"] = df["datetime_utc"].dt.tz_convert(tz_out)
-    df["madrid_time"] = df["datetime_utc"].dt.tz_convert("Europe/Madrid")
-    cols = [
-        "ticker","date",
-        "datetime_utc","madrid_time","bar_time_local",
-        "open","high","low","close","volume","vwap","transactions"
-    ]
-    return df[cols]
-
-def filter_session_m1(df_m1: pd.DataFrame, session_only: bool) -> pd.DataFrame:
-    if df_m1.empty or not session_only:
-        return df_m1
-    local = df_m1.copy()
-    hhmm = local["bar_time_local"].dt.strftime("%H:%M")
-    mask = (hhmm >= "09:30") & (hhmm < "16:00")
-    return local.loc[mask]
+load_csv = st.cache_data(show_spinner=False)(pb.load_csv)
 
 # --------------------------
 # UI
@@ -100,8 +20,13 @@ st.caption("CSV con 'ticker' y 'date'. Devuelve velas de 15m sin ajustar por spl
 with st.sidebar:
     tz_out = st.selectbox("Zona horaria", ["America/New_York","UTC","Europe/Madrid"], index=0)
     session_only = st.checkbox("Solo sesión regular (09:30-16:00)", value=True)
+    workers = st.number_input("Descargas en paralelo", min_value=1, max_value=32, value=4, step=1)
     throttle_s = st.number_input("Pausa entre requests (seg)", min_value=0.0, value=0.25, step=0.05)
 
+if not pb.POLYGON_API_KEY:
+    st.error("Falta la API key de Polygon: define la variable de entorno POLYGON_API_KEY y reinicia la app.")
+    st.stop()
+
 uploaded = st.file_uploader("CSV de entrada", type=["csv"])
 
 with st.expander("Formato esperado"):
@@ -114,33 +39,31 @@ if uploaded is not None:
 
     progress = st.progress(0.0, text="Descargando 15m…")
     status = st.empty()
+    paso = max(1, len(df_in) // 200)  # no repintar la UI en cada fila
+
+    def on_progress(hechas, total, ticker, date_py, error):
+        if hechas % paso == 0 or hechas == total:
+            status.write(f"{hechas}/{total} • {ticker} • {date_py}")
+            progress.progress(hechas / total)
+
+    out, vacias, errores = pb.run_batch(
+        df_in,
+        timeframe="15m",
+        tz_out=tz_out,
+        session_only=session_only,
+        workers=int(workers),
+        throttle_s=float(throttle_s),
+        on_progress=on_progress,
+    )
 
-    all_m1 = []
-    total = len(df_in)
-    for i, row in enumerate(df_in.itertuples(index=False)):
-        ticker = row.ticker
-        date_py = row.date
-        status.write(f"{i+1}/{total} • {ticker} • {date_py}")
-        try:
-            m1 = fetch_polygon_minutes(ticker, date_py)
-            if not m1.empty:
-                m1 = add_local_times(m1, tz_out=tz_out)
-                m1 = filter_session_m1(m1, session_only=session_only)
-                all_m1.append(m1)
-            else:
-                st.warning(f"Sin datos: {ticker} {date_py}")
-        except Exception as e:
-            st.error(f"{ticker} {date_py}: {e}")
-        time.sleep(float(throttle_s))
-        progress.progress((i+1)/total)
+    if vacias:
+        with st.expander(f"Sin datos: {len(vacias)} sesiones"):
+            st.dataframe(pd.DataFrame(vacias, columns=["ticker","date"]), use_container_width=True)
+    for ticker, date_py, error in errores:
+        st.error(f"{ticker} {date_py}: {error}")
 
-    if all_m1:
-        out = pd.concat(all_m1, ignore_index=True)
-        out_fmt = out.copy()
-        out_fmt["datetime_utc"] = out_fmt["datetime_utc"].dt.strftime("%H:%M:%S")
-        out_fmt["madrid_time"] = out_fmt["madrid_time"].dt.strftime("%H:%M:%S")
-        out_fmt["bar_time_local"] = out_fmt["bar_time_local"].dt.strftime("%H:%M:%S")
-        out_fmt = out_fmt.rename(columns={"madrid_time": "Madrid Time"})
+    if not out.empty:
+        out_fmt = pb.format_output(out)
         st.subheader("Velas 15m (sin ajustar)")
         st.dataframe(out_fmt.head(200), use_container_width=True)
         csv_bytes = out_fmt.to_csv(index=False).encode("utf-8")
@@ -148,4 +71,4 @@ if uploaded is not None:
     else:
         st.warning("No se generaron velas de 15m.")
 else:
-    st.info("Carga un CSV para empezar.")
\ No newline at end of file
+    st.info("Carga un CSV para empezar.")
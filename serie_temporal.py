@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# serie_temporal.py
+# Jerarquía de tiempo día -> semana / mes -> trimestre para las gráficas de serie
+# (gaps, volumen, gap value, spikes, range, close red, fade). La base es una
+# tabla diaria de estadísticos suficientes (conteos y sumas por fecha); cada
+# nivel más grueso se obtiene sumando el nivel inferior, nunca reagrupando filas,
+# y la media sale al final como suma / conteo. Las medias móviles se expresan en
+# la unidad elegida (por defecto ~6 meses en cada una):
+#
+#   st = SerieTemporal.construir(stocks_filtrados)
+#   st.serie("W", "gap")               # Periodo, Gap (%), SMA (26 semanas)
+#   st.serie("D", "stocks", ventana=20)
+#
+import numpy as np
+import pandas as pd
+
+NIVELES = ("D", "W", "M", "Q")
+NOMBRES = {"D": "Día", "W": "Semana", "M": "Mes", "Q": "Trimestre"}
+VENTANA_DEFECTO = {"D": 126, "W": 26, "M": 6, "Q": 2}  # ~6 meses en cada unidad
+
+# métrica -> (tipo, columna de origen, columna de salida)
+#   n: gaps del periodo; suma: suma de la columna; media: media * 100 (redondeada
+#   a 2 decimales antes de la SMA); media_sma: igual pero redondeando después de
+#   la SMA; rojo: % de cierres en rojo
+METRICAS = {
+    "stocks": ("n", None, "Stocks"),
+    "volume": ("suma", "EOD Volume", "EOD Volume"),
+    "gap": ("media", "Open Gap %", "Gap (%)"),
+    "highspike": ("media", "High Spike %", "High Spike (%)"),
+    "lowspike": ("media", "Low Spike %", "Low Spike (%)"),
+    "range": ("media", "RTH Range %", "Range (%)"),
+    "closered": ("rojo", None, "Close Red (%)"),
+    "rth_fade_close": ("media_sma", "RTH Fade to Close %", "Fade (%)"),
+}
+
+
+def _etiquetas(nivel: str, claves: pd.DataFrame) -> pd.Series:
+    a = claves.iloc[:, 0].astype(str)
+    if nivel == "W":
+        return a + "-W" + claves.iloc[:, 1].astype(str).str.zfill(2)
+    if nivel == "M":
+        return a + "-" + claves.iloc[:, 1].astype(str).str.zfill(2)
+    return a + "-Q" + claves.iloc[:, 1].astype(str)
+
+
+class SerieTemporal:
+    """Tablas por nivel (D/W/M/Q): Periodo, inicio y columnas sumables n / n_rojo / n_<col> / s_<col>."""
+
+    def __init__(self, niveles: dict):
+        self.niveles = niveles
+
+    @classmethod
+    def construir(cls, df: pd.DataFrame, convertir=None) -> "SerieTemporal":
+        """convertir(Series) -> Series numérica (por defecto pd.to_numeric con errors="coerce")."""
+        convertir = convertir or (lambda x: pd.to_numeric(x, errors="coerce"))
+        columnas = sorted({c for _, c, _ in METRICAS.values() if c is not None})
+        base = pd.DataFrame({"inicio": pd.to_datetime(df["Date"]).dt.normalize().to_numpy(),
+                             "n": 1, "n_rojo": (df["Day Return %"] < 0).to_numpy().astype(np.int64)})
+        for c in columnas:
+            x = convertir(df[c]).to_numpy(dtype=np.float64)
+            base[f"n_{c}"] = (~np.isnan(x)).astype(np.int64)
+            base[f"s_{c}"] = np.nan_to_num(x)
+
+        # D desde filas; W y M desde D; Q desde M
+        diario = base.groupby("inicio", sort=True).sum().reset_index()
+        diario.insert(0, "Periodo", diario["inicio"].dt.strftime("%Y-%m-%d"))
+        iso = diario["inicio"].dt.isocalendar()  # misma semana ISO que stocks_v1["Week"]
+        semanal = cls._subir(diario, "W", [iso["year"].astype(int), iso["week"].astype(int)])
+        mensual = cls._subir(diario, "M", [diario["inicio"].dt.year, diario["inicio"].dt.month])
+        trimestral = cls._subir(mensual, "Q", [mensual["inicio"].dt.year, mensual["inicio"].dt.quarter])
+        return cls({"D": diario, "W": semanal, "M": mensual, "Q": trimestral})
+
+    @staticmethod
+    def _subir(inferior: pd.DataFrame, nivel: str, claves: list) -> pd.DataFrame:
+        """Suma el nivel inferior por las claves del nivel (inicio = primer día con datos)."""
+        sumables = [c for c in inferior.columns if c not in ("Periodo", "inicio")]
+        g = inferior.groupby([k.rename(f"_k{i}") for i, k in enumerate(claves)], sort=True)
+        out = g[sumables].sum()
+        out.insert(0, "inicio", g["inicio"].min())
+        out = out.reset_index()
+        out.insert(0, "Periodo", _etiquetas(nivel, out.iloc[:, :2]))
+        return out.drop(columns=out.columns[1:3])
+
+    def serie(self, nivel: str = "M", metrica: str = "stocks", ventana: int = None) -> pd.DataFrame:
+        """Periodo, <columna de la métrica> y SMA (ventana en unidades del nivel)."""
+        if nivel not in self.niveles:
+            raise KeyError(f"nivel desconocido: {nivel} (hay: {', '.join(NIVELES)})")
+        tipo, col, salida = METRICAS[metrica]
+        t = self.niveles[nivel]
+        ventana = ventana or VENTANA_DEFECTO[nivel]
+        if tipo == "n":
+            valor = t["n"]
+        elif tipo == "suma":
+            valor = t[f"s_{col}"]
+        elif tipo == "rojo":
+            valor = (t["n_rojo"] / t["n"] * 100).round(2)
+        else:
+            valor = t[f"s_{col}"] / t[f"n_{col}"].where(t[f"n_{col}"] > 0) * 100
+            if tipo == "media":
+                valor = valor.round(2)
+        sma = valor.rolling(ventana, min_periods=1).mean()
+        if tipo == "media_sma":
+            valor, sma = valor.round(2), sma.round(2)
+        return pd.DataFrame({"Periodo": t["Periodo"], salida: valor, "SMA": sma})
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# session_index.py
+# Índice de sesiones (Ticker, Date) de las listas data_open_gap.csv y
+# data_premarket.csv (mismo esquema Date,Ticker,Open Gap %,PMH Gap %).
+# Se carga una sola vez por proceso (get_session_index) y responde pertenencia y
+# atributos en O(1) con una tabla hash sobre claves int64 (session_keys).
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+import session_keys as sk
+
+_DIR = os.path.dirname(os.path.abspath(__file__))
+
+LISTAS = {
+    "open_gap": os.path.join(_DIR, "data_open_gap.csv"),
+    "premarket": os.path.join(_DIR, "data_premarket.csv"),
+}
+ATRIBUTOS = ["Open Gap %", "PMH Gap %"]
+
+
+def _claves_validas(tickers, dates) -> tuple:
+    """(máscara de filas válidas, claves de esas filas); NaN/vacíos y tickers o fechas que no
+    caben en la clave no se indexan (annotate los trata como fuera de todas las listas)."""
+    t = pd.Series(tickers, copy=False).astype("string").str.upper().str.strip()
+    d = pd.to_datetime(pd.Series(dates, copy=False), errors="coerce")
+    ok = sk.codificables(t, d)
+    return ok, sk.encode_sessions(t[ok], d[ok])
+
+
+class SessionIndex:
+    def __init__(self, listas: dict = None):
+        listas = LISTAS if listas is None else listas
+        self.listas = list(listas)
+        frames = []
+        for nombre, path in listas.items():
+            # "NA" es un ticker real: solo los campos vacíos son NA
+            df = pd.read_csv(path, keep_default_na=False, na_values={c: [""] for c in ["Date", *ATRIBUTOS]})
+            ok, keys = _claves_validas(df["Ticker"], df["Date"])
+            df = df.loc[ok, ATRIBUTOS].copy()
+            df["key"] = keys
+            df["lista"] = nombre
+            frames.append(df)
+        todas = pd.concat(frames, ignore_index=True)
+
+        # Una fila por sesión: atributos de la primera lista donde aparece + flags por lista
+        flags = pd.crosstab(todas["key"], todas["lista"]).reindex(columns=self.listas, fill_value=0) > 0
+        attrs = todas.drop_duplicates("key").set_index("key")[ATRIBUTOS]
+        self.tabla = attrs.join(flags.add_prefix("in_"))
+        # pd.Index sobre int64 usa una tabla hash: get_loc / get_indexer en O(1) por clave
+        self.index = pd.Index(self.tabla.index.to_numpy(dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _pos(self, ticker: str, date) -> int:
+        key = int(sk.encode_sessions([ticker], [date])[0])
+        return self.index.get_indexer([key])[0]
+
+    def contains(self, ticker: str, date, lista: str = None) -> bool:
+        pos = self._pos(ticker, date)
+        if pos < 0:
+            return False
+        return True if lista is None else bool(self.tabla[f"in_{lista}"].iat[pos])
+
+    def lookup(self, ticker: str, date):
+        """Atributos y flags de una sesión, o None si no está en ninguna lista."""
+        pos = self._pos(ticker, date)
+        return None if pos < 0 else self.tabla.iloc[pos].to_dict()
+
+    def annotate(self, df: pd.DataFrame, ticker_col: str = "Ticker", date_col: str = "Date") -> pd.DataFrame:
+        """Añade a df las columnas in_<lista> (bool) con un join vectorizado por clave."""
+        ok, keys = _claves_validas(df[ticker_col], df[date_col])
+        pos = np.full(len(df), -1, dtype=np.int64)
+        pos[ok] = self.index.get_indexer(keys)
+        hit = pos >= 0
+        for nombre in self.listas:
+            col = self.tabla[f"in_{nombre}"].to_numpy()
+            flag = np.zeros(len(df), dtype=bool)
+            flag[hit] = col[pos[hit]]
+            df[f"in_{nombre}"] = flag
+        return df
+
+
+@lru_cache(maxsize=1)
+def get_session_index() -> SessionIndex:
+    return SessionIndex()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# session_keys.py
+# Codifica sesiones (ticker, date) como un int64 para poder indexar, diferenciar y
+# deduplicar cientos de miles de sesiones con operaciones NumPy en vez de strings.
+#
+#   key = codigo_ticker << 17 | días_desde_1970
+#
+# codigo_ticker es el ticker en base 39 (hasta 8 caracteres de 0-9 A-Z . -),
+# así que la clave ocupa 60 bits y es reversible (decode_keys).
+import numpy as np
+import pandas as pd
+
+ALFABETO = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ.-"
+BASE = len(ALFABETO) + 1  # 0 = relleno
+MAX_LEN_TICKER = 8
+BITS_DIA = 17  # hasta el año 2328
+
+_LUT = np.full(256, -1, dtype=np.int64)
+_LUT[0] = 0
+for _i, _ch in enumerate(ALFABETO, start=1):
+    _LUT[ord(_ch)] = _i
+_POTENCIAS = BASE ** np.arange(MAX_LEN_TICKER - 1, -1, -1, dtype=np.int64)
+_CHARS = np.array([b""] + [c.encode() for c in ALFABETO], dtype="S1")
+
+
+def encode_tickers(tickers) -> np.ndarray:
+    t = pd.Series(tickers, copy=False)
+    if t.isna().any():
+        raise ValueError("Hay tickers vacíos (NaN): límpialos antes de codificar")
+    t = t.astype(str).str.upper().str.strip()
+    if (t.str.len() > MAX_LEN_TICKER).any():
+        largos = t[t.str.len() > MAX_LEN_TICKER].unique()[:5]
+        raise ValueError(f"Tickers de más de {MAX_LEN_TICKER} caracteres: {list(largos)}")
+    b = np.asarray(t.to_numpy(dtype=f"S{MAX_LEN_TICKER}"))
+    m = _LUT[b.view(np.uint8).reshape(len(b), MAX_LEN_TICKER)]
+    if (m < 0).any():
+        raise ValueError("Ticker con caracteres fuera de 0-9 A-Z . -")
+    return m @ _POTENCIAS
+
+
+def encode_dates(dates) -> np.ndarray:
+    s = pd.Series(dates, copy=False)
+    d = pd.to_datetime(s, errors="coerce")
+    if d.isna().any():
+        malas = s[d.isna()].unique()[:5]
+        raise ValueError(f"Fechas vacías o no válidas: {list(malas)}")
+    dias = d.to_numpy(dtype="datetime64[D]").astype(np.int64)
+    if ((dias < 0) | (dias >= 1 << BITS_DIA)).any():
+        raise ValueError(f"Fechas fuera de 1970-{1970 + (1 << BITS_DIA) // 366}: no caben en la clave")
+    return dias
+
+
+def codificables(tickers, dates=None) -> np.ndarray:
+    """Máscara de las filas que encode_sessions acepta (ticker 1-8 de 0-9 A-Z . -, fecha
+    válida en rango), para descartar filas raras en vez de que falle toda la codificación."""
+    t = pd.Series(tickers, copy=False).astype("string").str.upper().str.strip()
+    ok = t.str.fullmatch(f"[0-9A-Z.\\-]{{1,{MAX_LEN_TICKER}}}").fillna(False).to_numpy(dtype=bool)
+    if dates is not None:
+        d = pd.to_datetime(pd.Series(dates, copy=False), errors="coerce")
+        dias = d.to_numpy(dtype="datetime64[D]")
+        ok &= d.notna().to_numpy()
+        ok &= (dias >= np.datetime64("1970-01-01")) & (dias < np.datetime64("1970-01-01") + (1 << BITS_DIA))
+    return ok
+
+
+def encode_sessions(tickers, dates) -> np.ndarray:
+    return (encode_tickers(tickers) << BITS_DIA) | encode_dates(dates)
+
+
+def decode_keys(keys) -> pd.DataFrame:
+    keys = np.asarray(keys, dtype=np.int64)
+    dias = keys & ((1 << BITS_DIA) - 1)
+    codigo = keys >> BITS_DIA
+    digitos = (codigo[:, None] // _POTENCIAS) % BASE
+    tickers = _CHARS[digitos].view(f"S{MAX_LEN_TICKER}").ravel().astype(str)
+    return pd.DataFrame({"ticker": tickers, "date": dias.astype("datetime64[D]").astype(object)})
+
+
+def isin_sorted(keys, sorted_index) -> np.ndarray:
+    """Máscara de pertenencia de keys en un índice int64 ordenado (búsqueda binaria)."""
+    keys = np.asarray(keys, dtype=np.int64)
+    if len(sorted_index) == 0:
+        return np.zeros(len(keys), dtype=bool)
+    pos = np.searchsorted(sorted_index, keys)
+    pos = np.minimum(pos, len(sorted_index) - 1)
+    return sorted_index[pos] == keys
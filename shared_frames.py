@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+# shared_frames.py
+# Datasets y agregados en memoria compartida para servir dashboard.py con varios
+# workers. Un proceso cargador los materializa una sola vez como columnas .npy +
+# manifest.json (en /dev/shm si existe); cada worker se adjunta con np.load(mmap)
+# sin copiar, así el sistema operativo comparte las mismas páginas físicas entre
+# todos y ni la memoria ni el arranque crecen con el número de workers:
+#
+#   python dashboard.py --publish /dev/shm/smallcaps
+#   SMALLCAPS_SHARED_DIR=/dev/shm/smallcaps gunicorn -w 8 dashboard:server
+#
+# Formato (NumPy puro, sin pyarrow):
+#   <dir>/actual.json               -> {"version": "v<ns>"}   (se cambia atómicamente)
+#   <dir>/v<ns>/manifest.json       -> frames (columnas, dtypes, índice) y escalares
+#   <dir>/v<ns>/<frame>/cN.npy      -> una columna; texto como códigos de categoría
+#
+import os
+import json
+import time
+import shutil
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+DIR_DEFECTO = "/dev/shm/smallcaps" if os.path.isdir("/dev/shm") else os.path.join(tempfile.gettempdir(), "smallcaps")
+VERSIONES_CONSERVADAS = 2  # las anteriores se borran (los workers ya adjuntos mantienen su mmap)
+
+_ESCALARES = (type(None), bool, int, float, str, np.generic)
+
+
+# -------------------------------------------------------------
+# ESCRITURA (proceso cargador)
+# -------------------------------------------------------------
+def _guardar(ruta: str, arr: np.ndarray) -> str:
+    np.save(ruta, np.ascontiguousarray(arr), allow_pickle=False)
+    return os.path.basename(ruta) + ".npy"
+
+
+def _escribir_columna(carpeta: str, clave: str, s: pd.Series) -> dict:
+    """Guarda una columna y devuelve su entrada del manifest."""
+    base = os.path.join(carpeta, clave)
+    dtype = s.dtype
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        valores = s.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy()
+        return {"tipo": "fecha", "tz": str(dtype.tz), "datos": _guardar(base, valores)}
+    if isinstance(dtype, pd.api.extensions.ExtensionDtype) and hasattr(dtype, "numpy_dtype") \
+            and not isinstance(dtype, pd.CategoricalDtype) and dtype.kind in "iufb":
+        # Int64 / UInt32 / Float64 / boolean: valores + máscara de nulos
+        datos = s.to_numpy(dtype=dtype.numpy_dtype, na_value=dtype.numpy_dtype.type(0))
+        return {"tipo": "enmascarada", "dtype": str(dtype),
+                "datos": _guardar(base, datos), "mascara": _guardar(base + "_m", s.isna().to_numpy())}
+    if isinstance(dtype, np.dtype) and dtype.kind in "biufcmM":
+        return {"tipo": "num", "datos": _guardar(base, s.to_numpy())}
+    # Texto / object / categórica: códigos enteros compartidos + categorías (pequeñas)
+    cat = s.array if isinstance(dtype, pd.CategoricalDtype) else pd.Categorical(s)
+    with open(base + "_cat.pkl", "wb") as f:
+        pickle.dump(cat.categories, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return {"tipo": "categoria", "ordenada": bool(cat.ordered), "datos": _guardar(base, cat.codes),
+            "categorias": clave + "_cat.pkl"}
+
+
+def _escribir_frame(carpeta: str, df: pd.DataFrame) -> dict:
+    if isinstance(df.index, pd.MultiIndex) or isinstance(df.columns, pd.MultiIndex):
+        raise ValueError("shared_frames no admite MultiIndex (usar reset_index antes de publicar)")
+    os.makedirs(carpeta)
+    idx = df.index
+    if isinstance(idx, pd.RangeIndex):
+        indice = {"tipo": "rango", "start": idx.start, "stop": idx.stop, "step": idx.step}
+    else:
+        indice = _escribir_columna(carpeta, "indice", idx.to_series(index=pd.RangeIndex(len(idx))))
+    indice["nombre"] = idx.name
+    columnas = []
+    for i, nombre in enumerate(df.columns):
+        meta = _escribir_columna(carpeta, f"c{i}", df.iloc[:, i])
+        meta["nombre"] = nombre
+        columnas.append(meta)
+    return {"filas": len(df), "indice": indice, "columnas": columnas}
+
+
+def _escalar(v):
+    if isinstance(v, np.generic):
+        return v.item()
+    if isinstance(v, (list, tuple)):
+        return [_escalar(x) for x in v]
+    return v
+
+
+def publicar(datos: dict, directorio: str = DIR_DEFECTO) -> str:
+    """Escribe los DataFrame y escalares (números, textos y listas de ellos) de datos.
+
+    La versión nueva se escribe entera en su carpeta y solo al final se apunta
+    actual.json a ella (os.replace), así un worker nunca ve una versión a medias.
+    Devuelve el nombre de la versión publicada.
+    """
+    version = f"v{time.time_ns()}"
+    carpeta = os.path.join(directorio, version)
+    os.makedirs(carpeta)
+    manifest = {"version": version, "creado": time.time(), "frames": {}, "escalares": {}}
+    try:
+        for nombre, obj in datos.items():
+            if isinstance(obj, pd.DataFrame):
+                manifest["frames"][nombre] = _escribir_frame(os.path.join(carpeta, nombre), obj)
+            elif isinstance(obj, _ESCALARES) or (isinstance(obj, (list, tuple))
+                                                 and all(isinstance(x, _ESCALARES) for x in obj)):
+                manifest["escalares"][nombre] = _escalar(obj)
+            else:
+                raise TypeError(f"{nombre}: tipo no publicable {type(obj).__name__}")
+        with open(os.path.join(carpeta, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+    except Exception:
+        shutil.rmtree(carpeta, ignore_errors=True)
+        raise
+
+    tmp = os.path.join(directorio, f".actual.{os.getpid()}.json")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": version}, f)
+    os.replace(tmp, os.path.join(directorio, "actual.json"))
+
+    antiguas = sorted(d for d in os.listdir(directorio) if d.startswith("v") and d != version)
+    for d in antiguas[:max(0, len(antiguas) - VERSIONES_CONSERVADAS + 1)]:
+        shutil.rmtree(os.path.join(directorio, d), ignore_errors=True)
+    return version
+
+
+# -------------------------------------------------------------
+# LECTURA (workers)
+# -------------------------------------------------------------
+def version_actual(directorio: str = DIR_DEFECTO):
+    """Versión publicada en directorio, o None si no hay ninguna."""
+    try:
+        with open(os.path.join(directorio, "actual.json"), encoding="utf-8") as f:
+            return json.load(f)["version"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def existe(directorio: str = DIR_DEFECTO) -> bool:
+    return version_actual(directorio) is not None
+
+
+def _mmap(carpeta: str, archivo: str) -> np.ndarray:
+    # mmap "c": páginas compartidas mientras nadie escriba; una escritura in-place
+    # (p. ej. df.loc[...] = x) copia solo esa página en privado y no toca el fichero.
+    # Vista ndarray normal (no np.memmap) para que pandas/numpy no arrastren la subclase.
+    return np.load(os.path.join(carpeta, archivo), mmap_mode="c").view(np.ndarray)
+
+
+def _leer_columna(carpeta: str, meta: dict):
+    datos = _mmap(carpeta, meta["datos"])
+    tipo = meta["tipo"]
+    if tipo == "num":
+        return datos
+    if tipo == "fecha":
+        return pd.DatetimeIndex(datos, copy=False).tz_localize("UTC").tz_convert(meta["tz"]).array
+    if tipo == "enmascarada":
+        mascara = _mmap(carpeta, meta["mascara"])
+        return pd.api.types.pandas_dtype(meta["dtype"]).construct_array_type()(datos, mascara, copy=False)
+    with open(os.path.join(carpeta, meta["categorias"]), "rb") as f:
+        categorias = pickle.load(f)
+    dtype = pd.CategoricalDtype(categorias, ordered=meta["ordenada"])
+    return pd.Categorical.from_codes(datos, dtype=dtype, validate=False)
+
+
+def _leer_frame(carpeta: str, meta: dict) -> pd.DataFrame:
+    ind = meta["indice"]
+    if ind["tipo"] == "rango":
+        indice = pd.RangeIndex(ind["start"], ind["stop"], ind["step"], name=ind["nombre"])
+    else:
+        indice = pd.Index(_leer_columna(carpeta, ind), name=ind["nombre"], copy=False)
+    arrays = {i: pd.Series(_leer_columna(carpeta, c), index=indice, copy=False)
+              for i, c in enumerate(meta["columnas"])}
+    df = pd.DataFrame(arrays, index=indice, copy=False)
+    df.columns = [c["nombre"] for c in meta["columnas"]]
+    return df
+
+
+def adjuntar(directorio: str = DIR_DEFECTO) -> dict:
+    """Frames (respaldados por mmap, sin copia) y escalares de la versión publicada.
+
+    Las columnas de texto vuelven como categóricas (códigos compartidos); las
+    numéricas y fechas como arrays sobre el fichero mapeado.
+    """
+    version = version_actual(directorio)
+    if version is None:
+        raise FileNotFoundError(f"no hay datos publicados en {directorio}")
+    carpeta = os.path.join(directorio, version)
+    with open(os.path.join(carpeta, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    datos = dict(manifest["escalares"])
+    for nombre, meta in manifest["frames"].items():
+        datos[nombre] = _leer_frame(os.path.join(carpeta, nombre), meta)
+    return datos
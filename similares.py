@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+# similares.py
+# Búsqueda de sesiones parecidas: cada sesión es un vector de longitud fija con su
+# cambio desde el open de las 09:30 (%) en los slots de 15 min [desde, hasta),
+# premarket incluido. Los vectores se centran y se normalizan (norma 1), así que el
+# producto escalar es la correlación de Pearson entre formas. El índice es una
+# matriz float32 contigua (sesiones × slots): una búsqueda es un producto
+# matriz-vector y un argpartition, exacto y en milisegundos con cientos de miles de
+# sesiones, sin índice aproximado que mantener.
+#
+#   idx = para_snapshot(s, hasta="10:00")
+#   vecinos = idx.buscar_sesion("ABCD", "2024-03-05", k=20)   # ticker, date, similitud
+#   idx.curvas(vecinos)                                       # lo que pasó después
+#   idx.buscar(idx.vector_de_velas(velas_de_hoy), k=20)       # gapper nuevo (velas 15 min)
+#
+# Las velas vienen de backtest.Barras (arrays sesión × slot del snapshot).
+import threading
+
+import numpy as np
+import pandas as pd
+
+import session_keys as sk
+from backtest import Barras, slot, hora, SLOTS, APERTURA, para_snapshot as barras_snapshot
+
+DESDE, HASTA = "04:00", "10:00"  # ventana por defecto: premarket + primeros 30 min
+
+
+def _cambio_desde_open(b: Barras) -> np.ndarray:
+    """Cierre de cada slot como % sobre el open de las 09:30 (huecos rellenados con el último cierre)."""
+    ref = b.open[:, slot(APERTURA)]
+    cierre = pd.DataFrame(b.close).ffill(axis=1).to_numpy()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        c = (cierre - ref[:, None]) / ref[:, None] * 100
+    c[~np.isfinite(c)] = np.nan
+    return c
+
+
+def _normalizar(m: np.ndarray) -> tuple:
+    """Vectores centrados y de norma 1 (float32) y máscara de filas válidas.
+
+    Los huecos iniciales (sin premarket) toman el primer valor conocido: tramo plano.
+    """
+    m = pd.DataFrame(m).bfill(axis=1).to_numpy(dtype=np.float64)
+    valida = ~np.isnan(m).any(axis=1)
+    m = np.where(valida[:, None], m, 0.0)
+    m = m - m.mean(axis=1, keepdims=True)
+    norma = np.linalg.norm(m, axis=1)
+    valida &= norma > 0
+    m = np.divide(m, norma[:, None], out=np.zeros_like(m), where=valida[:, None])
+    return np.ascontiguousarray(m, dtype=np.float32), valida
+
+
+class Similares:
+    """vectores[i] = forma normalizada de la sesión claves[i] en [desde, hasta); cambio = curva completa (%)."""
+
+    def __init__(self, claves, vectores, cambio, desde: str, hasta: str):
+        self.claves = claves
+        self.vectores = vectores
+        self.cambio = cambio
+        self.desde, self.hasta = desde, hasta
+
+    def __len__(self) -> int:
+        return len(self.claves)
+
+    @classmethod
+    def construir(cls, b: Barras, desde: str = DESDE, hasta: str = HASTA) -> "Similares":
+        d, h = slot(desde), slot(hasta)
+        if h <= max(d, slot(APERTURA)):
+            raise ValueError(f"la ventana debe incluir la vela de las {APERTURA}: {desde}-{hasta}")
+        cambio = _cambio_desde_open(b)
+        vectores, valida = _normalizar(cambio[:, d:h])
+        return cls(b.claves[valida], vectores[valida], cambio[valida].astype(np.float32), desde, hasta)
+
+    def vector_de_velas(self, velas: pd.DataFrame) -> np.ndarray:
+        """Vector de consulta desde las velas 15 min de una sesión (mismo formato que intraday_df)."""
+        b = Barras.construir(velas)
+        if len(b) != 1:
+            raise ValueError(f"se esperaban las velas de una sesión, hay {len(b)}")
+        v, valida = _normalizar(_cambio_desde_open(b)[:, slot(self.desde):slot(self.hasta)])
+        if not valida[0]:
+            raise ValueError(f"la sesión no tiene velas suficientes entre {self.desde} y {self.hasta}")
+        return v[0]
+
+    def buscar(self, vector: np.ndarray, k: int = 20, excluir=None) -> pd.DataFrame:
+        """Las k sesiones más parecidas a vector: ticker, date, similitud (correlación), posicion."""
+        sim = self.vectores @ np.asarray(vector, dtype=np.float32)
+        if excluir is not None:
+            sim[np.isin(self.claves, np.asarray(excluir, dtype=np.int64))] = -np.inf
+        k = min(k, int(np.isfinite(sim).sum()))
+        top = np.argpartition(-sim, k - 1)[:k] if k else np.empty(0, dtype=np.int64)
+        top = top[np.argsort(-sim[top], kind="stable")]
+        out = sk.decode_keys(self.claves[top])
+        out["similitud"] = sim[top].astype(np.float64)
+        out["posicion"] = top
+        return out
+
+    def posicion(self, ticker: str, date) -> int:
+        """Fila de la sesión en el índice (KeyError si no tiene velas suficientes)."""
+        clave = sk.encode_sessions([ticker], [date])[0]
+        i = np.searchsorted(self.claves, clave)
+        if i >= len(self.claves) or self.claves[i] != clave:
+            raise KeyError(f"sesión sin velas suficientes en el índice: {ticker} {date}")
+        return int(i)
+
+    def buscar_sesion(self, ticker: str, date, k: int = 20) -> pd.DataFrame:
+        """Vecinos de una sesión del índice (sin ella misma)."""
+        i = self.posicion(ticker, date)
+        return self.buscar(self.vectores[i], k, excluir=self.claves[i:i + 1])
+
+    def curvas(self, vecinos: pd.DataFrame, desde: str = None) -> pd.DataFrame:
+        """Cambio desde el open (%) de los vecinos por hora (filas) desde `desde` (por defecto el final
+        de la ventana) hasta las 16:00; columnas "TICKER fecha"."""
+        d = max(slot(desde or self.hasta) - 1, 0)
+        m = self.cambio[vecinos["posicion"].to_numpy()][:, d:SLOTS - 1].T
+        columnas = vecinos["ticker"] + " " + vecinos["date"].astype(str)
+        # El valor de cada slot es el cierre de su vela: se etiqueta con la hora a la que termina
+        return pd.DataFrame(m, index=pd.Index([hora(i + 1) for i in range(d, SLOTS - 1)], name="hora"),
+                            columns=list(columnas))
+
+
+# -------------------------------------------------------------
+# Índice del snapshot (por versión y ventana; se conservan las dos últimas versiones)
+# -------------------------------------------------------------
+_cache_lock = threading.Lock()
+_por_version = {}
+
+
+def para_snapshot(s, desde: str = DESDE, hasta: str = HASTA) -> Similares:
+    with _cache_lock:
+        idx = _por_version.get((s.version, desde, hasta))
+        if idx is None:
+            idx = _por_version[(s.version, desde, hasta)] = Similares.construir(barras_snapshot(s), desde, hasta)
+            viejas = sorted({v for v, _, _ in _por_version})[:-2]
+            for clave in [c for c in _por_version if c[0] in viejas]:
+                _por_version.pop(clave)
+        return idx
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+# sql_backend.py
+# Backend SQL embebido para cortes ad-hoc del universo de gaps sin escribir un
+# pipeline de pandas nuevo por pregunta. Tablas:
+#
+#   stocks   todas las sesiones diarias (con Period / Month)
+#   gaps     las que pasan filtrar_smallcaps (= stocks_filtrados)
+#   bars     velas intradía (formato data_15min.csv / BarStore)
+#
+# Usa DuckDB si está instalado (columnar: group-bys de millones de filas en ms y
+# lectura directa de los CSV sin pasar por pandas); si no, sqlite3 de la
+# biblioteca estándar con índices por (Period, Month) y (ticker, date).
+#
+#   db = sql_backend.para_snapshot(modulo.snapshot())
+#   db.consultar("closered_precio_hora_pmh", desde="2024-01-01")
+#   db.agrupar("gaps", ["Period", "Month"], {"Open Gap %": "avg", "*": "count"})
+#
+#   python sql_backend.py --stocks data_completa.csv --bars data/15m "SELECT ..."
+#
+import os
+import re
+import csv
+import sys
+import sqlite3
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+
+import perf_metrics as perf
+
+try:
+    import duckdb
+except ImportError:  # opcional: sin DuckDB se usa sqlite3
+    duckdb = None
+
+# Columnas de texto que no deben tiparse como fecha/hora al leer CSV (se comparan como 'YYYY-MM-DD' / 'HH:MM')
+_COLUMNAS_TEXTO = ("Date", "date", "Ticker", "ticker", "bar_time_local", "datetime_utc", "Madrid Time",
+                   "PM High Time", "HOD Time", "LOD Time")
+
+# Mismo criterio que modulo.filtrar_smallcaps (+ la sesión errónea QNGY 2022-02-18)
+FILTRO_SMALLCAPS = """
+    "Date" >= '2022-01-01' AND "Date" <= '2025-11-30'
+    AND "RTH Range %" > 0.1
+    AND "Open Price" < 12
+    AND "Premarket Volume" > 1000000
+    AND "Open Gap %" > 0.5 AND "Open Gap %" < 8
+    AND "Previous Day Close Price" > 0.1
+    AND NOT ("Date" = '2022-02-18' AND "Ticker" = 'QNGY')
+"""
+
+
+# -------------------------------------------------------------
+# CONSULTAS PREPARADAS (parámetros :nombre; mismas métricas que modulo.calcular_monthly_*)
+# -------------------------------------------------------------
+def _case_bins(col: str, bins: list, labels: list) -> str:
+    """CASE equivalente a pd.cut(col, bins, labels) (intervalos (a, b])."""
+    casos = " ".join(f"WHEN {col} > {a} AND {col} <= {b} THEN '{l}'" for a, b, l in zip(bins[:-1], bins[1:], labels))
+    return f"CASE {casos} END"
+
+
+def _mensual(expr: str, alias: str) -> str:
+    return (f'SELECT "Period", "Month", {expr} AS "{alias}" FROM gaps '
+            f'WHERE "Date" >= :desde AND "Date" <= :hasta '
+            f'GROUP BY "Period", "Month" ORDER BY "Period", "Month"')
+
+
+_PRECIO_BINS = [0, 1, 2, 3, 5, 8, 12]
+_PRECIO_LABELS = ["0-1", "1-2", "2-3", "3-5", "5-8", "8-12"]
+_CLOSE_RED = 'AVG(CASE WHEN "Day Return %" < 0 THEN 1.0 ELSE 0.0 END) * 100'
+
+CONSULTAS = {
+    "monthly_counts": _mensual("COUNT(*)", "Stocks"),
+    "monthly_volume": _mensual('SUM("EOD Volume")', "EOD Volume"),
+    "monthly_gap_open": _mensual('AVG("Open Gap %") * 100', "Gap (%)"),
+    "monthly_highspike": _mensual('AVG("High Spike %") * 100', "High Spike (%)"),
+    "monthly_lowspike": _mensual('AVG("Low Spike %") * 100', "Low Spike (%)"),
+    "monthly_range": _mensual('AVG("RTH Range %") * 100', "Range (%)"),
+    "monthly_closered": _mensual(_CLOSE_RED, "Close Red (%)"),
+    "monthly_pmh_gap": _mensual('AVG("PMH Gap %") * 100', "Gap (%)"),
+    "monthly_fade": _mensual('AVG("PMH Fade to Open %") * 100', "Fade (%)"),
+    "monthly_pmv": _mensual('SUM("Premarket Volume")', "PMH_Volume_Total"),
+    "monthly_rth_fade": _mensual('AVG("RTH Fade to Close %") * 100', "Fade (%)"),
+    "monthly_return": _mensual('AVG("Day Return %") * 100', "Return (%)"),
+    # Close red por tramo de precio de apertura y hora del máximo del premarket
+    "closered_precio_hora_pmh": f"""
+        SELECT {_case_bins('"Open Price"', _PRECIO_BINS, _PRECIO_LABELS)} AS "Precio",
+               CAST(substr("PM High Time", 1, 2) AS INTEGER) AS "Hora PMH",
+               COUNT(*) AS "Gaps", {_CLOSE_RED} AS "Close Red (%)"
+        FROM gaps
+        WHERE "Date" >= :desde AND "Date" <= :hasta AND "PM High Time" IS NOT NULL
+        GROUP BY 1, 2 ORDER BY 1, 2""",
+    # Cambio medio desde la apertura 09:30 por año, mes y vela (curvas de grafico_intradia)
+    "intradia_desde_apertura": """
+        WITH b AS (
+            SELECT ticker, date, substr(bar_time_local, 1, 5) AS hora, open
+            FROM bars WHERE date >= :desde AND date <= :hasta
+        ), o AS (
+            SELECT ticker, date, open AS open_0930 FROM b WHERE hora = '09:30'
+        )
+        SELECT CAST(substr(b.date, 1, 4) AS INTEGER) AS year, CAST(substr(b.date, 6, 2) AS INTEGER) AS month,
+               b.hora AS bar_time_local, AVG((b.open - o.open_0930) / o.open_0930 * 100) AS chg_from_open_pct
+        FROM b
+        JOIN o ON o.ticker = b.ticker AND o.date = b.date
+        JOIN gaps g ON g."Ticker" = b.ticker AND g."Date" = b.date
+        WHERE b.hora >= '09:30' AND b.hora <= '16:00' AND o.open_0930 > 0
+        GROUP BY 1, 2, 3 ORDER BY 1, 2, 3""",
+}
+PARAMS_DEFECTO = {"desde": "0000-01-01", "hasta": "9999-12-31"}
+
+# Funciones permitidas en agrupar()
+AGREGADOS = {
+    "count": "COUNT({c})", "sum": "SUM({c})", "avg": "AVG({c})", "min": "MIN({c})", "max": "MAX({c})",
+    "pct_neg": "AVG(CASE WHEN {c} < 0 THEN 1.0 ELSE 0.0 END) * 100",
+}
+OPERADORES = ("=", "!=", "<", "<=", ">", ">=")
+
+
+def _id(nombre: str) -> str:
+    """Identificador SQL entrecomillado (columnas con espacios y %)."""
+    return '"' + str(nombre).replace('"', '""') + '"'
+
+
+# -------------------------------------------------------------
+# BACKEND
+# -------------------------------------------------------------
+class BackendSQL:
+    def __init__(self, ruta: str = ":memory:", motor: str = None):
+        self.motor = motor or ("duckdb" if duckdb is not None else "sqlite")
+        if self.motor == "duckdb":
+            if duckdb is None:
+                raise ImportError("motor='duckdb' requiere el paquete duckdb")
+            self._con = duckdb.connect(ruta)
+        else:
+            self._con = sqlite3.connect(ruta, check_same_thread=False)
+        # Una conexión compartida entre hilos (Streamlit / Dash): consultas serializadas
+        self._lock = threading.Lock()
+
+    # --------------------------
+    # Carga
+    # --------------------------
+    @staticmethod
+    def _normalizar(df: pd.DataFrame) -> pd.DataFrame:
+        """Tipos que ambos motores entienden: fechas como 'YYYY-MM-DD', categóricas como texto."""
+        df = df.reset_index(drop=True)
+        out = {}
+        for col in df.columns:
+            s = df[col]
+            if pd.api.types.is_datetime64_any_dtype(s):
+                fmt = "%Y-%m-%d" if (s.dropna().dt.normalize() == s.dropna()).all() else "%Y-%m-%d %H:%M:%S"
+                s = s.dt.strftime(fmt)
+            elif isinstance(s.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(s):
+                s = s.astype(object).where(s.notna(), None)
+            elif pd.api.types.is_bool_dtype(s):
+                s = s.astype("int8")
+            elif isinstance(s.dtype, pd.api.extensions.ExtensionDtype):
+                s = s.astype("float64")
+            out[col] = s
+        return pd.DataFrame(out)
+
+    def cargar_df(self, tabla: str, df: pd.DataFrame):
+        df = self._normalizar(df)
+        with self._lock, perf.medir(f"sql cargar {tabla}", tipo="sql") as m:
+            if self.motor == "duckdb":
+                self._con.register("_df_carga", df)
+                self._con.execute(f"CREATE OR REPLACE TABLE {_id(tabla)} AS SELECT * FROM _df_carga")
+                self._con.unregister("_df_carga")
+            else:
+                df.to_sql(tabla, self._con, if_exists="replace", index=False, chunksize=50_000)
+            m["filas"] = len(df)
+        return self
+
+    def cargar_csv(self, tabla: str, rutas, chunk: int = 200_000):
+        """Carga uno o varios CSV con la misma cabecera (p. ej. las part-*.csv de un BarStore)."""
+        rutas = [rutas] if isinstance(rutas, str) else list(rutas)
+        if not rutas:
+            raise ValueError(f"{tabla}: no hay CSV que cargar")
+        with open(rutas[0], newline="", encoding="utf-8") as f:
+            cabecera = next(csv.reader(f))
+        texto = [c for c in cabecera if c in _COLUMNAS_TEXTO]
+        with self._lock, perf.medir(f"sql cargar {tabla}", tipo="sql"):
+            if self.motor == "duckdb":
+                # DuckDB lee y tipa los CSV él mismo (en paralelo, sin DataFrame intermedio)
+                lista = "[" + ", ".join("'" + r.replace("'", "''") + "'" for r in rutas) + "]"
+                tipos = "{" + ", ".join(f"'{c}': 'VARCHAR'" for c in texto) + "}"
+                self._con.execute(f"CREATE OR REPLACE TABLE {_id(tabla)} AS "
+                                  f"SELECT * FROM read_csv_auto({lista}, header=true, types={tipos})")
+                return self
+            self._con.execute(f"DROP TABLE IF EXISTS {_id(tabla)}")
+            for ruta in rutas:
+                for trozo in pd.read_csv(ruta, chunksize=chunk, dtype={c: str for c in texto}):
+                    trozo.to_sql(tabla, self._con, if_exists="append", index=False)
+        return self
+
+    def derivar_tablas(self, crudo: str = "stocks_crudo"):
+        """stocks (+ Period / Month) y gaps (filtro smallcaps) a partir de la tabla crudo."""
+        with self._lock:
+            for t in ("stocks", "gaps"):
+                self._con.execute(f"DROP TABLE IF EXISTS {t}")
+            self._con.execute(f"""CREATE TABLE stocks AS SELECT *,
+                CAST(substr("Date", 1, 4) AS INTEGER) AS "Period",
+                CAST(substr("Date", 6, 2) AS INTEGER) AS "Month" FROM {_id(crudo)}""")
+            self._con.execute(f"CREATE TABLE gaps AS SELECT * FROM stocks WHERE {FILTRO_SMALLCAPS}")
+            self._con.execute(f"DROP TABLE {_id(crudo)}")
+        return self
+
+    def indexar(self):
+        """sqlite: índices para los filtros habituales (DuckDB no los necesita: zonemaps)."""
+        if self.motor == "sqlite":
+            with self._lock:
+                for tabla, cols in (("stocks", ("Period", "Month")), ("gaps", ("Period", "Month")),
+                                    ("gaps", ("Ticker", "Date")), ("bars", ("ticker", "date"))):
+                    if tabla in self.tablas():
+                        nombre = f"ix_{tabla}_{'_'.join(c.lower() for c in cols)}"
+                        self._con.execute(f"CREATE INDEX IF NOT EXISTS {nombre} ON {tabla} ({', '.join(map(_id, cols))})")
+                self._con.execute("ANALYZE")
+        return self
+
+    # --------------------------
+    # Consulta
+    # --------------------------
+    def tablas(self) -> list:
+        if self.motor == "duckdb":
+            return [r[0] for r in self._con.execute("SHOW TABLES").fetchall()]
+        return [r[0] for r in self._con.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()]
+
+    def columnas(self, tabla: str) -> list:
+        if tabla not in self.tablas():
+            raise KeyError(f"tabla desconocida: {tabla}")
+        with self._lock:
+            cur = self._con.execute(f"SELECT * FROM {_id(tabla)} LIMIT 0")
+            return [d[0] for d in cur.description]
+
+    def sql(self, consulta: str, params: dict = None, nombre: str = "ad-hoc") -> pd.DataFrame:
+        """Ejecuta SQL con parámetros :nombre (se traducen a $nombre en DuckDB)."""
+        params = dict(params or {})
+        if self.motor == "duckdb":
+            consulta = re.sub(r"(?<![:\w]):(\w+)", r"$\1", consulta)
+        with self._lock, perf.medir(f"sql {nombre}", tipo="sql") as m:
+            cur = self._con.execute(consulta, params)
+            if self.motor == "duckdb":
+                out = cur.df()
+            else:
+                out = pd.DataFrame(cur.fetchall(), columns=[d[0] for d in cur.description])
+            m["filas"] = len(out)
+        return out
+
+    def consultar(self, nombre: str, **params) -> pd.DataFrame:
+        """Consulta preparada de CONSULTAS; los parámetros que falten toman PARAMS_DEFECTO."""
+        if nombre not in CONSULTAS:
+            raise KeyError(f"consulta desconocida: {nombre} (hay: {', '.join(CONSULTAS)})")
+        usados = set(re.findall(r"(?<![:\w]):(\w+)", CONSULTAS[nombre]))
+        valores = {k: v for k, v in {**PARAMS_DEFECTO, **params}.items() if k in usados}
+        return self.sql(CONSULTAS[nombre], valores, nombre=nombre)
+
+    def agrupar(self, tabla: str, por: list, metricas: dict, donde: dict = None, orden: bool = True) -> pd.DataFrame:
+        """GROUP BY ad-hoc con columnas validadas contra la tabla y valores como parámetros.
+
+        metricas: {columna o "*": función de AGREGADOS} ("*" solo con count)
+        donde: {columna: valor} o {columna: (operador, valor)}
+        """
+        cols = set(self.columnas(tabla))
+        desconocidas = [c for c in list(por) + list(metricas) + list(donde or {}) if c != "*" and c not in cols]
+        if desconocidas:
+            raise KeyError(f"{tabla}: columnas desconocidas {desconocidas}")
+        select = [_id(c) for c in por]
+        for col, fn in metricas.items():
+            if fn not in AGREGADOS:
+                raise ValueError(f"agregado no permitido: {fn} (hay: {', '.join(AGREGADOS)})")
+            if col == "*" and fn != "count":
+                raise ValueError(f"{fn}(*) no existe: sobre \"*\" solo se permite count")
+            select.append(f"{AGREGADOS[fn].format(c='*' if col == '*' else _id(col))} AS {_id(f'{fn}({col})')}")
+        condiciones, params = [], {}
+        for i, (col, cond) in enumerate((donde or {}).items()):
+            op, valor = cond if isinstance(cond, tuple) else ("=", cond)
+            if op not in OPERADORES:
+                raise ValueError(f"operador no permitido: {op}")
+            condiciones.append(f"{_id(col)} {op} :p{i}")
+            params[f"p{i}"] = valor.item() if isinstance(valor, np.generic) else valor
+        consulta = f"SELECT {', '.join(select)} FROM {_id(tabla)}"
+        if condiciones:
+            consulta += " WHERE " + " AND ".join(condiciones)
+        if por:
+            grupos = ", ".join(_id(c) for c in por)
+            consulta += f" GROUP BY {grupos}" + (f" ORDER BY {grupos}" if orden else "")
+        return self.sql(consulta, params, nombre=f"agrupar {tabla}")
+
+    def cerrar(self):
+        self._con.close()
+
+
+# -------------------------------------------------------------
+# CONSTRUCCIÓN
+# -------------------------------------------------------------
+def desde_snapshot(s, ruta: str = ":memory:", motor: str = None) -> BackendSQL:
+    """Tablas a partir de un snapshot de modulo (mismos filtros y flags ya calculados)."""
+    db = BackendSQL(ruta, motor)
+    db.cargar_df("stocks", s.stocks_v1)
+    db.cargar_df("gaps", s.stocks_filtrados)
+    if not s.intraday_df.empty:
+        db.cargar_df("bars", s.intraday_df)
+    return db.indexar()
+
+
+def desde_csv(stocks_csv: str, bars=None, ruta: str = ":memory:", motor: str = None) -> BackendSQL:
+    """Tablas directamente de los CSV (data_completa.csv y, opcional, velas: un CSV o
+    un directorio de BarStore con part-*.csv), sin construir el snapshot de modulo."""
+    db = BackendSQL(ruta, motor)
+    db.cargar_csv("stocks_crudo", stocks_csv).derivar_tablas("stocks_crudo")
+    if bars:
+        if os.path.isdir(bars):
+            import bar_store
+            partes = bar_store.partes(bars)
+        else:
+            partes = [bars]
+        db.cargar_csv("bars", partes)
+    return db.indexar()
+
+
+_cache_lock = threading.Lock()
+_por_version = {}  # versión de snapshot -> BackendSQL
+
+
+def para_snapshot(s) -> BackendSQL:
+    """Backend del snapshot (uno por versión; se conservan la actual y la anterior)."""
+    with _cache_lock:
+        db = _por_version.get(s.version)
+        if db is None:
+            db = _por_version[s.version] = desde_snapshot(s)
+            for v in sorted(_por_version)[:-2]:
+                _por_version.pop(v).cerrar()
+        return db
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="Consultas SQL sobre el universo de gaps")
+    p.add_argument("consulta", help="SQL o nombre de una consulta preparada")
+    p.add_argument("--stocks", required=True, help="data_completa.csv")
+    p.add_argument("--bars", default=None, help="CSV de velas o directorio de BarStore (<root>/<timeframe>/<variante>)")
+    p.add_argument("--motor", choices=["duckdb", "sqlite"], default=None)
+    p.add_argument("--param", action="append", default=[], metavar="NOMBRE=VALOR")
+    args = p.parse_args(argv)
+
+    db = desde_csv(args.stocks, args.bars, motor=args.motor)
+    params = dict(kv.split("=", 1) for kv in args.param)
+    if args.consulta in CONSULTAS:
+        out = db.consultar(args.consulta, **params)
+    else:
+        out = db.sql(args.consulta, params)
+    pd.set_option("display.width", 160)
+    print(out.to_string(index=False))
+    print(f"[{db.motor}]", perf.resumen()[["nombre", "p50_ms", "filas"]].to_string(index=False), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
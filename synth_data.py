@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+# synth_data.py
+# Generador sintético (con semilla y vectorizado) de datos con los esquemas del dashboard:
+#   - data_completa.csv : una fila por gapper/día con todas las columnas que usa modulo.py
+#   - data_15min.csv / 1m : velas intradía 04:00-16:15 NY con el formato de polygon_batch
+#
+# Cada fila simula un camino de 1 minuto (premarket + RTH) y de él salen todas las
+# métricas diarias (spikes, multiframe, VWAP, HOD/LOD, PM High Time...), así las
+# correlaciones gap -> fade premarket -> fade RTH -> cierre son coherentes entre el
+# CSV diario y las velas. Se escribe por trozos (memoria plana):
+#
+#   python synth_data.py --rows 200000 --sessions 50000 --timeframe 15m --out-dir sinteticos/
+#
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+FECHA_INICIO = "2022-01-03"
+FECHA_FIN = "2025-11-28"
+
+MIN_PM = 330        # 04:00 -> 09:30
+MIN_RTH = 390       # 09:30 -> 16:00
+MIN_POST = 15       # 16:00 -> 16:15 (barra de las 16:00)
+MIN_TOTAL = MIN_PM + MIN_RTH + MIN_POST
+INICIO_MIN_DIA = 4 * 60
+
+HORIZONTES = [1, 5, 15, 30, 60, 120, 180]
+VWAP_HORIZONTES = [5, 15, 30, 60, 90, 120, 180]
+
+COLUMNAS_DIARIO = (
+    ["Date","Ticker","Previous Day Close Price","Open Price","Close Price","Open Gap %","PMH Gap %",
+     "PMH Fade to Open %","PM High Time","Premarket Volume","EOD Volume","Day Return %","High Spike %",
+     "Low Spike %","RTH Range %","RTH Fade to Close %","HOD Time","LOD Time","VWAP at Open"]
+    + [c for m in HORIZONTES for c in (f"M{m} Return %", f"M{m} High Spike %", f"M{m} Low Spike %", f"Return % From M{m} to Close")]
+    + [c for m in VWAP_HORIZONTES for c in (f"M{m} Price", f"VWAP at M{m}")]
+)
+COLUMNAS_INTRADIA = ["ticker","date","datetime_utc","Madrid Time","bar_time_local",
+                     "open","high","low","close","volume","vwap","transactions"]
+
+_HHMM = np.array([f"{m // 60:02d}:{m % 60:02d}" for m in range(1440)], dtype=object)
+_HHMMSS = np.array([f"{m // 60:02d}:{m % 60:02d}:00" for m in range(1440)], dtype=object)
+
+
+# -------------------------------------------------------------
+# UNIVERSO (ticker, date) único
+# -------------------------------------------------------------
+def _universo(n: int, rng) -> tuple:
+    dias = pd.bdate_range(FECHA_INICIO, FECHA_FIN)
+    n_tickers = max(10, n // 8)
+    celdas = rng.choice(n_tickers * len(dias), size=n, replace=False)
+    ticker_id, dia_id = celdas // len(dias), celdas % len(dias)
+    orden = np.lexsort((ticker_id, dia_id))
+    tickers = np.array([f"S{i:05d}" if n_tickers > 99_999 else f"S{i:04d}" for i in range(n_tickers)], dtype=object)
+    return tickers[ticker_id[orden]], dias[dia_id[orden]]
+
+
+# -------------------------------------------------------------
+# SIMULACIÓN DE UN TROZO
+# -------------------------------------------------------------
+def _simular(rng, n: int) -> dict:
+    """Parámetros diarios correlacionados + caminos de 1 minuto (n, MIN_TOTAL) en float32."""
+    gap = (0.15 + rng.lognormal(-1.0, 0.8, n)).astype(np.float32)           # Open Gap %
+    open_price = rng.lognormal(np.log(3.0), 0.9, n).astype(np.float32)
+    prev_close = open_price / (1 + gap)
+    extra = rng.lognormal(-1.6, 0.7, n).astype(np.float32)                   # PMH sobre el open
+    pmh = open_price * (1 + extra)
+    lg = np.log1p(gap)
+
+    # Más gap (y más subida premarket sobre el open) -> más volumen, más volatilidad y más fade
+    pm_vol = np.exp(14.0 + 0.9 * lg + rng.normal(0, 0.8, n))
+    sigma = (0.05 + 0.06 * lg) * np.where(open_price < 1, 1.5, 1.0) * rng.lognormal(0, 0.25, n)
+    drift = -0.02 - 0.12 * lg - 0.1 * np.log1p(extra) + rng.normal(0, 0.06, n)
+
+    # --- premarket: puente por (04:00, p0) -> (t_pmh, PMH) -> (09:30, open)
+    t_pmh = np.minimum((MIN_PM * rng.beta(2.5, 1.5, n)).astype(np.int64), MIN_PM - 1)
+    p0 = prev_close * (1 + gap * rng.uniform(0.1, 0.6, n).astype(np.float32))
+    t = np.arange(MIN_PM, dtype=np.float32)[None, :]
+    tp = t_pmh[:, None].astype(np.float32)
+    sube = np.log(p0)[:, None] + (np.log(pmh) - np.log(p0))[:, None] * np.minimum(t / np.maximum(tp, 1), 1)
+    baja = (np.log(open_price) - np.log(pmh))[:, None] * np.clip((t - tp) / np.maximum(MIN_PM - tp, 1), 0, 1)
+    ruido = rng.normal(0, 1, (n, MIN_PM)).astype(np.float32).cumsum(axis=1) * (0.004 * np.sqrt(1 + lg))[:, None]
+    ruido -= ruido[:, -1:] * (t / (MIN_PM - 1))                             # puente: 0 al final
+    log_pm = np.minimum(sube + baja + ruido, np.log(pmh)[:, None])
+    log_pm[np.arange(n), t_pmh] = np.log(pmh)
+
+    # --- RTH + barra de las 16:00: paseo con más volatilidad en la apertura
+    k = MIN_RTH + MIN_POST
+    perfil = 1 + 2.5 * np.exp(-np.arange(k, dtype=np.float32) / 25)
+    perfil /= np.sqrt((perfil[:MIN_RTH] ** 2).mean())
+    inc = rng.normal(0, 1, (n, k)).astype(np.float32) * (sigma / np.sqrt(MIN_RTH))[:, None] * perfil
+    inc += (drift / MIN_RTH)[:, None]
+    inc[:, MIN_RTH:] *= 0.3
+    log_rth = np.log(open_price)[:, None] + np.cumsum(inc, axis=1)
+
+    close = np.exp(np.concatenate([log_pm, log_rth], axis=1))
+    close[:, MIN_PM - 1] = open_price  # última barra PM cierra en el open
+    open_ = np.concatenate([p0[:, None], close[:, :-1]], axis=1)
+    open_[:, MIN_PM] = open_price
+    mecha = np.abs(rng.normal(0, 1, (n, MIN_TOTAL))).astype(np.float32) * 0.002
+    high = np.maximum(open_, close) * (1 + mecha)
+    low = np.minimum(open_, close) * (1 - mecha[:, ::-1])
+    high[:, :MIN_PM] = np.minimum(high[:, :MIN_PM], pmh[:, None])
+    high[np.arange(n), t_pmh] = pmh
+
+    # Volumen: reparto del premarket + curva en U en RTH
+    w_pm = rng.gamma(2.0, 1.0, (n, MIN_PM)).astype(np.float32)
+    w_pm *= 1 + 3 * np.exp(-np.abs(np.arange(MIN_PM) - tp) / 20)
+    vol_pm = w_pm / w_pm.sum(axis=1, keepdims=True) * pm_vol[:, None]
+    rth_vol = pm_vol * np.exp(1.2 + rng.normal(0, 0.5, n))
+    u = 1 + 4 * np.exp(-np.arange(k) / 20) + 1.5 * np.exp(-(MIN_RTH - np.arange(k)) / 15)
+    w_rth = rng.gamma(2.0, 1.0, (n, k)).astype(np.float32) * u
+    vol_rth = w_rth / w_rth[:, :MIN_RTH].sum(axis=1, keepdims=True) * rth_vol[:, None]
+    volume = np.concatenate([vol_pm, vol_rth], axis=1).round()
+
+    return {
+        "gap": gap, "open_price": open_price, "prev_close": prev_close, "pmh": pmh, "t_pmh": t_pmh,
+        "pm_vol": pm_vol.round(), "open": open_, "high": high, "low": low, "close": close, "volume": volume,
+    }
+
+
+def _diario(sim: dict, tickers, fechas) -> pd.DataFrame:
+    """Métricas de data_completa.csv derivadas de los caminos simulados."""
+    n = len(tickers)
+    o = sim["open_price"].astype(np.float64)
+    rth = slice(MIN_PM, MIN_PM + MIN_RTH)
+    hi, lo, cl, vol = sim["high"][:, rth], sim["low"][:, rth], sim["close"][:, rth], sim["volume"][:, rth]
+    tp = (hi + lo + cl) / 3
+    vwap_rth = np.cumsum(tp * vol, axis=1) / np.maximum(np.cumsum(vol, axis=1), 1)
+    pm = slice(0, MIN_PM)
+    tp_pm = (sim["high"][:, pm] + sim["low"][:, pm] + sim["close"][:, pm]) / 3
+    vwap_open = (tp_pm * sim["volume"][:, pm]).sum(axis=1) / np.maximum(sim["volume"][:, pm].sum(axis=1), 1)
+
+    run_hi = np.maximum.accumulate(hi, axis=1)
+    run_lo = np.minimum.accumulate(lo, axis=1)
+    hod = hi.argmax(axis=1)
+    lod = lo.argmin(axis=1)
+    cierre = cl[:, -1].astype(np.float64)
+    pmh = sim["pmh"].astype(np.float64)
+
+    df = pd.DataFrame({
+        "Date": fechas.strftime("%Y-%m-%d"),
+        "Ticker": tickers,
+        "Previous Day Close Price": sim["prev_close"].astype(np.float64).round(4),
+        "Open Price": o.round(4),
+        "Close Price": cierre.round(4),
+        "Open Gap %": (o / sim["prev_close"] - 1).round(6),
+        "PMH Gap %": (pmh / sim["prev_close"] - 1).round(6),
+        "PMH Fade to Open %": (o / pmh - 1).round(6),
+        "PM High Time": _HHMM[INICIO_MIN_DIA + sim["t_pmh"]],
+        "Premarket Volume": sim["pm_vol"].astype(np.int64),
+        "EOD Volume": (sim["pm_vol"] + vol.sum(axis=1)).astype(np.int64),
+        "Day Return %": (cierre / o - 1).round(6),
+        "High Spike %": (run_hi[:, -1] / o - 1).round(6),
+        "Low Spike %": (run_lo[:, -1] / o - 1).round(6),
+        "RTH Range %": ((run_hi[:, -1] - run_lo[:, -1]) / o).round(6),
+        "RTH Fade to Close %": (cierre / run_hi[:, -1] - 1).round(6),
+        "HOD Time": _HHMM[570 + hod],
+        "LOD Time": _HHMM[570 + lod],
+        "VWAP at Open": vwap_open.round(4),
+    })
+    for m in HORIZONTES:
+        pm_ = cl[:, m - 1].astype(np.float64)
+        df[f"M{m} Return %"] = (pm_ / o - 1).round(6)
+        df[f"M{m} High Spike %"] = (run_hi[:, m - 1] / o - 1).round(6)
+        df[f"M{m} Low Spike %"] = (run_lo[:, m - 1] / o - 1).round(6)
+        df[f"Return % From M{m} to Close"] = (cierre / pm_ - 1).round(6)
+    for m in VWAP_HORIZONTES:
+        df[f"M{m} Price"] = cl[:, m - 1].astype(np.float64).round(4)
+        df[f"VWAP at M{m}"] = vwap_rth[:, m - 1].astype(np.float64).round(4)
+    return df[COLUMNAS_DIARIO]
+
+
+def _offsets_min(fechas: pd.DatetimeIndex, tz: str) -> np.ndarray:
+    ref = (fechas + pd.Timedelta(hours=12)).tz_localize("UTC")
+    return np.asarray((ref.tz_convert(tz).tz_localize(None) - ref.tz_localize(None)) // pd.Timedelta(minutes=1))
+
+
+def _intradia(sim: dict, filas: np.ndarray, tickers, fechas, minutos_barra: int) -> pd.DataFrame:
+    """Velas (formato polygon_batch.format_output) de las filas elegidas, agregadas a minutos_barra."""
+    n, k = len(filas), MIN_TOTAL // minutos_barra
+    g = lambda a: a[filas].reshape(n, k, minutos_barra)
+    o, h, l, c, v = g(sim["open"])[:, :, 0], g(sim["high"]).max(axis=2), g(sim["low"]).min(axis=2), g(sim["close"])[:, :, -1], g(sim["volume"])
+    tp = (g(sim["high"]) + g(sim["low"]) + g(sim["close"])) / 3
+    vs = v.sum(axis=2)
+    vwap = (tp * v).sum(axis=2) / np.maximum(vs, 1)
+
+    f = fechas[filas]
+    local = INICIO_MIN_DIA + np.arange(k) * minutos_barra
+    off_ny = _offsets_min(f, "America/New_York")
+    off_mad = _offsets_min(f, "Europe/Madrid")
+    utc = (local[None, :] - off_ny[:, None]) % 1440
+    madrid = (utc + off_mad[:, None]) % 1440
+    return pd.DataFrame({
+        "ticker": np.repeat(tickers[filas], k),
+        "date": np.repeat(f.strftime("%Y-%m-%d"), k),
+        "datetime_utc": _HHMMSS[utc.ravel()],
+        "Madrid Time": _HHMMSS[madrid.ravel()],
+        "bar_time_local": np.tile(_HHMMSS[local], n),
+        "open": o.ravel().astype(np.float64).round(4),
+        "high": h.ravel().astype(np.float64).round(4),
+        "low": l.ravel().astype(np.float64).round(4),
+        "close": c.ravel().astype(np.float64).round(4),
+        "volume": vs.ravel().astype(np.int64),
+        "vwap": vwap.ravel().astype(np.float64).round(4),
+        "transactions": np.maximum(vs.ravel() // 150, 1).astype(np.int64),
+    })[COLUMNAS_INTRADIA]
+
+
+# -------------------------------------------------------------
+# API
+# -------------------------------------------------------------
+CHUNK_FILAS = 5_000
+
+
+def _plan(n_filas: int, n_sesiones: int, seed: int, chunk: int) -> list:
+    """Trozos independientes (cada uno con su semilla hija): el resultado no depende de workers."""
+    hijos = np.random.SeedSequence(seed).spawn(1 + -(-n_filas // chunk))
+    rng = np.random.default_rng(hijos[0])
+    tickers, fechas = _universo(n_filas, rng)
+    con_velas = np.zeros(n_filas, dtype=bool)
+    con_velas[rng.choice(n_filas, size=min(n_sesiones, n_filas), replace=False)] = True
+    return [
+        (hijos[1 + j], tickers[i:i + chunk], fechas[i:i + chunk], con_velas[i:i + chunk])
+        for j, i in enumerate(range(0, n_filas, chunk))
+    ]
+
+
+def _trozo(ss, tickers, fechas, con_velas, minutos_barra: int) -> tuple:
+    sim = _simular(np.random.default_rng(ss), len(tickers))
+    diario = _diario(sim, tickers, fechas)
+    filas = np.flatnonzero(con_velas)
+    intradia = _intradia(sim, filas, tickers, fechas, minutos_barra) if len(filas) else None
+    return diario, intradia
+
+
+def _trozo_csv(args) -> tuple:
+    """Para el pool: devuelve el trozo ya serializado (formatear floats es lo caro)."""
+    *trozo, minutos_barra = args
+    diario, intradia = _trozo(*trozo, minutos_barra)
+    velas = "" if intradia is None else intradia.to_csv(index=False, header=False)
+    return diario.to_csv(index=False, header=False), velas, 0 if intradia is None else len(intradia)
+
+
+def generar(n_filas: int, n_sesiones: int = 0, minutos_barra: int = 15, seed: int = 0, chunk: int = CHUNK_FILAS):
+    """Genera por trozos: yield (diario_chunk, intradia_chunk) con memoria acotada por chunk."""
+    for trozo in _plan(n_filas, n_sesiones, seed, chunk):
+        yield _trozo(*trozo, minutos_barra)
+
+
+def generar_diario(n_filas: int, seed: int = 0) -> pd.DataFrame:
+    return pd.concat([d for d, _ in generar(n_filas, 0, seed=seed)], ignore_index=True)
+
+
+def escribir(out_dir: str, n_filas: int, n_sesiones: int = 0, timeframe: str = "15m", seed: int = 0,
+             nombre_diario: str = "data_completa.csv", nombre_intradia: str = None, workers: int = 1) -> tuple:
+    """Escribe los CSV en streaming (trozos en paralelo con workers > 1, en orden).
+
+    Devuelve (ruta_diario, ruta_intradia, n_velas).
+    """
+    minutos_barra = int(timeframe.rstrip("m"))
+    if MIN_TOTAL % minutos_barra:
+        raise ValueError(f"timeframe {timeframe} no divide {MIN_TOTAL} minutos")
+    os.makedirs(out_dir, exist_ok=True)
+    p_diario = os.path.join(out_dir, nombre_diario)
+    p_intradia = os.path.join(out_dir, nombre_intradia or f"data_{timeframe.replace('m', 'min')}.csv")
+
+    tareas = [(*t, minutos_barra) for t in _plan(n_filas, n_sesiones, seed, CHUNK_FILAS)]
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    trozos = pool.map(_trozo_csv, tareas) if pool else map(_trozo_csv, tareas)
+    n_velas = 0
+    try:
+        with open(p_diario, "w", newline="", encoding="utf-8") as fd, open(p_intradia, "w", newline="", encoding="utf-8") as fi:
+            fd.write(",".join(COLUMNAS_DIARIO) + "\n")
+            fi.write(",".join(COLUMNAS_INTRADIA) + "\n")
+            for csv_diario, csv_velas, n in trozos:
+                fd.write(csv_diario)
+                fi.write(csv_velas)
+                n_velas += n
+    finally:
+        if pool:
+            pool.shutdown()
+    return p_diario, p_intradia, n_velas
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="Genera data_completa / velas intradía sintéticas")
+    p.add_argument("--rows", type=int, default=20_000, help="filas diarias (gappers)")
+    p.add_argument("--sessions", type=int, default=3_000, help="sesiones con velas intradía")
+    p.add_argument("--timeframe", default="15m", help="1m, 5m, 15m...")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out-dir", default="sinteticos")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="procesos para generar/serializar")
+    args = p.parse_args(argv)
+
+    t0 = time.perf_counter()
+    p_diario, p_intradia, n_velas = escribir(
+        args.out_dir, args.rows, args.sessions, args.timeframe, args.seed, workers=args.workers
+    )
+    print(f"{args.rows} filas -> {p_diario}\n{n_velas} velas {args.timeframe} -> {p_intradia}\n"
+          f"{time.perf_counter() - t0:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
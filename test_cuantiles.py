@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# test_cuantiles.py
+#   python -m pytest -q test_cuantiles.py
+import numpy as np
+import pytest
+
+import cubo
+import cuantiles
+import synth_data
+
+QS = np.array([0.0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1.0])
+
+
+def _dentro_de_cota(estimado, x, qs):
+    # La garantía es sobre el estadístico de orden x_(floor(q (n - 1))): np.quantile(method="lower")
+    exacto = np.quantile(x, qs, method="lower")
+    cota = cuantiles.ALPHA * np.abs(exacto) * (1 + 1e-12) + np.where(np.abs(exacto) < cuantiles.MINIMO, cuantiles.MINIMO, 0)
+    return np.abs(np.asarray(estimado) - exacto) <= cota
+
+
+@pytest.mark.parametrize("nombre", ["retornos", "lognormal", "minutos", "con_ceros", "pocos"])
+def test_cuantil_de_union_de_celdas(nombre):
+    rng = np.random.default_rng(0)
+    x = {
+        "retornos": rng.normal(-0.1, 0.3, 20_000) * 100,
+        "lognormal": rng.lognormal(0, 2, 20_000),
+        "minutos": rng.integers(0, 390, 20_000).astype(float),
+        "con_ceros": np.r_[np.zeros(500), rng.exponential(5, 5_000), -rng.exponential(5, 5_000)],
+        "pocos": rng.normal(0, 1, 7),
+    }[nombre]
+    celda = rng.integers(0, 50, len(x))
+    t = cuantiles.tabla(celda, {nombre: x})
+    # Unión de celdas no contiguas: fusionar sketches no añade error
+    elegidas = rng.permutation(50)[:20]
+    union = np.isin(celda, elegidas)
+    est = cuantiles.cuantil(t[t["celda"].isin(elegidas)], QS)
+    assert _dentro_de_cota(est, x[union], QS).all()
+
+
+@pytest.fixture(scope="module")
+def gaps():
+    df = synth_data.generar_diario(20_000, seed=1)
+    return df, cubo.Cubo.construir(df), cubo.codigos_dims(df)
+
+
+@pytest.mark.parametrize("filtro", [
+    None,
+    {"year": [2023, 2024]},
+    {"gap": ["0% - 40%", "60% - 80%"], "precio": ["1 - 3 $ ", "3 - 5 $ "]},
+])
+@pytest.mark.parametrize("metrica", ["return", "gap", "hod"])
+def test_cubo_cuantil_contra_filas(gaps, metrica, filtro):
+    df, c, dims = gaps
+    x = cubo._numerico(df, cubo.CUANTILES[metrica])
+    filas = cubo.mascara(dims, filtro) & ~np.isnan(x)
+    assert filas.sum() > 0
+    est = c.cuantil(metrica, QS, filtro)
+    assert _dentro_de_cota(est, x[filas], QS).all()
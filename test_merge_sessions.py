@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+# test_merge_sessions.py
+#   python -m pytest -q test_merge_sessions.py
+import io
+
+import merge_sessions
+
+
+def test_ticker_na_no_se_pierde():
+    # "NA" (y "NULL", "N/A"...) son tickers reales: solo se descartan fecha o ticker vacíos
+    csv = io.StringIO("date,ticker\n2025-06-24,NA\n2025-06-24,ABCD\n2025-06-25,NULL\n,EFGH\n2025-06-26,\n")
+    out = merge_sessions.merge_session_files([csv])
+    assert list(out["ticker"]) == ["ABCD", "NA", "NULL"]
+    assert int(out["rows"].sum()) == 3
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# test_session_index.py
+#   python -m pytest -q test_session_index.py
+import pandas as pd
+
+import session_index
+
+
+def _indice(tmp_path):
+    lista = tmp_path / "lista.csv"
+    lista.write_text("Date,Ticker,Open Gap %,PMH Gap %\n2025-06-24,NA,0.5,0.6\n2025-06-24,ABCD,0.4,\n")
+    return session_index.SessionIndex({"open_gap": str(lista)})
+
+
+def test_ticker_na_se_indexa(tmp_path):
+    idx = _indice(tmp_path)
+    assert len(idx) == 2
+    assert idx.contains("NA", "2025-06-24")
+
+
+def test_annotate_no_falla_con_tickers_no_codificables(tmp_path):
+    # Tickers largos o con caracteres raros no caben en la clave: cuentan como fuera de las listas
+    df = pd.DataFrame({
+        "Ticker": ["TOOLONGTICK", "ÄBC", "ABCD", None],
+        "Date": ["2025-06-24", "2025-06-24", "2025-06-24", "2025-06-24"],
+    })
+    out = _indice(tmp_path).annotate(df)
+    assert out["in_open_gap"].tolist() == [False, False, True, False]
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# ticker_index.py
+# Índice por ticker de un DataFrame: los códigos categóricos (pd.factorize con
+# los tickers ordenados) dan una permutación estable que agrupa las filas de cada
+# ticker y un array de offsets. Las filas de un ticker son
+#     orden[inicio[i]:inicio[i + 1]]
+# (en el orden original del frame), así que sacar su historial cuesta
+# O(log tickers + filas del ticker) en vez de comparar strings en todo el frame.
+#
+#   idx = TickerIndex.construir(stocks_filtrados, "Ticker")
+#   idx.filas(stocks_filtrados, "ABCD")     # == stocks_filtrados[stocks_filtrados["Ticker"] == "ABCD"]
+#   idx.conteos().head()                    # filas por ticker
+#
+# El índice guarda posiciones: solo vale para el frame con el que se construyó
+# (en el snapshot ambos son inmutables).
+import numpy as np
+import pandas as pd
+
+
+def _normalizar(tickers) -> pd.Series:
+    return pd.Series(tickers, copy=False).astype("string").str.upper().str.strip()
+
+
+class TickerIndex:
+    """tickers ordenados, permutación orden de las filas y offsets inicio (len = tickers + 1)."""
+
+    def __init__(self, tickers: np.ndarray, orden: np.ndarray, inicio: np.ndarray, filas: int):
+        self.tickers = tickers
+        self.orden = orden
+        self.inicio = inicio
+        self.n_filas = filas
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+    def __contains__(self, ticker) -> bool:
+        return self._codigo(ticker) >= 0
+
+    @classmethod
+    def construir(cls, df: pd.DataFrame, columna: str) -> "TickerIndex":
+        """Índice de df por columna; filas sin ticker no se indexan. Sin la columna, índice vacío."""
+        if df is None or columna not in df.columns:
+            return cls(np.empty(0, dtype=object), np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64), 0)
+        t = _normalizar(df[columna])
+        codigos, tickers = pd.factorize(t, sort=True)  # NaN -> -1
+        codigos = np.asarray(codigos, dtype=np.int64)
+        validas = codigos >= 0
+        orden = np.argsort(codigos, kind="stable")[len(codigos) - validas.sum():]
+        inicio = np.concatenate([[0], np.cumsum(np.bincount(codigos[validas], minlength=len(tickers)))])
+        return cls(np.asarray(tickers, dtype=object), orden, inicio.astype(np.int64), len(df))
+
+    def _codigo(self, ticker) -> int:
+        t = _normalizar([ticker]).iloc[0]
+        if pd.isna(t):
+            return -1
+        i = int(np.searchsorted(self.tickers, t))
+        return i if i < len(self.tickers) and self.tickers[i] == t else -1
+
+    def posiciones(self, ticker) -> np.ndarray:
+        """Posiciones (iloc) de las filas del ticker en el frame indexado; vacío si no está."""
+        i = self._codigo(ticker)
+        if i < 0:
+            return np.empty(0, dtype=np.int64)
+        return self.orden[self.inicio[i]:self.inicio[i + 1]]
+
+    def filas(self, df: pd.DataFrame, ticker) -> pd.DataFrame:
+        """Filas del ticker de df (el mismo frame con el que se construyó el índice)."""
+        if len(df) != self.n_filas:
+            raise ValueError(f"el índice es de un frame de {self.n_filas} filas, no de {len(df)}")
+        return df.iloc[self.posiciones(ticker)]
+
+    def conteos(self) -> pd.Series:
+        """Filas por ticker, de más a menos."""
+        n = pd.Series(np.diff(self.inicio), index=pd.Index(self.tickers, name="ticker"), name="filas")
+        return n.sort_values(ascending=False, kind="stable")